@@ -0,0 +1,84 @@
+# Load test the chatbot game pipeline (GameHoaOpenAIV1.process_action) with many concurrent sessions.
+# Use the mock-v1 endpoint to run at realistic LLM latencies with no network access or api costs.
+#
+#   python load_test.py --endpoint mock-v1 --sessions 20 --turns 10
+import sys
+sys.path.append("src")
+
+import argparse
+import asyncio
+import time
+
+# Load default environment variables (.env)
+from dotenv import load_dotenv
+load_dotenv()
+
+# Init the config
+import config
+config.init_config()
+
+# Register the games available
+import games.hoa as hoa #type: ignore
+hoa.register_engine_hoa()
+hoa.register_chatbot_hoa_openai_v1()
+hoa.register_chatbot_hoa_mock_v1()
+
+from agents.llm_client import LLMClient
+from agents.model_metrics import ModelMetrics
+from engine import Engine, EngineManager
+from filedb import FileDb
+from user import get_user
+
+PLAYER_QUERIES = [ "look around", "search the room", "check my inventory", "What is this place?" ]
+
+parser = argparse.ArgumentParser(description="Chatbot game pipeline load test")
+parser.add_argument("--endpoint", default="mock-v1", help="model endpoint in config.yaml")
+parser.add_argument("--sessions", type=int, default=10)
+parser.add_argument("--turns", type=int, default=10)
+parser.add_argument("--module", default=config.config["default_module_name"])
+parser.add_argument("--party", default=config.config["default_party_name"])
+args = parser.parse_args()
+
+def percentile(values: list[float], pct: float) -> float:
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+async def run_session(engine: Engine, session_idx: int, turn_times: list[float]) -> None:
+    user = await get_user(engine.db, f"loadtest{session_idx}", f"loadtest_{session_idx}")
+    await engine.load_default_party(user)
+    agent = engine.create_chatbot_agent(f"loadtest_{session_idx}", args.endpoint)
+    agent.logging = False
+    game = engine.create_chatbot_game(user, agent,
+                                      start_game_action="new_game",
+                                      module_name=args.module,
+                                      party_name=args.party,
+                                      save_game_name="loadtest")
+    await game.start_game()
+    char_name = game.player_map[user.name][0]
+    for turn in range(args.turns):
+        query = PLAYER_QUERIES[(session_idx + turn) % len(PLAYER_QUERIES)]
+        start_time = time.time()
+        await game.player_action(f"{char_name}: {query}\n\n")
+        turn_times.append(time.time() - start_time)
+
+async def main() -> None:
+    EngineManager.logging = False
+    engine_class = EngineManager.get_engine(config.config["game"])
+    engine: Engine = engine_class(FileDb(), logging=False)
+    engine.set_defaults(config.config["default_party_name"], config.config["default_module_name"])
+    turn_times: list[float] = []
+    start_time = time.time()
+    await asyncio.gather(*[ run_session(engine, idx, turn_times) for idx in range(args.sessions) ])
+    total_time = time.time() - start_time
+    print(f"sessions: {args.sessions} turns: {len(turn_times)} total: {total_time:.2f}s")
+    print(f"turn p50: {percentile(turn_times, 0.5):.2f}s p90: {percentile(turn_times, 0.9):.2f}s " +
+          f"p99: {percentile(turn_times, 0.99):.2f}s max: {max(turn_times, default=0.0):.2f}s")
+    for endpoint, stats in LLMClient.get_all_stats().items():
+        print(f"{endpoint}: {stats}")
+    print(ModelMetrics.dump())
+    await LLMClient.close_all()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -13,6 +13,7 @@ config.init_config()
 import games.hoa as hoa #type: ignore
 hoa.register_engine_hoa()
 hoa.register_chatbot_hoa_openai_v1()
+hoa.register_chatbot_hoa_mock_v1()
 
 # Run the discord bot
 import discord_chatbot as discord_chatbot #type: ignore
@@ -0,0 +1,50 @@
+# Local mock of the OpenAI chat completions api for offline load/latency testing.
+#
+#   python mock_llm_server.py --endpoint mock-v1 --port 8001
+#
+# Then run the bot/web service against it with OPENAI_API_BASE=http://localhost:8001/v1 (any openai_v1
+# endpoint works, the mock config is taken from the given --endpoint entry in config.yaml).
+import sys
+sys.path.append("src")
+
+import argparse
+import json
+
+# Init the config
+import config
+config.init_config()
+
+from agents.mock_llm import MockLLM
+from aiohttp import web
+
+parser = argparse.ArgumentParser(description="Mock OpenAI chat completions server")
+parser.add_argument("--endpoint", default="mock-v1", help="model endpoint in config.yaml with the mock settings")
+parser.add_argument("--host", default="localhost")
+parser.add_argument("--port", type=int, default=8001)
+args = parser.parse_args()
+
+mock_llm = MockLLM(config.config_all["model_endpoints"][args.endpoint].get("mock", {}))
+
+async def chat_completions(request: web.Request) -> web.StreamResponse:
+    body = await request.json()
+    model = body.get("model", "")
+    messages = body.get("messages", [])
+    # Generation limits, as the api applies them
+    limits = { "max_tokens": body.get("max_tokens"), "stop": body.get("stop") }
+    if not body.get("stream", False):
+        completion = await mock_llm.acreate(model=model, messages=messages, **limits)
+        return web.json_response(completion)
+    resp = web.StreamResponse(headers={ "Content-Type": "text/event-stream" })
+    await resp.prepare(request)
+    async for chunk in await mock_llm.acreate(model=model, messages=messages, stream=True, **limits):
+        await resp.write(f"data: {json.dumps(chunk)}\n\n".encode())
+    await resp.write(b"data: [DONE]\n\n")
+    await resp.write_eof()
+    return resp
+
+app = web.Application()
+app.router.add_post("/v1/chat/completions", chat_completions)
+app.router.add_post("/chat/completions", chat_completions)
+
+if __name__ == "__main__":
+    web.run_app(app, host=args.host, port=args.port)
@@ -1,6 +1,10 @@
 from abc import ABC, abstractmethod
 from typing import Any
 
+class StopStream(Exception):
+    """Raised by a streaming chunk handler to stop the stream early (generate() returns what was received)."""
+    pass
+
 class Agent(ABC):
 
     @property
@@ -0,0 +1,45 @@
+import asyncio
+import copy
+import random
+
+from config import config_all
+from typing import Any, Awaitable, Callable
+
+from .model_metrics import ModelMetrics
+
+class ActionRetryPolicy:
+    """
+    Bounded retries for queries where the model must respond with a specific action (e.g. the
+    'call do_action("resume")' when a game or lobby starts). After max_attempts retries the expected action is
+    added to the response locally so the engine runs it anyway. Defaults come from the top level
+    "action_retry" in config.yaml and can be overridden with an "action_retry" section in the model endpoint.
+    """
+
+    def __init__(self, model_endpoint: str) -> None:
+        cfg: dict[str, Any] = copy.deepcopy(config_all.get("action_retry", {}))
+        cfg.update(config_all["model_endpoints"][model_endpoint].get("action_retry", {}))
+        self.max_attempts: int = cfg.get("max_attempts", 2)
+        self.backoff_base: float = cfg.get("backoff_base", 0.25)
+        self.backoff_max: float = cfg.get("backoff_max", 2.0)
+
+    def backoff_delay(self, attempt: int) -> float:
+        # Exponential backoff with full jitter
+        return random.uniform(0.0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @staticmethod
+    def make_fallback(resp: str, expected_action: str) -> str:
+        # Keep the model's text, drop any other actions it tried, and call the expected action
+        lines = [ line for line in resp.split("\n") if "do_action(" not in line and line.strip() != "<HIDDEN>" ]
+        return "\n".join(lines).strip(" \t\n") + "\n\n<HIDDEN>\n" + expected_action
+
+    async def run(self, expected_action: str, resp: str, retry: Callable[[], Awaitable[str]]) -> str:
+        attempt = 0
+        while expected_action not in resp:
+            if attempt >= self.max_attempts:
+                ModelMetrics.record_action_fallback(expected_action)
+                return self.make_fallback(resp, expected_action)
+            await asyncio.sleep(self.backoff_delay(attempt))
+            ModelMetrics.record_action_retry(expected_action)
+            resp = await retry()
+            attempt += 1
+        return resp
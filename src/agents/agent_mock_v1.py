@@ -0,0 +1,12 @@
+from agents.agent_openai_v1_base import AgentOpenAIV1Base, OpenAIModule
+from agents.mock_llm import MockLLM
+
+from config import config_all
+from typing import Any, cast
+
+class MockAgentV1(AgentOpenAIV1Base):
+    """OpenAI v1 agent which talks to an in process MockLLM instead of the openai api."""
+
+    def init_openai(self) -> OpenAIModule:
+        mock_cfg: dict[str, Any] = config_all["model_endpoints"][self.model_endpoint].get("mock", {})
+        return cast(OpenAIModule, MockLLM(mock_cfg))
@@ -1,16 +1,26 @@
+import asyncio
 import copy
 import openai
-import os
-import textwrap
-import tiktoken
 import time
 
 from abc import abstractmethod
-from agent import Agent
+from agent import Agent, StopStream
 from config import AGENT_LOGGING, config_all
-from datetime import datetime
 from typing import Any
 from engine import EngineManager
+from .action_retry_policy import ActionRetryPolicy
+from .generation_limits import GenerationLimits
+from .llm_client import LLMClient
+from .cassette import Cassette
+from .latency_policy import LatencyPolicy, LatencyTracker
+from .message_history import MessageHistory
+from .model_metrics import ModelMetrics
+from .model_router import ModelRouter
+from .prompt_template import PromptTemplate
+from .token_budget import TokenBudget
+from .token_cache import TokenCache
+from .tokenizers import Tokenizers
+from .transcript_logger import TranscriptLogger
 
 RESPONSE_RESERVE=500
 
@@ -31,6 +41,7 @@ class AgentOpenAIV1Base(Agent):
 
     def __init__(self, agent_tag: str, model_endpoint: str) -> None:
         self._agent_tag = agent_tag
+        self.model_endpoint = model_endpoint
         self.use_async = True
         self.include_model_in_call = True
         endpoint_cfg: dict[str, Any] = config_all["model_endpoints"][model_endpoint]
@@ -39,14 +50,14 @@ class AgentOpenAIV1Base(Agent):
         # Primary model
         self.primary_model_config: dict[str, Any] = copy.deepcopy(config_all["model_info"].get(self._primary_model_id, {}))
         self.primary_model_config.update(endpoint_cfg["primary"])
-        self.primary_token_enc = tiktoken.encoding_for_model(self.primary_model_config.get("tokenizer_model", "gpt-4"))
+        self.primary_token_enc = Tokenizers.get(self.primary_model_config.get("tokenizer_model", "gpt-4"))
         self.primary_model_state = ModelState()
         # Secondary model
         self.secondary_model_config: dict[str, Any]
         if self._secondary_model_id is not None and self._secondary_model_id != self._primary_model_id:
             self.secondary_model_config: dict[str, Any] = copy.deepcopy(config_all["model_info"].get(self._secondary_model_id, {}))
             self.secondary_model_config.update(endpoint_cfg["secondary"])
-            self.secondary_token_enc = tiktoken.encoding_for_model(self.secondary_model_config.get("tokenizer_model", "gpt-4"))
+            self.secondary_token_enc = Tokenizers.get(self.secondary_model_config.get("tokenizer_model", "gpt-4"))
         else:
             self._secondary_model_id = self._primary_model_id
             self.secondary_model_config = self.primary_model_config
@@ -54,8 +65,17 @@ class AgentOpenAIV1Base(Agent):
         self.secondary_model_state = ModelState()
         # Other
         self.openai: OpenAIModule = self.init_openai()
+        self.client: LLMClient = LLMClient.get_client(model_endpoint)
+        self.cassette: Cassette | None = Cassette.get_cassette()
+        self.latency_policy = LatencyPolicy(model_endpoint)
+        self.token_budget = TokenBudget(model_endpoint)
+        self.model_router = ModelRouter(model_endpoint)
+        self.action_retry_policy = ActionRetryPolicy(model_endpoint)
+        self.generation_limits = GenerationLimits(model_endpoint)
+        # Unpinned history tokens at which drivers fold old turns into a summary (0 is off)
+        self.compact_history_tokens: int = endpoint_cfg.get("compact_history_tokens", 0)
         self.logging = AGENT_LOGGING
-        self.log_file_name = f"logs/log_{self._agent_tag}_" + datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + ".txt"
+        self.transcript_logger = TranscriptLogger.get_logger()
 
     @abstractmethod
     def init_openai() -> OpenAIModule:
@@ -77,6 +97,34 @@ class AgentOpenAIV1Base(Agent):
     def secondary_model_id(self) -> str:
         return self._secondary_model_id
 
+    @property
+    def max_context_tokens(self) -> int:
+        # Largest context of either model. History past this can never be sent.
+        return max(self.primary_model_config.get("max_tokens", 2048),
+                   self.secondary_model_config.get("max_tokens", 2048))
+
+    def route_model(self, primary: bool, **features: Any) -> bool:
+        # Returns the primary flag to use for a query with these features (see ModelRouter)
+        return self.model_router.route(self.primary_model_config, self.secondary_model_config, primary, features)
+
+    def min_prompt_tokens(self,
+                          prefix: list[dict[str, Any]],
+                          history: MessageHistory,
+                          instr: list[dict[str, Any]]) -> int:
+        # Smallest prompt plan_messages() can send for these parts (for routing)
+        return self.token_budget.min_tokens(prefix, history, instr)
+
+    def plan_messages(self,
+                      prefix: list[dict[str, Any]],
+                      history: MessageHistory,
+                      instr: list[dict[str, Any]],
+                      primary: bool = True) -> list[dict[str, Any]]:
+        # Picks the history to send within the token budget for the model generate() will use
+        if self.primary_model_config == self.secondary_model_config:
+            primary = True
+        model_config = self.primary_model_config if primary else self.secondary_model_config
+        return self.token_budget.plan(model_config.get("max_tokens", 2048), prefix, history, instr)
+
     def make_prefix(self, messages: list[str]) -> list[dict]:
         out_prefix = []
         for msg_index, msg in enumerate(messages):
@@ -86,15 +134,33 @@ class AgentOpenAIV1Base(Agent):
 
     def make_message(self, role: str, content: str, source: str, keep: bool = False, primary: bool = False) -> dict[str, Any]:
         token_enc = self.primary_token_enc if primary else self.secondary_token_enc
-        tokens = len(token_enc.encode(content))
+        tokens = TokenCache.count_tokens(token_enc, content)
+        return { "role": role, "content": content, "source": source, "tokens": tokens, "keep": keep }
+
+    async def make_message_async(self, role: str, content: str, source: str, keep: bool = False, primary: bool = False) -> dict[str, Any]:
+        # Same as make_message(), but very large contents are tokenized off the event loop
+        token_enc = self.primary_token_enc if primary else self.secondary_token_enc
+        tokens = await Tokenizers.count_tokens(token_enc, content)
         return { "role": role, "content": content, "source": source, "tokens": tokens, "keep": keep }
 
-    def make_prompt(self, prompt_template, args: dict[str, Any]|None=None) -> str:
-        exp_prompt = prompt_template
-        if args is not None:
-            for key, value in args.items():
-                exp_prompt = exp_prompt.replace("{" + key + "}", value)
-        return exp_prompt
+    def make_prompt(self, prompt_template: str|PromptTemplate, args: dict[str, Any]|None=None) -> str:
+        if isinstance(prompt_template, str):
+            prompt_template = PromptTemplate.get(prompt_template)
+        return prompt_template.render(args)
+
+    def make_prompt_message(self, 
+                            prompt_template: str|PromptTemplate, 
+                            args: dict[str, Any], 
+                            role: str, 
+                            source: str, 
+                            keep: bool = False, 
+                            primary: bool = False) -> dict[str, Any]:
+        # Same as make_message(make_prompt()), but the size comes from the template's token counts
+        if isinstance(prompt_template, str):
+            prompt_template = PromptTemplate.get(prompt_template)
+        token_enc = self.primary_token_enc if primary else self.secondary_token_enc
+        tokens = prompt_template.count_tokens(token_enc, args)
+        return { "role": role, "content": prompt_template.render(args), "source": source, "tokens": tokens, "keep": keep }
 
     def remove_hidden(self, text: str) -> str:
         lines = text.split("\n")
@@ -109,27 +175,38 @@ class AgentOpenAIV1Base(Agent):
         else:
             return "\n".join(lines[:last]).strip(" \n\t")
         
-    async def chunk_acreate(self, model, messages, temperature=1.0, chunk_handler=None) -> dict[str, Any]:
-        # send a ChatCompletion request
-        response: Any = await self.openai.ChatCompletion.acreate(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            stream=True  # using stream=True
-        )
-
+    async def chunk_acreate(self, model, messages, temperature=1.0, chunk_handler=None, gen_args=None) -> dict[str, Any]:
+        gen_args = gen_args or {}
         # create variables to collect the stream of chunks
         collected_chunks = []
         collected_messages = []
 
-        # iterate through the stream of events
-        async for chunk in response:
-            collected_chunks.append(chunk)  # save the event response
-            chunk_message = chunk['choices'][0]['delta']  # extract the message
-            collected_messages.append(chunk_message)  # save the message
-
-            if chunk_handler:
-                await chunk_handler(chunk_message.get('content', ''), time.time())  # process the chunk
+        # hold the endpoint slot until the whole stream has been read
+        async with self.client.slot():
+            # send a ChatCompletion request
+            response: Any = await self.openai.ChatCompletion.acreate(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                stream=True,  # using stream=True
+                **gen_args
+            )
+
+            # iterate through the stream of events
+            async for chunk in response:
+                collected_chunks.append(chunk)  # save the event response
+                chunk_message = chunk['choices'][0]['delta']  # extract the message
+                collected_messages.append(chunk_message)  # save the message
+
+                if chunk_handler:
+                    try:
+                        await chunk_handler(chunk_message.get('content', ''), time.time())  # process the chunk
+                    except StopStream:
+                        # Handler has all it needs, close the stream so we stop paying for tokens
+                        aclose = getattr(response, "aclose", None)
+                        if aclose is not None:
+                            await aclose()
+                        break
 
         # combine the messages to form the full response
         full_reply_content = ''.join([m.get('content', '') for m in collected_messages])
@@ -139,11 +216,149 @@ class AgentOpenAIV1Base(Agent):
             "individual_chunks": collected_chunks
         }
 
+    async def call_model_once(self, model: str, temp: float, send_messages: list[dict[str, str]], chunk_handler: Any = None,
+                              gen_args: dict[str, Any] | None = None) -> str:
+        gen_args = gen_args or {}
+        if self.use_async:
+            if not chunk_handler:
+                async with self.client.slot():
+                    completion: Any = await self.openai.ChatCompletion.acreate(
+                        model=model,
+                        temperature=temp,
+                        messages=send_messages,
+                        **gen_args
+                    )
+                return completion.choices[0].message["content"]
+            else:
+                completion_pair: Any = await self.chunk_acreate(
+                    model=model,
+                    temperature=temp,
+                    messages=send_messages,
+                    chunk_handler=chunk_handler,
+                    gen_args=gen_args
+                )
+                return completion_pair["full_reply_content"]
+        else:
+            # Ignore streaming handler
+            completion: Any = self.openai.ChatCompletion.create(
+                temperature=temp,
+                messages=send_messages,
+                **gen_args
+            )
+            return completion["choices"][0]["message"]["content"]
+
+    async def call_model(self, 
+                         model_config: dict[str, Any], 
+                         send_messages: list[dict[str, str]], 
+                         chunk_handler: Any = None, 
+                         site: str = "",
+                         gen_args: dict[str, Any] | None = None) -> str:
+        if self.include_model_in_call:
+            model = model_config.get("model", "gpt-3.5-turbo")
+        else:
+            model = ""
+        temp = model_config.get("temperature", 0.3)
+        tracker = LatencyTracker.get_tracker(model_config.get("model", ""))
+        first_chunk_tracker = LatencyTracker.get_tracker(model_config.get("model", ""), first_chunk=True)
+
+        # A stream is retried until its first chunk arrives. After that the handler has acted on what was
+        # sent, so a failed stream returns the part that was streamed.
+        streamed_content: list[str] = []
+        first_chunk_time: float | None = None
+        async def retry_chunk_handler(content: str, chunk_time: float) -> None:
+            nonlocal first_chunk_time
+            if first_chunk_time is None:
+                first_chunk_time = chunk_time
+                first_chunk_tracker.record(chunk_time - start_time)
+            streamed_content.append(content)
+            await chunk_handler(content, chunk_time)
+
+        attempt = 0
+        while True:
+            start_time = time.time()
+            try:
+                response = await self.call_model_once(model, temp, send_messages, 
+                                                      retry_chunk_handler if chunk_handler else None, gen_args)
+                latency = time.time() - start_time
+                tracker.record(latency)
+                ModelMetrics.record_call(model_config.get("model", ""), site, latency, 
+                                         (first_chunk_time - start_time if first_chunk_time is not None else None))
+                return response
+            except Exception as error:
+                print(error)
+                ModelMetrics.record_error(model_config.get("model", ""), site)
+                if first_chunk_time is not None:
+                    return "".join(streamed_content)
+                if attempt >= self.latency_policy.max_retries or not LatencyPolicy.is_retryable(error):
+                    return ""
+                await asyncio.sleep(self.latency_policy.backoff_delay(attempt))
+                self.latency_policy.retries += 1
+                attempt += 1
+
+    async def hedged_call_model(self, model_config: dict[str, Any], send_messages: list[dict[str, str]], size: int,
+                                chunk_handler: Any = None, site: str = "", gen_args: dict[str, Any] | None = None) -> str:
+        # Send a second request once the first is slower than the model's usual tail latency. First good answer wins.
+        # A stream is hedged until its first chunk arrives - the call that streams first gets the handler and
+        # the other is cancelled.
+        delay = self.latency_policy.hedge_delay(model_config.get("model", ""), first_chunk=chunk_handler is not None)
+        hedge_config = model_config
+        if self.latency_policy.hedge_to == "secondary" and \
+                size + RESPONSE_RESERVE <= self.secondary_model_config.get("max_tokens", 2048):
+            hedge_config = self.secondary_model_config
+
+        calls: list[asyncio.Task[str]] = []
+        streaming: asyncio.Task | None = None
+        stream_started = asyncio.Event()
+        async def hedge_chunk_handler(content: str, chunk_time: float) -> None:
+            nonlocal streaming
+            task = asyncio.current_task()
+            if streaming is None:
+                streaming = task
+                stream_started.set()
+                for call in calls:
+                    if call is not task:
+                        call.cancel()
+            if task is not streaming:
+                raise StopStream()
+            await chunk_handler(content, chunk_time)
+        call_handler = (hedge_chunk_handler if chunk_handler else None)
+
+        first_task = asyncio.create_task(self.call_model(model_config, send_messages, call_handler, site, gen_args))
+        calls.append(first_task)
+        started_task = asyncio.create_task(stream_started.wait())
+        try:
+            done, _ = await asyncio.wait([ first_task, started_task ], timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            started_task.cancel()
+        if streaming is not None or (first_task in done and first_task.result()):
+            return await first_task
+        self.latency_policy.hedges += 1
+        hedge_task = asyncio.create_task(self.call_model(hedge_config, send_messages, call_handler, site, gen_args))
+        calls.append(hedge_task)
+        pending = { first_task, hedge_task } - done
+        response = (first_task.result() if first_task in done else "")
+        try:
+            while pending and not response:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.result():
+                        response = task.result()
+                        if task is hedge_task:
+                            self.latency_policy.hedge_wins += 1
+                        break
+        finally:
+            for task in pending:
+                task.cancel()
+        return response
+
     async def generate(self, 
                        messages: list[dict], 
                        primary: bool = True, 
                        maxlen: int = -1, 
-                       chunk_handler: Any = None) -> str:
+                       chunk_handler: Any = None,
+                       site: str = "",
+                       mode: str = "",
+                       max_paras: int = 0) -> str:
 
         # If both models are the same, we're using primary
         if self.primary_model_config == self.secondary_model_config:
@@ -165,87 +380,73 @@ class AgentOpenAIV1Base(Agent):
             print("\n----------------------------------------------  QUERY  -------------------------------------------------------\n\n" +
                   f"{query}\n")
         
-        size = 0
-        for msg in messages:
-            size += msg["tokens"]
+        # Messages are already planned to fit (see plan_messages()), only a smaller maxlen needs them trimmed
+        size = sum([ msg["tokens"] for msg in messages ])
+        if size > maxlen:
+            # Drops oldest non "keep" messages first
+            history = MessageHistory(messages)
+            history.trim(maxlen)
+            messages = history.to_list()
+            size = history.tokens
 
-        # shallow copy so we can modify this list
-        messages = messages.copy()
-
-        # Make sure message fits in max context size
-        while size > maxlen:
-            for idx, msg in enumerate(messages):
-                if not msg["keep"]:
-                    size -= msg["tokens"]
-                    del messages[idx]
-                    break
-
-        send_messages = []
-        for msg in messages:
-            send_messages.append({ "role": msg["role"], "content": msg["content"] })
+        send_messages = [ { "role": msg["role"], "content": msg["content"] } for msg in messages ]
 
         model_state.prompt_tokens += size
 
+        # Generation budget and stop sequences for the mode (see GenerationLimits)
+        gen_args = self.generation_limits.get_args(mode, max_paras)
+        if "max_tokens" in gen_args:
+            gen_args["max_tokens"] = max(1, min(gen_args["max_tokens"], max_tokens - size))
+
         if self.include_model_in_call:
             model = model_config.get("model", "gpt-3.5-turbo")
         else:
             model = ""
         temp = model_config.get("temperature", 0.3)
 
-        try:
-            if self.use_async:
-                if not chunk_handler:
-                    completion: Any = await self.openai.ChatCompletion.acreate(
-                        model=model,
-                        temperature=temp,
-                        messages=send_messages
-                    )
-                    response = completion.choices[0].message["content"]
-                else:
-                    completion_pair: Any = await self.chunk_acreate(
-                        model=model,
-                        temperature=temp,
-                        messages=send_messages,
-                        chunk_handler=chunk_handler
-                    )
-                    response = completion_pair["full_reply_content"]
+        if self.cassette is not None and self.cassette.replaying:
+            response = self.cassette.replay(self.agent_tag, model_config.get("model", ""), temp, send_messages)
+            if chunk_handler:
+                try:
+                    await chunk_handler(response, time.time())
+                except StopStream:
+                    pass
+        else:
+            if self.latency_policy.hedge:
+                response = await self.hedged_call_model(model_config, send_messages, size, chunk_handler, site, gen_args)
             else:
-                # Ignore streaming handler
-                completion: Any = self.openai.ChatCompletion.create(
-                    temperature=temp,
-                    messages=send_messages
-                )
-                response = completion["choices"][0]["message"]["content"]
-        except Exception as error:
-            print(error)
-            response = ""
+                response = await self.call_model(model_config, send_messages, chunk_handler, site, gen_args)
+            if self.cassette is not None and self.cassette.recording and response:
+                self.cassette.record(self.agent_tag, model_config.get("model", ""), temp, send_messages, response)
 
-        resp_size = len(token_enc.encode(response))
+        # Cached, as the driver will call make_message() on this same response
+        resp_size = await Tokenizers.count_tokens(token_enc, response)
+        if "max_tokens" in gen_args and resp_size >= gen_args["max_tokens"]:
+            # Cut off by the budget (still paid for, so resp_size stays as is)
+            response = self.generation_limits.trim_truncated(response)
 
         model_state.gen_tokens += resp_size
+        ModelMetrics.record_tokens(model_config, site, size, resp_size)
 
         prompt_tokens = model_state.prompt_tokens
         prompt_cost = prompt_tokens * model_config.get("prompt_cost", 0.0) * 0.001
         gen_tokens = model_state.gen_tokens
         gen_cost = gen_tokens * model_config.get("gen_cost", 0.0) * 0.001
 
+        client_stats = self.client.stats
+
         if self.logging:
             print("\n---------------------------------------------  RESPONSE  -----------------------------------------------------\n\n" +\
                   f"{response}\n\n" + \
-                  f"    {model} - new_tokens: {size+resp_size} prompt_tokens: {prompt_tokens} prompt_cost: {prompt_cost:.2f} gen_tokens: {gen_tokens} gen_cost: {gen_cost:.2f}\n")
+                  f"    {model} - new_tokens: {size+resp_size} prompt_tokens: {prompt_tokens} prompt_cost: {prompt_cost:.2f} gen_tokens: {gen_tokens} gen_cost: {gen_cost:.2f}\n" + \
+                  f"    {self.client.model_endpoint} - in_flight: {client_stats.in_flight} queue_depth: {client_stats.queue_depth} max_queue_depth: {client_stats.max_queue_depth}\n")
             print("\n--------------------------------------------------------------------------------------------------------------\n\n")
 
-        # Write out log
-        if not os.path.exists("logs"):
-            os.makedirs("logs")
-        with open(self.log_file_name, "a") as f:
-            indent_query = textwrap.indent(query, prefix="    ")
-            resp_lines = str.splitlines(response)
-            indent_response = ""
-            for line in resp_lines:
-                indent_response += textwrap.fill(line, width=100) + "\n"
-            indent_response = textwrap.indent(indent_response, prefix="    ")
-            f.write(f"USER:\n\n{indent_query}\n\nASSISTANT:\n\n{indent_response}\n\n")
+        # Write out log (queued, written in the background)
+        self.transcript_logger.log(self.agent_tag, query, response,
+                                   model=model_config.get("model", ""),
+                                   prompt_tokens=size,
+                                   gen_tokens=resp_size)
 
         return response
 
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+
+from config import LLM_CASSETTE_MODE, LLM_CASSETTE_PATH
+from typing import Any
+
+class Cassette:
+    """
+    Records LLM requests and responses to a JSONL file, or replays them with no network access.
+
+    Each distinct message content is written once as a "content" line keyed by its hash, and each call is a
+    "call" line with the model, temperature, list of message hashes and the response. On replay a call is
+    matched on (model, temperature, normalized messages). Identical calls are served in recorded order, and
+    a call with no match falls back to the next unplayed call recorded for the same agent tag.
+    """
+
+    cassette: "Cassette | None" = None
+
+    def __init__(self, path: str, mode: str) -> None:
+        assert mode in [ "record", "replay" ]
+        self.path = path
+        self.mode = mode
+        self.contents: set[str] = set()
+        self.calls: list[dict[str, Any]] = []
+        self.calls_by_key: dict[str, list[dict[str, Any]]] = {}
+        self.hits = 0
+        self.misses = 0
+        if mode == "replay":
+            self.load()
+        elif os.path.exists(path):
+            # Appending to an existing cassette, don't rewrite contents it already has
+            with open(path, "r") as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record["type"] == "content":
+                        self.contents.add(record["hash"])
+        else:
+            dir_name = os.path.dirname(path)
+            if dir_name and not os.path.exists(dir_name):
+                os.makedirs(dir_name)
+
+    @staticmethod
+    def get_cassette() -> "Cassette | None":
+        # The shared process cassette (set with the LLM_CASSETTE_MODE and LLM_CASSETTE_PATH env vars)
+        if Cassette.cassette is None and LLM_CASSETTE_MODE:
+            Cassette.cassette = Cassette(LLM_CASSETTE_PATH, LLM_CASSETTE_MODE)
+        return Cassette.cassette
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @staticmethod
+    def hash_content(role: str, content: str) -> str:
+        return hashlib.sha1(f"{role}\n{content.strip()}".encode()).hexdigest()[:16]
+
+    @staticmethod
+    def make_key(model: str, temperature: float, msg_hashes: list[str]) -> str:
+        return hashlib.sha1(json.dumps([ model, temperature, msg_hashes ]).encode()).hexdigest()
+
+    def load(self) -> None:
+        with open(self.path, "r") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["type"] != "call":
+                    continue
+                record["played"] = False
+                record["key"] = self.make_key(record["model"], record["temperature"], record["messages"])
+                self.calls.append(record)
+                self.calls_by_key.setdefault(record["key"], []).append(record)
+
+    def record(self, agent_tag: str, model: str, temperature: float, messages: list[dict[str, Any]], response: str) -> None:
+        lines: list[str] = []
+        msg_hashes: list[str] = []
+        for msg in messages:
+            msg_hash = self.hash_content(msg["role"], msg["content"])
+            msg_hashes.append(msg_hash)
+            if msg_hash not in self.contents:
+                self.contents.add(msg_hash)
+                lines.append(json.dumps({ "type": "content", "hash": msg_hash, "role": msg["role"], "content": msg["content"] }))
+        lines.append(json.dumps({ "type": "call", "agent_tag": agent_tag, "model": model, "temperature": temperature,
+                                  "messages": msg_hashes, "response": response }))
+        with open(self.path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def replay(self, agent_tag: str, model: str, temperature: float, messages: list[dict[str, Any]]) -> str:
+        msg_hashes = [ self.hash_content(msg["role"], msg["content"]) for msg in messages ]
+        key = self.make_key(model, temperature, msg_hashes)
+        matches = self.calls_by_key.get(key, [])
+        for call in matches:
+            if not call["played"]:
+                call["played"] = True
+                self.hits += 1
+                return call["response"]
+        if len(matches) > 0:
+            # All identical calls played already, reuse the last one
+            self.hits += 1
+            return matches[-1]["response"]
+        # Engine output changed since recording, fall back to the recorded call order for this agent
+        self.misses += 1
+        for call in self.calls:
+            if not call["played"] and call["agent_tag"] == agent_tag:
+                call["played"] = True
+                return call["response"]
+        return ""
@@ -0,0 +1,58 @@
+import copy
+import re
+
+from config import config_all
+from typing import Any
+
+class GenerationLimits:
+    """
+    Per mode generation budgets (max_tokens) and stop sequences, passed to the model so we don't generate
+    (and pay for) text we'd throw away. Modes are "actioner", "engine_response", "referee_response",
+    "dialog_choices", "lobby", "summary", and "system_action"/"lobby_system_action" for game/lobby queries
+    that must call an expected action.
+    Narrative responses limited to a number of paragraphs (a location's response_max_para) get a budget of
+    tokens_per_para per paragraph. There's no stop at the paragraph limit, as referee calls can follow the
+    narration with do_action() calls - the driver trims extra paragraphs after generating.
+
+    Defaults come from the top level "generation_limits" in config.yaml and can be overridden with a
+    "generation_limits" section in the model endpoint.
+    """
+
+    def __init__(self, model_endpoint: str) -> None:
+        cfg: dict[str, Any] = copy.deepcopy(config_all.get("generation_limits", {}))
+        cfg.update(config_all["model_endpoints"][model_endpoint].get("generation_limits", {}))
+        self.enabled: bool = cfg.get("enabled", False)
+        self.tokens_per_para: int = cfg.get("tokens_per_para", 120)
+        self.modes: dict[str, dict[str, Any]] = cfg.get("modes", {})
+        # Stats
+        self.truncated = 0
+
+    def get_args(self, mode: str, max_paras: int = 0) -> dict[str, Any]:
+        # Extra args for the completion call
+        if not self.enabled:
+            return {}
+        mode_cfg = self.modes.get(mode, {})
+        args: dict[str, Any] = {}
+        max_tokens: int = mode_cfg.get("max_tokens", 0)
+        if max_paras > 0:
+            para_tokens = max_paras * self.tokens_per_para
+            max_tokens = (min(max_tokens, para_tokens) if max_tokens > 0 else para_tokens)
+        if max_tokens > 0:
+            args["max_tokens"] = max_tokens
+        stop: list[str] = list(mode_cfg.get("stop", []))
+        if stop:
+            args["stop"] = stop[:4] # Most the api accepts
+        return args
+
+    def trim_truncated(self, text: str) -> str:
+        # A response cut off by max_tokens ends mid line. Drop a partial action call, otherwise end on the
+        # last complete sentence.
+        self.truncated += 1
+        lines = text.rstrip(" \t").split("\n")
+        last = lines[-1]
+        if "do_action(" in last:
+            lines = lines[:-1]
+        else:
+            ends = [ match.end() for match in re.finditer(r"[.!?][\"')\]]*(?=\s|$)", last) ]
+            lines[-1] = (last[:ends[-1]] if ends else "")
+        return "\n".join(lines).strip(" \t\n")
@@ -0,0 +1,61 @@
+import asyncio
+import traceback
+
+from agents.agent_openai_v1_base import AgentOpenAIV1Base
+from agents.message_history import MessageHistory
+from agents.prompt_template import PromptTemplate
+from config import ERROR_LOGGING
+from typing import Any
+
+class HistoryCompactor:
+    """
+    Folds the oldest turns of a conversation into a single pinned summary message once the history passes
+    a token threshold. Summaries are generated with the secondary model in a background task so a player turn
+    never waits on them.
+    """
+
+    def __init__(self, agent: AgentOpenAIV1Base, summarize_prompt: str) -> None:
+        self.agent = agent
+        self.summarize_template = PromptTemplate.get(summarize_prompt)
+        self.max_tokens = agent.compact_history_tokens
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_compacting(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def check(self, history: MessageHistory, histories: list[MessageHistory]) -> None:
+        # Compacts history (and folds the same turns out of the other histories) if it's too big.
+        if self.max_tokens <= 0 or self.is_compacting:
+            return
+        if history.unpinned_tokens <= self.max_tokens:
+            return
+        # Keep the most recent half of the threshold as is, summarize the rest
+        msgs = history.oldest_unpinned(history.unpinned_tokens - self.max_tokens // 2)
+        if len(msgs) == 0:
+            return
+        self._task = asyncio.create_task(self.compact(msgs, history.summary, histories))
+
+    async def compact(self,
+                      msgs: list[dict[str, Any]],
+                      prev_summary: dict[str, Any] | None,
+                      histories: list[MessageHistory]) -> None:
+        try:
+            history_text = ""
+            for msg in msgs:
+                speaker = ("REFEREE" if msg["role"] == "assistant" else "PLAYER")
+                history_text += f"{speaker}: {self.agent.remove_hidden(msg['content']) or msg['content']}\n\n"
+            summary_text = (prev_summary["content"] if prev_summary is not None else "None")
+            prompt_msg = self.agent.make_prompt_message(self.summarize_template, 
+                                                        { "summary": summary_text, "history": history_text.strip() },
+                                                        "user", "system", keep=False)
+            resp = await self.agent.generate([ prompt_msg ], primary=False, site="summary", mode="summary")
+            if not resp:
+                return
+            summary_msg = self.agent.make_message("assistant", "STORY SO FAR:\n\n" + resp.strip(" \t\n"), "referee", keep=True)
+            summary_msg["summary"] = True
+            for history in histories:
+                history.fold(msgs[-1], summary_msg)
+        except Exception:
+            if ERROR_LOGGING:
+                print(traceback.format_exc())
@@ -0,0 +1,79 @@
+import asyncio
+import copy
+import openai
+import random
+
+from collections import deque
+from config import config_all
+from typing import Any
+
+class LatencyTracker:
+    """
+    Rolling window of successful call latencies for a model (shared by all agents in the process). Streamed
+    calls also track the time to their first chunk.
+    """
+
+    trackers: dict[tuple[str, bool], "LatencyTracker"] = {}
+
+    def __init__(self, window: int = 200) -> None:
+        self.samples: deque[float] = deque(maxlen=window)
+
+    @staticmethod
+    def get_tracker(model_id: str, first_chunk: bool = False) -> "LatencyTracker":
+        tracker = LatencyTracker.trackers.get((model_id, first_chunk))
+        if tracker is None:
+            tracker = LatencyTracker()
+            LatencyTracker.trackers[(model_id, first_chunk)] = tracker
+        return tracker
+
+    def record(self, secs: float) -> None:
+        self.samples.append(secs)
+
+    def percentile(self, pct: float) -> float:
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(len(samples) * pct))]
+
+class LatencyPolicy:
+    """
+    Retry and hedging settings for a model endpoint. Defaults come from the top level "latency_policy" in
+    config.yaml and can be overridden with a "latency_policy" section in the model endpoint.
+    """
+
+    def __init__(self, model_endpoint: str) -> None:
+        cfg: dict[str, Any] = copy.deepcopy(config_all.get("latency_policy", {}))
+        cfg.update(config_all["model_endpoints"][model_endpoint].get("latency_policy", {}))
+        # Hedging - send a second request if the first hasn't returned by the deadline
+        self.hedge: bool = cfg.get("hedge", False)
+        self.hedge_to: str = cfg.get("hedge_to", "secondary")
+        self.hedge_percentile: float = cfg.get("hedge_percentile", 0.95)
+        self.hedge_min_delay: float = cfg.get("hedge_min_delay", 2.0)
+        self.hedge_default_delay: float = cfg.get("hedge_default_delay", 15.0)
+        self.hedge_min_samples: int = cfg.get("hedge_min_samples", 20)
+        # Retries
+        self.max_retries: int = cfg.get("max_retries", 2)
+        self.backoff_base: float = cfg.get("backoff_base", 0.5)
+        self.backoff_max: float = cfg.get("backoff_max", 8.0)
+        # Stats
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self, model_id: str, first_chunk: bool = False) -> float:
+        # Streams are hedged until their first chunk arrives, so their deadline comes from the first chunk times
+        tracker = LatencyTracker.get_tracker(model_id, first_chunk)
+        if len(tracker.samples) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, tracker.percentile(self.hedge_percentile))
+
+    def backoff_delay(self, attempt: int) -> float:
+        # Exponential backoff with full jitter
+        return random.uniform(0.0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        return isinstance(error, (asyncio.TimeoutError,
+                                  openai.error.RateLimitError,
+                                  openai.error.APIError,
+                                  openai.error.APIConnectionError,
+                                  openai.error.Timeout,
+                                  openai.error.ServiceUnavailableError))
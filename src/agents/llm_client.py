@@ -0,0 +1,162 @@
+import aiohttp
+import asyncio
+import openai
+import time
+
+from config import config_all
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_KEEPALIVE_TIMEOUT = 60.0
+DEFAULT_REQUEST_TIMEOUT = 120.0
+
+class LLMClientStats:
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        avg_wait_time = (self.total_wait_time / self.requests if self.requests > 0 else 0.0)
+        return { "requests": self.requests,
+                 "errors": self.errors,
+                 "in_flight": self.in_flight,
+                 "queue_depth": self.queue_depth,
+                 "max_queue_depth": self.max_queue_depth,
+                 "avg_wait_time": avg_wait_time,
+                 "max_wait_time": self.max_wait_time }
+
+class LLMClient:
+    """
+    Shared client for a single "model_endpoints" entry in config.yaml. All agents using the endpoint
+    share one keep-alive HTTP session and a semaphore which caps the number of requests in flight.
+    Requests over the cap wait in the semaphore's queue.
+
+    Sessions and semaphores only work on the event loop they were created on, and the web service runs
+    each request on its own loop, so they're kept per running loop (the cap applies per loop). Code that
+    runs a loop per request calls close_loop_sessions() before the loop finishes, and close_all() on
+    shutdown.
+    """
+
+    clients: dict[str, "LLMClient"] = {}
+
+    def __init__(self, model_endpoint: str) -> None:
+        endpoint_cfg: dict[str, Any] = config_all["model_endpoints"][model_endpoint]
+        self.model_endpoint = model_endpoint
+        self.max_concurrency: int = endpoint_cfg.get("max_concurrency", DEFAULT_MAX_CONCURRENCY)
+        self.keepalive_timeout: float = endpoint_cfg.get("keepalive_timeout", DEFAULT_KEEPALIVE_TIMEOUT)
+        self.request_timeout: float = endpoint_cfg.get("request_timeout", DEFAULT_REQUEST_TIMEOUT)
+        self.stats = LLMClientStats()
+        self._semaphores: dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+        self._sessions: dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+    @staticmethod
+    def get_client(model_endpoint: str) -> "LLMClient":
+        client = LLMClient.clients.get(model_endpoint)
+        if client is None:
+            client = LLMClient(model_endpoint)
+            LLMClient.clients[model_endpoint] = client
+        return client
+
+    @staticmethod
+    def get_all_stats() -> dict[str, dict[str, Any]]:
+        return { name: client.stats.to_dict() for name, client in LLMClient.clients.items() }
+
+    @staticmethod
+    async def close_all() -> None:
+        for client in LLMClient.clients.values():
+            await client.close()
+
+    @staticmethod
+    async def close_loop_sessions() -> None:
+        # Closes every endpoint's session on the running loop
+        for client in LLMClient.clients.values():
+            await client.close_loop_session()
+
+    def drop_closed_loops(self) -> None:
+        # Sessions should be closed before their loop finishes (see close_loop_sessions()), a closed loop's
+        # session can't be closed any more
+        for loop in [ loop for loop in self._sessions if loop.is_closed() ]:
+            del self._sessions[loop]
+        for loop in [ loop for loop in self._semaphores if loop.is_closed() ]:
+            del self._semaphores[loop]
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # Sessions must be created on the running event loop, so we create them lazily for each loop.
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            self.drop_closed_loops()
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency,
+                                             keepalive_timeout=self.keepalive_timeout)
+            session = aiohttp.ClientSession(connector=connector,
+                                            timeout=aiohttp.ClientTimeout(total=self.request_timeout))
+            self._sessions[loop] = session
+        return session
+
+    def get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            self.drop_closed_loops()
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def close_loop_session(self) -> None:
+        loop = asyncio.get_running_loop()
+        session = self._sessions.pop(loop, None)
+        self._semaphores.pop(loop, None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    async def close(self) -> None:
+        # Sessions on other loops that are still open are closed on their own loop
+        cur_loop = asyncio.get_running_loop()
+        for loop, session in list(self._sessions.items()):
+            if session.closed or loop.is_closed():
+                continue
+            if loop is cur_loop:
+                await session.close()
+            else:
+                asyncio.run_coroutine_threadsafe(session.close(), loop)
+        self._sessions = {}
+        self._semaphores = {}
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Waits for a free request slot for this endpoint and routes openai requests made inside the
+        block through the endpoint's pooled session. Streaming requests should consume the whole stream
+        inside the block so the slot is held until the response is done.
+        """
+        semaphore = self.get_semaphore()
+        stats = self.stats
+        stats.queue_depth += 1
+        stats.max_queue_depth = max(stats.max_queue_depth, stats.queue_depth)
+        wait_start = time.time()
+        try:
+            await semaphore.acquire()
+        finally:
+            stats.queue_depth -= 1
+        wait_time = time.time() - wait_start
+        stats.total_wait_time += wait_time
+        stats.max_wait_time = max(stats.max_wait_time, wait_time)
+        stats.requests += 1
+        stats.in_flight += 1
+        session_token = openai.aiosession.set(self.get_session())
+        try:
+            yield
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            openai.aiosession.reset(session_token)
+            stats.in_flight -= 1
+            semaphore.release()
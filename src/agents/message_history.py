@@ -0,0 +1,126 @@
+import bisect
+
+from collections import deque
+from typing import Any, Iterator
+
+class MessageHistory:
+    """
+    Ordered message list which keeps a running token total. Messages marked "keep" are pinned, all other
+    messages can be evicted oldest first in O(1). If max_tokens is set, the history trims itself on append.
+    """
+
+    def __init__(self, messages: list[dict[str, Any]] | None = None, max_tokens: int = -1) -> None:
+        self.max_tokens = max_tokens
+        self._seq = 0
+        self._pinned: list[tuple[int, dict[str, Any]]] = []
+        self._unpinned: deque[tuple[int, dict[str, Any]]] = deque()
+        self._pinned_tokens = 0
+        self._unpinned_tokens = 0
+        if messages is not None:
+            self.extend(messages)
+
+    @property
+    def tokens(self) -> int:
+        return self._pinned_tokens + self._unpinned_tokens
+
+    @property
+    def pinned_tokens(self) -> int:
+        return self._pinned_tokens
+
+    @property
+    def unpinned_tokens(self) -> int:
+        return self._unpinned_tokens
+
+    @property
+    def summary(self) -> dict[str, Any] | None:
+        for _, msg in self._pinned:
+            if msg.get("summary", False):
+                return msg
+        return None
+
+    def __len__(self) -> int:
+        return len(self._pinned) + len(self._unpinned)
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        # Merge pinned and unpinned messages back into their original order
+        pinned = self._pinned
+        pinned_idx = 0
+        for seq, msg in self._unpinned:
+            while pinned_idx < len(pinned) and pinned[pinned_idx][0] < seq:
+                yield pinned[pinned_idx][1]
+                pinned_idx += 1
+            yield msg
+        while pinned_idx < len(pinned):
+            yield pinned[pinned_idx][1]
+            pinned_idx += 1
+
+    def to_list(self) -> list[dict[str, Any]]:
+        return list(self)
+
+    def newest_unpinned(self) -> Iterator[dict[str, Any]]:
+        for _, msg in reversed(self._unpinned):
+            yield msg
+
+    def select(self, num_unpinned: int) -> list[dict[str, Any]]:
+        # The pinned messages and the newest num_unpinned messages, in their original order
+        unpinned = [ self._unpinned[-index] for index in range(min(num_unpinned, len(self._unpinned)), 0, -1) ]
+        entries = sorted(self._pinned + unpinned, key=lambda entry: entry[0])
+        return [ msg for _, msg in entries ]
+
+    def append(self, msg: dict[str, Any]) -> None:
+        entry = (self._seq, msg)
+        self._seq += 1
+        if msg.get("keep", False):
+            self._pinned.append(entry)
+            self._pinned_tokens += msg["tokens"]
+        else:
+            self._unpinned.append(entry)
+            self._unpinned_tokens += msg["tokens"]
+        if self.max_tokens != -1:
+            self.trim(self.max_tokens)
+
+    def extend(self, msgs: list[dict[str, Any]]) -> None:
+        for msg in msgs:
+            self.append(msg)
+
+    def evict_oldest(self) -> dict[str, Any] | None:
+        if not self._unpinned:
+            return None
+        _, msg = self._unpinned.popleft()
+        self._unpinned_tokens -= msg["tokens"]
+        return msg
+
+    def trim(self, max_tokens: int) -> None:
+        while self.tokens > max_tokens and self._unpinned:
+            self.evict_oldest()
+
+    def oldest_unpinned(self, tokens: int) -> list[dict[str, Any]]:
+        # The oldest unpinned messages adding up to at least the given number of tokens
+        msgs: list[dict[str, Any]] = []
+        total = 0
+        for _, msg in self._unpinned:
+            if total >= tokens:
+                break
+            msgs.append(msg)
+            total += msg["tokens"]
+        return msgs
+
+    def fold(self, last_msg: dict[str, Any], summary_msg: dict[str, Any]) -> bool:
+        """
+        Replaces the unpinned messages up to and including last_msg (and any previous summary) with the given
+        pinned summary message. Returns False if last_msg is no longer in the history.
+        """
+        if not any(msg is last_msg for _, msg in self._unpinned):
+            return False
+        first_seq = self._unpinned[0][0]
+        while self.evict_oldest() is not last_msg:
+            pass
+        for idx, (_, msg) in enumerate(self._pinned):
+            if msg.get("summary", False):
+                del self._pinned[idx]
+                self._pinned_tokens -= msg["tokens"]
+                break
+        # The summary takes the place of the oldest message it replaced
+        bisect.insort(self._pinned, (first_seq, summary_msg), key=lambda entry: entry[0])
+        self._pinned_tokens += summary_msg["tokens"]
+        return True
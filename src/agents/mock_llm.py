@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import random
+import re
+import time
+import yaml
+
+from typing import Any, AsyncIterator
+
+DEFAULT_TTFT = 0.5
+DEFAULT_TOKENS_PER_SEC = 50.0
+
+NARRATION = [
+    "The torchlight flickers across the damp stone walls, throwing long shadows down the passage.",
+    "Somewhere in the distance water drips steadily, the only sound apart from your own breathing.",
+    "A cold draft carries the smell of earth and old smoke from deeper within.",
+    "The party exchanges a wary glance before pressing on.",
+    "Dust hangs in the air, stirred by your passing, and settles slowly again.",
+    "A faint scratching echoes from somewhere above, then falls silent.",
+]
+
+class MockObject(dict):
+    """Dict with attribute access, standing in for the openai OpenAIObject results."""
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+class MockLLM:
+    """
+    Deterministic local stand in for the openai ChatCompletion api. Responses come from scripted rules
+    (regex matches on the last message) or from built in rules which produce valid "call do_action()" lines
+    for the game and lobby drivers. Latency is simulated with a time to first token and a token rate.
+
+    Mock config (the "mock" section of a model endpoint):
+
+        ttft: seconds before the first token
+        tokens_per_sec: generation rate after the first token
+        seed: seed for the generated narration
+        rules_path: optional yaml file with "rules" (list of { match: regex, response: text }) and/or
+            "script" (list of responses returned in order before falling back to the built in rules)
+    """
+
+    def __init__(self, mock_cfg: dict[str, Any] | None = None) -> None:
+        mock_cfg = mock_cfg or {}
+        self.ttft: float = mock_cfg.get("ttft", DEFAULT_TTFT)
+        self.tokens_per_sec: float = mock_cfg.get("tokens_per_sec", DEFAULT_TOKENS_PER_SEC)
+        self.seed: int = mock_cfg.get("seed", 0)
+        self.rules: list[dict[str, str]] = []
+        self.script: list[str] = []
+        self.script_index = 0
+        rules_path = mock_cfg.get("rules_path")
+        if rules_path:
+            with open(rules_path, "r") as f:
+                rules_data = yaml.load(f, Loader=yaml.FullLoader) or {}
+            self.rules = rules_data.get("rules", [])
+            self.script = rules_data.get("script", [])
+
+    # The openai module surface used by AgentOpenAIV1Base (self.openai.ChatCompletion.acreate/create)
+    @property
+    def ChatCompletion(self) -> "MockLLM":
+        return self
+
+    # RESPONSES -------------------------------------------------------------
+
+    def get_rng(self, query: str) -> random.Random:
+        digest = hashlib.sha1(query.encode()).digest()
+        return random.Random(self.seed * 1000003 + int.from_bytes(digest[:8], "little"))
+
+    def narrate(self, query: str, paras: int = 2) -> str:
+        rng = self.get_rng(query)
+        return "\n\n".join([ " ".join(rng.sample(NARRATION, 2)) for _ in range(paras) ])
+
+    def player_actions(self, query: str) -> str:
+        player_text = query.split("<PLAYER>", 1)[1].split("<INSTRUCTIONS>", 1)[0]
+        actions: list[str] = []
+        for line in player_text.split("\n"):
+            match = re.match(r'^([^:\n]{1,30}): (.+)$', line.strip())
+            if not match:
+                continue
+            char_name, msg = match.groups()
+            lmsg = msg.lower().strip(".!? ")
+            if match := re.search(r'\b(?:go|head|walk|move)(?: to| into| towards)? (?:the )?(.+)', lmsg):
+                actions.append(f'call do_action("go", "{match.group(1)}")')
+            elif match := re.search(r'\bpick(?:s)? up (?:the )?(.+)', lmsg):
+                actions.append(f'call do_action("pickup", "{char_name}", "{match.group(1)}")')
+            elif match := re.search(r'\battacks? (?:the )?(.+)', lmsg):
+                actions.append(f'call do_action("attack", "{char_name}", "{match.group(1)}")')
+            elif match := re.search(r'\blook(?:s)? at (?:the )?(.+)', lmsg):
+                actions.append(f'call do_action("look", "{match.group(1)}")')
+            elif re.search(r'\blook', lmsg):
+                actions.append('call do_action("look")')
+            elif re.search(r'\bsearch', lmsg):
+                actions.append(f'call do_action("search", "{char_name}")')
+            elif re.search(r'\binvent', lmsg):
+                actions.append(f'call do_action("invent", "{char_name}")')
+            elif re.search(r'\bstats\b', lmsg):
+                actions.append(f'call do_action("stats", "{char_name}")')
+            else:
+                actions.append(f'call do_action("respond_to", "{char_name}")')
+        if len(actions) == 0:
+            return 'call do_action("pass")'
+        return "\n".join(actions)
+
+    def respond(self, messages: list[dict[str, Any]]) -> str:
+        query: str = messages[-1]["content"] if messages else ""
+        for rule in self.rules:
+            if re.search(rule["match"], query, re.DOTALL):
+                return rule["response"]
+        if self.script_index < len(self.script):
+            resp = self.script[self.script_index]
+            self.script_index += 1
+            return resp
+        if 'do_action("resume")' in query:
+            return "Welcome adventurers! Your host is ready to begin.\n\n<HIDDEN>\ncall do_action(\"resume\")"
+        if "PREVIOUS SUMMARY:" in query:
+            return self.narrate(query, paras=1)
+        if "EXACTLY 4 lines" in query:
+            return "Well met, friend.\nWhat brings you here?\nWe mean no harm.\nWe should be going."
+        if query.startswith("<RESPONSE>"):
+            return self.narrate(query)
+        if "return a game action of either PASS" in query:
+            return "PASS"
+        if "<PLAYER>" in query and "<INSTRUCTIONS>" in query:
+            if "<NARRATION>" in query:
+                return self.player_actions(query) + "\n<NARRATION>\n" + self.narrate(query, paras=1)
+            return self.player_actions(query)
+        return self.narrate(query, paras=1)
+
+    # COMPLETIONS -----------------------------------------------------------
+
+    @staticmethod
+    def split_tokens(text: str) -> list[str]:
+        # Roughly one token per word (with its leading whitespace)
+        return re.findall(r'\s*\S+|\s+$', text)
+
+    @staticmethod
+    def make_completion(model: str, content: str, prompt_tokens: int, gen_tokens: int) -> MockObject:
+        message = MockObject(role="assistant", content=content)
+        return MockObject(
+            id="chatcmpl-mock",
+            object="chat.completion",
+            created=int(time.time()),
+            model=model,
+            choices=[ MockObject(index=0, message=message, finish_reason="stop") ],
+            usage=MockObject(prompt_tokens=prompt_tokens,
+                             completion_tokens=gen_tokens,
+                             total_tokens=prompt_tokens + gen_tokens))
+
+    @staticmethod
+    def make_chunk(model: str, delta: dict[str, Any], finish_reason: str | None = None) -> MockObject:
+        return MockObject(
+            id="chatcmpl-mock",
+            object="chat.completion.chunk",
+            created=int(time.time()),
+            model=model,
+            choices=[ MockObject(index=0, delta=MockObject(delta), finish_reason=finish_reason) ])
+
+    @staticmethod
+    def apply_limits(content: str, max_tokens: int | None = None, stop: str | list[str] | None = None) -> str:
+        # Same as the api: cut at the first stop sequence (not included) and at max_tokens tokens
+        if isinstance(stop, str):
+            stop = [ stop ]
+        for stop_seq in (stop or []):
+            content = content.split(stop_seq, 1)[0]
+        if max_tokens is not None:
+            content = "".join(MockLLM.split_tokens(content)[:max_tokens])
+        return content
+
+    def gen_time(self, num_tokens: int) -> float:
+        return self.ttft + num_tokens / self.tokens_per_sec
+
+    async def stream(self, model: str, content: str) -> AsyncIterator[MockObject]:
+        await asyncio.sleep(self.ttft)
+        yield self.make_chunk(model, { "role": "assistant" })
+        for token in self.split_tokens(content):
+            yield self.make_chunk(model, { "content": token })
+            await asyncio.sleep(1.0 / self.tokens_per_sec)
+        yield self.make_chunk(model, {}, finish_reason="stop")
+
+    async def acreate(self, model: str = "", messages: list[dict[str, Any]] = [], stream: bool = False, **kwargs: Any) -> Any:
+        content = self.apply_limits(self.respond(messages), kwargs.get("max_tokens"), kwargs.get("stop"))
+        if stream:
+            return self.stream(model, content)
+        tokens = self.split_tokens(content)
+        await asyncio.sleep(self.gen_time(len(tokens)))
+        prompt_tokens = sum([ len(self.split_tokens(msg["content"])) for msg in messages ])
+        return self.make_completion(model, content, prompt_tokens, len(tokens))
+
+    def create(self, model: str = "", messages: list[dict[str, Any]] = [], **kwargs: Any) -> Any:
+        content = self.apply_limits(self.respond(messages), kwargs.get("max_tokens"), kwargs.get("stop"))
+        tokens = self.split_tokens(content)
+        time.sleep(self.gen_time(len(tokens)))
+        prompt_tokens = sum([ len(self.split_tokens(msg["content"])) for msg in messages ])
+        return self.make_completion(model, content, prompt_tokens, len(tokens))
@@ -0,0 +1,166 @@
+import bisect
+
+from typing import Any
+
+# Histogram bucket upper bounds (secs)
+LATENCY_BUCKETS = [ 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0 ]
+
+class Histogram:
+
+    def __init__(self, buckets: list[float] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [ 0 ] * (len(buckets) + 1) # Last is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, pct: float) -> float:
+        # Upper bound of the bucket holding the percentile (approximate)
+        if self.count == 0:
+            return 0.0
+        target = self.count * pct
+        total = 0
+        for index, count in enumerate(self.counts):
+            total += count
+            if total >= target:
+                return (self.buckets[index] if index < len(self.buckets) else float("inf"))
+        return float("inf")
+
+class CallMetrics:
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.ttft = Histogram()
+        self.prompt_tokens = 0
+        self.gen_tokens = 0
+        self.cost = 0.0
+
+    @property
+    def error_rate(self) -> float:
+        attempts = self.calls + self.errors
+        return (self.errors / attempts if attempts > 0 else 0.0)
+
+class ModelMetrics:
+    """
+    Process wide LLM call metrics per (model, call site). The call site is what the call was for: "actioner",
+    "referee", "dialog_choices", "lobby", "summary" etc. (passed to generate() by the drivers).
+
+    Latency is for the whole call, ttft (time to first token) is only known for streamed calls. Errors count
+    failed attempts, including ones that were retried.
+    """
+
+    metrics: dict[tuple[str, str], CallMetrics] = {}
+    # Expected action retries and local fallbacks (see ActionRetryPolicy) by action
+    action_retries: dict[str, int] = {}
+    action_fallbacks: dict[str, int] = {}
+
+    @staticmethod
+    def get_metrics(model: str, site: str) -> CallMetrics:
+        key = (model, site or "other")
+        metrics = ModelMetrics.metrics.get(key)
+        if metrics is None:
+            metrics = CallMetrics()
+            ModelMetrics.metrics[key] = metrics
+        return metrics
+
+    @staticmethod
+    def record_call(model: str, site: str, latency: float, ttft: float | None = None) -> None:
+        metrics = ModelMetrics.get_metrics(model, site)
+        metrics.calls += 1
+        metrics.latency.observe(latency)
+        if ttft is not None:
+            metrics.ttft.observe(ttft)
+
+    @staticmethod
+    def record_error(model: str, site: str) -> None:
+        ModelMetrics.get_metrics(model, site).errors += 1
+
+    @staticmethod
+    def record_tokens(model_config: dict[str, Any], site: str, prompt_tokens: int, gen_tokens: int) -> None:
+        metrics = ModelMetrics.get_metrics(model_config.get("model", ""), site)
+        metrics.prompt_tokens += prompt_tokens
+        metrics.gen_tokens += gen_tokens
+        metrics.cost += (prompt_tokens * model_config.get("prompt_cost", 0.0) + \
+                         gen_tokens * model_config.get("gen_cost", 0.0)) * 0.001
+
+    @staticmethod
+    def record_action_retry(action: str) -> None:
+        ModelMetrics.action_retries[action] = ModelMetrics.action_retries.get(action, 0) + 1
+
+    @staticmethod
+    def record_action_fallback(action: str) -> None:
+        ModelMetrics.action_fallbacks[action] = ModelMetrics.action_fallbacks.get(action, 0) + 1
+
+    # OUTPUT ----------------------------------------------------------------
+
+    @staticmethod
+    def to_prometheus(client_stats: dict[str, dict[str, Any]] | None = None) -> str:
+        # Prometheus text exposition format
+        lines: list[str] = []
+
+        def add_histogram(name: str, help: str, get_hist: Any) -> None:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} histogram")
+            for (model, site), metrics in ModelMetrics.metrics.items():
+                hist: Histogram = get_hist(metrics)
+                labels = f'model="{model}",site="{site}"'
+                total = 0
+                for index, count in enumerate(hist.counts):
+                    total += count
+                    le = (f"{hist.buckets[index]}" if index < len(hist.buckets) else "+Inf")
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {total}')
+                lines.append(f"{name}_sum{{{labels}}} {hist.sum:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+        def add_counter(name: str, help: str, get_value: Any) -> None:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} counter")
+            for (model, site), metrics in ModelMetrics.metrics.items():
+                lines.append(f'{name}{{model="{model}",site="{site}"}} {get_value(metrics)}')
+
+        add_histogram("llm_request_latency_seconds", "LLM call latency.", lambda m: m.latency)
+        add_histogram("llm_time_to_first_token_seconds", "Time to first streamed token.", lambda m: m.ttft)
+        add_counter("llm_requests_total", "Successful LLM calls.", lambda m: m.calls)
+        add_counter("llm_errors_total", "Failed LLM call attempts.", lambda m: m.errors)
+        add_counter("llm_prompt_tokens_total", "Prompt tokens sent.", lambda m: m.prompt_tokens)
+        add_counter("llm_gen_tokens_total", "Tokens generated.", lambda m: m.gen_tokens)
+        add_counter("llm_cost_dollars_total", "Estimated cost.", lambda m: f"{m.cost:.6f}")
+
+        for name, counts in [ ("llm_expected_action_retries_total", ModelMetrics.action_retries),
+                              ("llm_expected_action_fallbacks_total", ModelMetrics.action_fallbacks) ]:
+            lines.append(f"# TYPE {name} counter")
+            for action, count in counts.items():
+                action_label = action.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'{name}{{action="{action_label}"}} {count}')
+
+        if client_stats:
+            for stat in [ "in_flight", "queue_depth", "max_queue_depth" ]:
+                lines.append(f"# TYPE llm_client_{stat} gauge")
+                for endpoint, stats in client_stats.items():
+                    lines.append(f'llm_client_{stat}{{endpoint="{endpoint}"}} {stats[stat]}')
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def dump() -> str:
+        # Short human readable summary
+        if len(ModelMetrics.metrics) == 0 and len(ModelMetrics.action_fallbacks) == 0:
+            return "No model calls yet."
+        lines: list[str] = []
+        for (model, site), metrics in sorted(ModelMetrics.metrics.items()):
+            mean = (metrics.latency.sum / metrics.latency.count if metrics.latency.count > 0 else 0.0)
+            line = f"{model} {site}: calls {metrics.calls} err {metrics.error_rate:.1%} " + \
+                   f"lat avg {mean:.2f}s p90<={metrics.latency.percentile(0.9)}s"
+            if metrics.ttft.count > 0:
+                line += f" ttft avg {metrics.ttft.sum / metrics.ttft.count:.2f}s"
+            line += f" tok {metrics.prompt_tokens}/{metrics.gen_tokens} ${metrics.cost:.2f}"
+            lines.append(line)
+        for action, count in ModelMetrics.action_fallbacks.items():
+            lines.append(f"fallback {action}: {count} (retries {ModelMetrics.action_retries.get(action, 0)})")
+        return "\n".join(lines)
@@ -0,0 +1,130 @@
+import copy
+
+from config import config_all
+from typing import Any
+
+from .latency_policy import LatencyTracker
+from .model_metrics import ModelMetrics
+from .transcript_logger import TranscriptLogger
+
+class ModelRouter:
+    """
+    Picks the primary or secondary model for a query from config rules. Defaults come from the top level
+    "model_routing" in config.yaml and can be overridden with a "model_routing" section in the model endpoint.
+
+    Each rule matches request features (any left out match everything):
+
+        mode: query mode or list of modes ("exploration_action", "encounter_action", "engine_response",
+            "referee_response", "dialog_choices", "lobby")
+        game_state: "exploration", "encounter" etc.
+        min_tokens/max_tokens: instruction message size (the "tokens" feature)
+        near_simple: true if the local simple action parser matched some of the players but not all
+
+    and gives a tier:
+
+        primary/secondary: always that model
+        cheapest: the cheapest model that fits the query and is meeting the latency and success targets. The
+            query fits if its smallest prompt (the "prompt_tokens" feature - prefix, pinned history and
+            instruction) leaves room for the response.
+        default: whatever the caller asked for
+
+    The first matching rule wins. Decisions are written to the "routing" event log when log_decisions is set.
+    """
+
+    def __init__(self, model_endpoint: str) -> None:
+        cfg: dict[str, Any] = copy.deepcopy(config_all.get("model_routing", {}))
+        cfg.update(config_all["model_endpoints"][model_endpoint].get("model_routing", {}))
+        self.model_endpoint = model_endpoint
+        self.enabled: bool = cfg.get("enabled", False)
+        self.rules: list[dict[str, Any]] = cfg.get("rules", [])
+        self.latency_target: float = cfg.get("latency_target", 15.0)
+        self.latency_percentile: float = cfg.get("latency_percentile", 0.9)
+        self.min_success_rate: float = cfg.get("min_success_rate", 0.9)
+        self.min_samples: int = cfg.get("min_samples", 20)
+        self.response_reserve: int = cfg.get("response_reserve", 500)
+        self.log_decisions: bool = cfg.get("log_decisions", True)
+        # Stats
+        self.routed: dict[str, int] = { "primary": 0, "secondary": 0 }
+
+    @staticmethod
+    def match_rule(rule: dict[str, Any], features: dict[str, Any]) -> bool:
+        for key in [ "mode", "game_state" ]:
+            if key in rule:
+                values = (rule[key] if isinstance(rule[key], list) else [ rule[key] ])
+                if features.get(key) not in values:
+                    return False
+        if "min_tokens" in rule and features.get("tokens", 0) < rule["min_tokens"]:
+            return False
+        if "max_tokens" in rule and features.get("tokens", 0) > rule["max_tokens"]:
+            return False
+        if "near_simple" in rule and features.get("near_simple", False) != rule["near_simple"]:
+            return False
+        return True
+
+    def meets_targets(self, model_id: str) -> tuple[bool, str]:
+        # Models without enough samples yet are assumed to be fine
+        tracker = LatencyTracker.get_tracker(model_id)
+        if len(tracker.samples) >= self.min_samples:
+            latency = tracker.percentile(self.latency_percentile)
+            if latency > self.latency_target:
+                return (False, f"latency {latency:.1f}s")
+        calls = errors = 0
+        for (metrics_model, _), metrics in ModelMetrics.metrics.items():
+            if metrics_model == model_id:
+                calls += metrics.calls
+                errors += metrics.errors
+        if calls + errors >= self.min_samples and calls / (calls + errors) < self.min_success_rate:
+            return (False, f"success {calls / (calls + errors):.0%}")
+        return (True, "")
+
+    def route(self,
+              primary_config: dict[str, Any],
+              secondary_config: dict[str, Any],
+              requested_primary: bool,
+              features: dict[str, Any]) -> bool:
+        # Returns True to use the primary model
+        if not self.enabled or primary_config == secondary_config:
+            return requested_primary
+        rule_index = -1
+        tier = "default"
+        for index, rule in enumerate(self.rules):
+            if self.match_rule(rule, features):
+                rule_index = index
+                tier = rule.get("tier", "default")
+                break
+        reason = ""
+        match tier:
+            case "primary":
+                use_primary = True
+            case "secondary":
+                use_primary = False
+            case "cheapest":
+                candidates = [ (True, primary_config), (False, secondary_config) ]
+                candidates.sort(key=lambda c: c[1].get("prompt_cost", 0.0) + c[1].get("gen_cost", 0.0))
+                use_primary = True # If nothing meets the targets fall back to the primary (stronger) model
+                reasons: list[str] = []
+                for is_primary, model_config in candidates:
+                    model_id = model_config.get("model", "")
+                    if features.get("prompt_tokens", 0) + self.response_reserve > model_config.get("max_tokens", 2048):
+                        reasons.append(f"{model_id} too small")
+                        continue
+                    ok, why = self.meets_targets(model_id)
+                    if not ok:
+                        reasons.append(f"{model_id} {why}")
+                        continue
+                    use_primary = is_primary
+                    break
+                reason = ", ".join(reasons)
+            case _:
+                use_primary = requested_primary
+        self.routed["primary" if use_primary else "secondary"] += 1
+        if self.log_decisions:
+            TranscriptLogger.get_logger().log_event("routing", {
+                "endpoint": self.model_endpoint,
+                "features": features,
+                "requested": ("primary" if requested_primary else "secondary"),
+                "rule": rule_index,
+                "tier": tier,
+                "model": (primary_config if use_primary else secondary_config).get("model", ""),
+                "reason": reason })
+        return use_primary
@@ -0,0 +1,68 @@
+import re
+import tiktoken
+
+from typing import Any
+
+from .token_cache import TokenCache
+
+SLOT_PATTERN = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)\}")
+TEMPLATE_CACHE_MAX_ENTRIES = 512
+
+class PromptTemplate:
+    """
+    A prompt parsed once into literal and "{name}" slot segments. Rendering is a single join (values are
+    never themselves searched for slots), and slots without a value are left as written. The token count of
+    the literal segments is cached per encoding, so a rendered prompt's size can be worked out from its
+    values without building or tokenizing the whole string (approximate, as tokens can merge at the joins).
+
+    Templates are shared process wide through get(), keyed by the template text.
+    """
+
+    templates: dict[str, "PromptTemplate"] = {}
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.literals: list[str] = []
+        self.slots: list[str] = []
+        pos = 0
+        for match in SLOT_PATTERN.finditer(text):
+            self.literals.append(text[pos:match.start()])
+            self.slots.append(match.group(1))
+            pos = match.end()
+        self.literals.append(text[pos:])
+        self.static_tokens: dict[str, int] = {}
+
+    @staticmethod
+    def get(text: str) -> "PromptTemplate":
+        template = PromptTemplate.templates.get(text)
+        if template is None:
+            if len(PromptTemplate.templates) >= TEMPLATE_CACHE_MAX_ENTRIES:
+                PromptTemplate.templates = {}
+            template = PromptTemplate(text)
+            PromptTemplate.templates[text] = template
+        return template
+
+    @staticmethod
+    def compile_all(prompts: dict[str, Any]) -> dict[str, "PromptTemplate"]:
+        return { name: PromptTemplate.get(text) for name, text in prompts.items() if isinstance(text, str) }
+
+    def get_values(self, args: dict[str, Any]) -> list[str]:
+        return [ (str(args[slot]) if slot in args else "{" + slot + "}") for slot in self.slots ]
+
+    def render(self, args: dict[str, Any] | None = None, **kwargs: Any) -> str:
+        if not self.slots:
+            return self.text
+        values = self.get_values({ **(args or {}), **kwargs })
+        parts: list[str] = [ self.literals[0] ]
+        for index, value in enumerate(values):
+            parts.append(value)
+            parts.append(self.literals[index + 1])
+        return "".join(parts)
+
+    def count_tokens(self, token_enc: tiktoken.Encoding, args: dict[str, Any] | None = None) -> int:
+        static_tokens = self.static_tokens.get(token_enc.name)
+        if static_tokens is None:
+            static_tokens = sum([ TokenCache.count_tokens(token_enc, literal) for literal in self.literals if literal ])
+            self.static_tokens[token_enc.name] = static_tokens
+        values = self.get_values(args or {})
+        return static_tokens + sum([ TokenCache.count_tokens(token_enc, value) for value in values if value ])
@@ -0,0 +1,77 @@
+import copy
+
+from config import config_all
+from typing import Any
+from .message_history import MessageHistory
+
+# Share of the target for each prompt part, in priority order
+DEFAULT_PARTS: dict[str, float] = { "prefix": 0.35, "state": 0.15, "recent": 0.3, "older": 0.2 }
+
+class TokenBudget:
+    """
+    Plans which messages go into a prompt. Rather than sending as much history as the model's window allows,
+    prompts are planned to a target fraction of the window. The target is split into an allocation for each
+    part, filled in priority order:
+
+        1. prefix - rules/instructions for the mode, always sent
+        2. state - the final instruction message (current location or encounter state plus the query), always
+           sent
+        3. recent turns - the newest recent_turns history messages
+        4. older turns - pinned history (keep messages and the story so far summary, always sent) and then
+           older messages newest first
+
+    A part can also use whatever the parts before it left unused, and nothing is planned past the model's
+    window. Defaults come from the top level "token_budget" in config.yaml and can be overridden with a
+    "token_budget" section in the model endpoint.
+    """
+
+    def __init__(self, model_endpoint: str) -> None:
+        cfg: dict[str, Any] = copy.deepcopy(config_all.get("token_budget", {}))
+        cfg.update(config_all["model_endpoints"][model_endpoint].get("token_budget", {}))
+        self.target_fraction: float = cfg.get("target_fraction", 1.0)
+        self.response_reserve: int = cfg.get("response_reserve", 500)
+        self.recent_turns: int = cfg.get("recent_turns", 4)
+        self.parts: dict[str, float] = { **DEFAULT_PARTS, **cfg.get("parts", {}) }
+        # Stats
+        self.planned_tokens = 0
+        self.dropped_tokens = 0
+
+    @staticmethod
+    def min_tokens(prefix: list[dict[str, Any]], history: MessageHistory, instr: list[dict[str, Any]]) -> int:
+        # The parts that are always sent
+        return sum([ msg["tokens"] for msg in prefix ]) + history.pinned_tokens + sum([ msg["tokens"] for msg in instr ])
+
+    def plan(self,
+             max_tokens: int,
+             prefix: list[dict[str, Any]],
+             history: MessageHistory,
+             instr: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        hard_limit = max_tokens - self.response_reserve
+        target = int(hard_limit * self.target_fraction)
+        allocs = { part: int(target * fraction) for part, fraction in self.parts.items() }
+        prefix_tokens = sum([ msg["tokens"] for msg in prefix ])
+        instr_tokens = sum([ msg["tokens"] for msg in instr ])
+        used = prefix_tokens + instr_tokens + history.pinned_tokens
+        # Prefix and state are always sent, an overrun doesn't come out of the history parts
+        spare = max(allocs["prefix"] - prefix_tokens, 0)
+        spare = max(allocs["state"] + spare - instr_tokens, 0)
+        budget = allocs["recent"] + spare
+        part_tokens = 0
+        # Only the turns that are sent are looked at, not the whole history
+        num_turns = 0
+        turn_tokens = 0
+        for msg in history.newest_unpinned():
+            if num_turns == self.recent_turns:
+                # Older turns share their allocation with the pinned history
+                budget = allocs["older"] - history.pinned_tokens + (budget - part_tokens)
+                part_tokens = 0
+            if part_tokens + msg["tokens"] > budget or used + msg["tokens"] > hard_limit:
+                # Stop at the first turn that doesn't fit so the history we send has no gaps
+                break
+            used += msg["tokens"]
+            part_tokens += msg["tokens"]
+            turn_tokens += msg["tokens"]
+            num_turns += 1
+        self.planned_tokens += used
+        self.dropped_tokens += history.unpinned_tokens - turn_tokens
+        return prefix + history.select(num_turns) + instr
@@ -0,0 +1,47 @@
+import hashlib
+import tiktoken
+
+from collections import OrderedDict
+
+TOKEN_CACHE_MAX_ENTRIES = 4096
+
+class TokenCache:
+    """
+    Process wide LRU cache of token counts keyed by (encoding name, content hash). Shared by all agents
+    so the large static prompts are only tokenized once per process.
+    """
+
+    counts: OrderedDict[tuple[str, bytes], int] = OrderedDict()
+    max_entries: int = TOKEN_CACHE_MAX_ENTRIES
+    hits: int = 0
+    misses: int = 0
+
+    @staticmethod
+    def make_key(token_enc: tiktoken.Encoding, content: str) -> tuple[str, bytes]:
+        return (token_enc.name, hashlib.sha1(content.encode()).digest())
+
+    @staticmethod
+    def lookup(key: tuple[str, bytes]) -> int | None:
+        tokens = TokenCache.counts.get(key)
+        if tokens is not None:
+            TokenCache.counts.move_to_end(key)
+            TokenCache.hits += 1
+        else:
+            TokenCache.misses += 1
+        return tokens
+
+    @staticmethod
+    def store(key: tuple[str, bytes], tokens: int) -> None:
+        counts = TokenCache.counts
+        counts[key] = tokens
+        if len(counts) > TokenCache.max_entries:
+            counts.popitem(last=False)
+
+    @staticmethod
+    def count_tokens(token_enc: tiktoken.Encoding, content: str) -> int:
+        key = TokenCache.make_key(token_enc, content)
+        tokens = TokenCache.lookup(key)
+        if tokens is None:
+            tokens = len(token_enc.encode(content))
+            TokenCache.store(key, tokens)
+        return tokens
@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import tiktoken
+
+from concurrent.futures import ThreadPoolExecutor
+from config import config_all
+from typing import Any
+
+from .token_cache import TokenCache
+
+class Tokenizers:
+    """
+    Process wide registry of tiktoken encodings keyed by tokenizer model. Each encoding is loaded once, on
+    first use (or up front with warm()). The async methods load and encode in a small thread pool so a cold
+    tokenizer or a very large encode doesn't hold up the event loop.
+
+    Settings are in "tokenizers" in config.yaml:
+
+        warm_on_start: load every configured tokenizer (and pre-tokenize the static prompts) at startup
+        offload_chars: content longer than this is tokenized in the thread pool by count_tokens()
+    """
+
+    encodings: dict[str, tiktoken.Encoding] = {}
+    lock = threading.Lock()
+    executor: ThreadPoolExecutor | None = None
+
+    @staticmethod
+    def get_config() -> dict[str, Any]:
+        return config_all.get("tokenizers", {})
+
+    @staticmethod
+    def get_executor() -> ThreadPoolExecutor:
+        if Tokenizers.executor is None:
+            Tokenizers.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tokenizer")
+        return Tokenizers.executor
+
+    @staticmethod
+    def get(tokenizer_model: str = "gpt-4") -> tiktoken.Encoding:
+        token_enc = Tokenizers.encodings.get(tokenizer_model)
+        if token_enc is not None:
+            return token_enc
+        with Tokenizers.lock:
+            token_enc = Tokenizers.encodings.get(tokenizer_model)
+            if token_enc is None:
+                token_enc = tiktoken.encoding_for_model(tokenizer_model)
+                Tokenizers.encodings[tokenizer_model] = token_enc
+        return token_enc
+
+    @staticmethod
+    async def aget(tokenizer_model: str = "gpt-4") -> tiktoken.Encoding:
+        token_enc = Tokenizers.encodings.get(tokenizer_model)
+        if token_enc is not None:
+            return token_enc
+        return await asyncio.get_running_loop().run_in_executor(Tokenizers.get_executor(), Tokenizers.get, tokenizer_model)
+
+    @staticmethod
+    def get_endpoint_models(model_endpoint: str) -> set[str]:
+        # Tokenizer models used by the primary/secondary models of a model endpoint
+        endpoint_cfg: dict[str, Any] = config_all["model_endpoints"][model_endpoint]
+        model_info: dict[str, Any] = config_all.get("model_info", {})
+        tokenizer_models: set[str] = set()
+        for model_type in [ "primary", "secondary" ]:
+            if model_type in endpoint_cfg:
+                model_id = endpoint_cfg[model_type]["model"]
+                tokenizer_models.add(endpoint_cfg[model_type].get("tokenizer_model") or \
+                                     model_info.get(model_id, {}).get("tokenizer_model", "gpt-4"))
+        return tokenizer_models
+
+    @staticmethod
+    async def aload_endpoint(model_endpoint: str) -> None:
+        # Loads an endpoint's tokenizers off the event loop (so creating its agent won't block)
+        for tokenizer_model in Tokenizers.get_endpoint_models(model_endpoint):
+            await Tokenizers.aget(tokenizer_model)
+
+    @staticmethod
+    def warm(contents: list[str]) -> None:
+        # Loads every configured tokenizer and pre-tokenizes static content (if "warm_on_start" is set)
+        if not Tokenizers.get_config().get("warm_on_start", True):
+            return
+        tokenizer_models = { info.get("tokenizer_model", "gpt-4") for info in config_all.get("model_info", {}).values() }
+        tokenizer_models.add("gpt-4")
+        encodings: dict[str, tiktoken.Encoding] = {}
+        for tokenizer_model in tokenizer_models:
+            token_enc = Tokenizers.get(tokenizer_model)
+            encodings[token_enc.name] = token_enc
+        for token_enc in encodings.values():
+            for content in contents:
+                TokenCache.count_tokens(token_enc, content)
+
+    @staticmethod
+    async def count_tokens(token_enc: tiktoken.Encoding, content: str) -> int:
+        # Cached token count, with very large contents tokenized in the thread pool
+        if len(content) <= Tokenizers.get_config().get("offload_chars", 20000):
+            return TokenCache.count_tokens(token_enc, content)
+        key = TokenCache.make_key(token_enc, content)
+        tokens = TokenCache.lookup(key)
+        if tokens is None:
+            # Only the encode runs in the pool, the cache is only touched from the event loop
+            tokens = len(await asyncio.get_running_loop().run_in_executor(Tokenizers.get_executor(), token_enc.encode, content))
+            TokenCache.store(key, tokens)
+        return tokens
@@ -0,0 +1,139 @@
+import atexit
+import json
+import os
+import queue
+import textwrap
+import threading
+import time
+
+from config import config_all
+from datetime import datetime
+from typing import Any
+
+class TranscriptFile:
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.opened_time = time.time()
+        self.size = (os.path.getsize(path) if os.path.exists(path) else 0)
+
+class TranscriptLogger:
+    """
+    Writes agent transcripts (query/response pairs) from a background thread. The event loop only queues
+    records. The writer batches whatever is queued, formats it and writes one file per agent tag, starting a
+    new file when the current one passes max_bytes or max_age. Settings are in "transcript_logging" in
+    config.yaml, format is "text" (indented, wrapped) or "jsonl" (one record per line).
+    """
+
+    logger: "TranscriptLogger | None" = None
+
+    def __init__(self) -> None:
+        cfg: dict[str, Any] = config_all.get("transcript_logging", {})
+        self.enabled: bool = cfg.get("enabled", True)
+        self.format: str = cfg.get("format", "text")
+        self.log_dir: str = cfg.get("log_dir", "logs")
+        self.max_bytes: int = cfg.get("max_bytes", 10000000)
+        self.max_age: float = cfg.get("max_age", 86400.0)
+        self.flush_interval: float = cfg.get("flush_interval", 1.0)
+        self.max_queue: int = cfg.get("max_queue", 10000)
+        self.dropped = 0
+        self._queue: queue.Queue[dict[str, Any] | None] = queue.Queue(maxsize=self.max_queue)
+        self._files: dict[str, TranscriptFile] = {}
+        self._thread: threading.Thread | None = None
+
+    @staticmethod
+    def get_logger() -> "TranscriptLogger":
+        if TranscriptLogger.logger is None:
+            TranscriptLogger.logger = TranscriptLogger()
+        return TranscriptLogger.logger
+
+    def log(self, agent_tag: str, query: str, response: str, **info: Any) -> None:
+        # Never blocks - if the writer has fallen too far behind the record is dropped.
+        if not self.enabled:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._writer, name="transcript_logger", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        record = { "time": datetime.now().isoformat(timespec="seconds"),
+                   "agent_tag": agent_tag,
+                   "query": query,
+                   "response": response }
+        record.update(info)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def log_event(self, log_name: str, record: dict[str, Any]) -> None:
+        # Structured records (always JSONL) for offline analysis, e.g. model routing decisions
+        self.log(log_name, "", "", event=record)
+
+    def stop(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5.0)
+
+    # WRITER THREAD ---------------------------------------------------------
+
+    def _writer(self) -> None:
+        running = True
+        while running:
+            try:
+                records = [ self._queue.get(timeout=self.flush_interval) ]
+            except queue.Empty:
+                continue
+            # Batch up everything else waiting
+            while True:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in records:
+                running = False
+                records = [ record for record in records if record is not None ]
+            batches: dict[tuple[str, bool], list[str]] = {}
+            for record in records:
+                is_json = (self.format == "jsonl" or "event" in record)
+                batches.setdefault((record["agent_tag"], is_json), []).append(self.format_record(record))
+            for (agent_tag, is_json), lines in batches.items():
+                try:
+                    self._write(agent_tag, "".join(lines), is_json)
+                except Exception as e:
+                    print(f"Error: transcript log write failed for {agent_tag} - {e}")
+
+    def format_record(self, record: dict[str, Any]) -> str:
+        if "event" in record:
+            return json.dumps({ "time": record["time"], **record["event"] }) + "\n"
+        if self.format == "jsonl":
+            return json.dumps(record) + "\n"
+        indent_query = textwrap.indent(record["query"], prefix="    ")
+        indent_response = ""
+        for line in str.splitlines(record["response"]):
+            indent_response += textwrap.fill(line, width=100) + "\n"
+        indent_response = textwrap.indent(indent_response, prefix="    ")
+        return f"USER:\n\n{indent_query}\n\nASSISTANT:\n\n{indent_response}\n\n"
+
+    def _get_file(self, agent_tag: str, is_json: bool) -> TranscriptFile:
+        log_file = self._files.get(agent_tag)
+        if log_file is not None and \
+                log_file.size < self.max_bytes and \
+                time.time() - log_file.opened_time < self.max_age:
+            return log_file
+        if not os.path.exists(self.log_dir):
+            os.makedirs(self.log_dir)
+        ext = ("jsonl" if is_json else "txt")
+        path = f"{self.log_dir}/log_{agent_tag}_" + datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + f".{ext}"
+        if log_file is not None and path == log_file.path:
+            # Rotated within the same second
+            path = path[:-len(ext) - 1] + f"_{int(time.time() * 1000) % 1000:03d}.{ext}"
+        log_file = TranscriptFile(path)
+        self._files[agent_tag] = log_file
+        return log_file
+
+    def _write(self, agent_tag: str, text: str, is_json: bool) -> None:
+        log_file = self._get_file(agent_tag, is_json)
+        data = text.encode()
+        with open(log_file.path, "ab") as f:
+            f.write(data)
+        log_file.size += len(data)
@@ -8,6 +8,8 @@ DEVELOPER_MODE = (os.getenv('DEVELOPER_MODE') == "true")
 ERROR_LOGGING = ((os.getenv('ERROR_LOGGING') or "true") == "true")
 CONFIG_TAG = ("dev" if DEVELOPER_MODE else "prod")
 AGENT_LOGGING = ((os.getenv('AGENT_LOGGING') or "true") == "true")
+LLM_CASSETTE_MODE = (os.getenv('LLM_CASSETTE_MODE') or "") # "record", "replay" or "" (off)
+LLM_CASSETTE_PATH = (os.getenv('LLM_CASSETTE_PATH') or "cassettes/llm_cassette.jsonl")
 
 # App config.yaml file
 config_all: dict[str, Any] = {}
@@ -6,6 +6,9 @@ import re
 import traceback
 
 from agent import Agent
+from agents.llm_client import LLMClient
+from agents.model_metrics import ModelMetrics
+from agents.tokenizers import Tokenizers
 from config import ERROR_LOGGING, DEVELOPER_MODE, config, config_all
 from engine import Engine, EngineManager
 from filedb import FileDb
@@ -18,6 +21,11 @@ import discord
 
 MESSAGE_RATE_LIMIT = int(os.getenv('MESSAGE_RATE_LIMIT') or 5)
 
+# Stream referee responses (post after the first few tokens, then edit the message as the rest arrives)
+STREAM_RESPONSES = ((os.getenv('STREAM_RESPONSES') or "true") == "true")
+STREAM_FIRST_TOKENS = int(os.getenv('STREAM_FIRST_TOKENS') or 12)
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL') or 1.2) # Discord allows ~5 edits per 5 secs
+
 # Get the discord token
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 assert DISCORD_TOKEN is not None
@@ -136,6 +144,8 @@ async def start_session(user: discord.User,
         assert False
 
     if session is None:
+        # Make sure the tokenizers are loaded without blocking other sessions
+        await Tokenizers.aload_endpoint(MODEL_ENDPOINT)
         agent: Agent = engine.create_chatbot_agent(channel_name, MODEL_ENDPOINT)
         lobby: ChatLobbyDriver|None = engine.create_chatbot_lobby(game_user, agent)
     else:
@@ -304,19 +314,7 @@ async def send_to_channel(channel: discord.TextChannel, msg: str, game: ChatGame
     if game and split_lines:
         split_msgs = game.split_dialog(msg)
         if len(split_msgs) > 1:
-            for index, split_msg in enumerate(split_msgs):
-                last_para = index == len(split_msgs) - 1
-                try:
-                    if isinstance(split_msg, bytes):
-                        await channel.send(file=discord.File(io.BytesIO(split_msg), filename="dialog.png"))
-                    else:
-                        await send_to_channel_msg(channel, cast(str, split_msg))
-                except Exception as e:
-                    tb = traceback.format_exc()
-                    if ERROR_LOGGING:
-                        print(tb)
-                if not last_para:
-                    await asyncio.sleep(0.5)
+            await send_split_msgs(channel, split_msgs)
             sent_message = True
 
     # Send message if we haven't split above
@@ -329,6 +327,115 @@ async def send_to_channel(channel: discord.TextChannel, msg: str, game: ChatGame
 #        game.button_tag = None
 #        await show_button_menu(game, channel, button_tag)
 
+async def send_split_msgs(channel: discord.TextChannel, split_msgs: list[str|bytes]) -> None:
+    for index, split_msg in enumerate(split_msgs):
+        last_para = index == len(split_msgs) - 1
+        try:
+            if isinstance(split_msg, bytes):
+                await channel.send(file=discord.File(io.BytesIO(split_msg), filename="dialog.png"))
+            else:
+                await send_to_channel_msg(channel, cast(str, split_msg))
+        except Exception as e:
+            tb = traceback.format_exc()
+            if ERROR_LOGGING:
+                print(tb)
+        if not last_para:
+            await asyncio.sleep(0.5)
+
+# ------------------
+# Response Streamer
+# ------------------
+
+HIDDEN_MARKERS = [ "<HIDDEN>", "<INSTRUCTIONS>" ]
+SKIPPED_LINE_PREFIXES = [ "@", "<RESPONSE>", "state: ", "call do_action(" ]
+
+class ResponseStreamer:
+    """
+    Chunk handler which shows a referee response in discord while it's being generated. The first message is
+    posted after STREAM_FIRST_TOKENS tokens and then edited at most every STREAM_EDIT_INTERVAL secs. Edits run
+    in a background task so the model stream is never held up by discord. When the turn is done finish()
+    replaces the streamed text with the final response (which may have been cut, continued or split into
+    dialog portraits).
+    """
+
+    def __init__(self, channel: discord.TextChannel) -> None:
+        self.channel = channel
+        self.text = ""
+        self.tokens = 0
+        self.message: discord.Message|None = None
+        self.shown = ""
+        self.last_edit_time = 0.0
+        self.finished = False
+        self._task: asyncio.Task|None = None
+
+    @staticmethod
+    def visible_text(text: str, final: bool = False) -> str:
+        # Strips the hidden parts of a (possibly partial) response - same rules as send_to_channel_msg()
+        for marker in HIDDEN_MARKERS:
+            text = text.split(marker, 1)[0]
+        lines = text.split("\n")
+        partial = ("" if final else lines.pop())
+        out_lines = [ line for line in lines
+                        if not any(line.startswith(prefix) for prefix in SKIPPED_LINE_PREFIXES) ]
+        # Hold back a partial line until we know it isn't hidden
+        if partial and not any(prefix.startswith(partial) or partial.startswith(prefix)
+                                   for prefix in SKIPPED_LINE_PREFIXES + HIDDEN_MARKERS):
+            if (lt_pos := partial.rfind("<")) != -1 and \
+                    any(marker.startswith(partial[lt_pos:]) for marker in HIDDEN_MARKERS):
+                partial = partial[:lt_pos]
+            out_lines.append(partial)
+        return "\n".join(out_lines).strip(" \t\n")[:2000]
+
+    async def __call__(self, content: str, chunk_time: float) -> None:
+        self.text += content
+        self.tokens += 1
+        if self.finished or (self._task is not None and not self._task.done()):
+            return
+        if self.message is None and self.tokens < STREAM_FIRST_TOKENS:
+            return
+        if chunk_time - self.last_edit_time < STREAM_EDIT_INTERVAL:
+            return
+        self.last_edit_time = chunk_time
+        self._task = asyncio.create_task(self.update())
+
+    async def update(self) -> None:
+        shown = self.visible_text(self.text)
+        if not shown or shown == self.shown:
+            return
+        try:
+            if self.message is None:
+                self.message = await self.channel.send(shown)
+            else:
+                await self.message.edit(content=shown)
+            self.shown = shown
+        except discord.HTTPException:
+            if ERROR_LOGGING:
+                print(traceback.format_exc())
+
+    async def finish(self, result: str, game: ChatGameDriver|None = None) -> None:
+        self.finished = True
+        if self._task is not None:
+            await self._task
+        if self.message is None:
+            await send_to_channel(self.channel, result, game)
+            return
+        split_msgs = (game.split_dialog(result) if game else [])
+        has_image = any(line.startswith("@image: ") or line.startswith("@card(") for line in result.splitlines())
+        final = self.visible_text(result, final=True)
+        try:
+            if len(split_msgs) > 1 or has_image or not final:
+                # Can't show this with an edit, replace the streamed message
+                await self.message.delete()
+                if len(split_msgs) > 1:
+                    await send_split_msgs(self.channel, split_msgs)
+                else:
+                    await send_to_channel_msg(self.channel, result)
+            elif final != self.shown:
+                await self.message.edit(content=final)
+        except discord.HTTPException:
+            if ERROR_LOGGING:
+                print(traceback.format_exc())
+
 async def show_button_menu(game: ChatGameDriver, channel: discord.TextChannel, button_tag: str) -> None:
     state = {}
     view = discord.ui.View()
@@ -539,6 +646,8 @@ async def process_messages(channel_session: ChatbotGameSession) -> None:
                 char_name = player_char_map[username][0]
             content += f"{char_name}: {message}\n\n"
 
+    streamer = (ResponseStreamer(channel) if STREAM_RESPONSES else None)
+
     try:
         channel_state = await engine.get_channel_state(guild.id, channel.id)
 
@@ -548,7 +657,7 @@ async def process_messages(channel_session: ChatbotGameSession) -> None:
 
         # If game is running, call game, otherwise call the lobby
         if game is not None and game.is_started and not game.game_over:
-            result = await game.player_action(content)
+            result = await game.player_action(content, chunk_handler=streamer)
             # Handle returning to lobby from game
             if game.exit_to_lobby:
                 game.exit_to_lobby = False
@@ -559,7 +668,7 @@ async def process_messages(channel_session: ChatbotGameSession) -> None:
                 # Restart the lobby   
                 result = await lobby.start_lobby()
         else:
-            result = await lobby.player_action(content)
+            result = await lobby.player_action(content, chunk_handler=streamer)
             # Handle starting a game from lobby
             if lobby.start_the_game:
                 start_game_action = cast(str, lobby.start_game_action)
@@ -589,7 +698,9 @@ async def process_messages(channel_session: ChatbotGameSession) -> None:
     channel_session.messages = []
     channel_session.last_response_time = datetime.now()
 
-    if result != "":
+    if streamer is not None and (result != "" or streamer.message is not None):
+        await streamer.finish(result, game)
+    elif result != "":
         await send_to_channel(channel, result, game)
 
 # ----------------------
@@ -822,6 +933,12 @@ async def look(interaction: discord.Interaction):
     if result != "":
         await send_to_channel(cast(discord.TextChannel, thread or channel), result)
 
+@discord_tree.command(name="dgod_metrics", description="Show model latency, token and cost metrics for this bot.")
+async def dgod_metrics(interaction: discord.Interaction): 
+    metrics_str = ModelMetrics.dump()
+    if len(metrics_str) > 1990:
+        metrics_str = metrics_str[:1990]
+    await interaction.response.send_message(f"```\n{metrics_str}\n```", ephemeral=True)
 
 async def timer_update_func() -> None:
     last_update_time = datetime.min
@@ -857,5 +974,18 @@ async def timer_update_func() -> None:
 
         await asyncio.sleep(0.25)
 
+async def run_discord_client() -> None:
+    try:
+        async with discord_client:
+            await discord_client.start(DISCORD_TOKEN)
+    finally:
+        # Close the pooled LLM sessions on the bot's loop before it shuts down
+        await LLMClient.close_all()
+
 def run_discord_chatbot() -> None:
-    discord_client.run(DISCORD_TOKEN)
+    # Same as discord_client.run(), with the LLM sessions closed on shutdown
+    discord.utils.setup_logging()
+    try:
+        asyncio.run(run_discord_client())
+    except KeyboardInterrupt:
+        pass
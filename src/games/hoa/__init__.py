@@ -6,6 +6,7 @@ from games.hoa.game_hoa import GameHoa
 from games.hoa.lobby_hoa import LobbyHoa
 
 from agents.agent_openai_v1 import OpenAIAgentV1
+from agents.agent_mock_v1 import MockAgentV1
 
 from engine import EngineManager
 
@@ -24,3 +25,12 @@ def register_chatbot_hoa_openai_v1() -> None:
 
     EngineHoa.register_chatbot("openai_v1", chatbot_def)
 
+def register_chatbot_hoa_mock_v1() -> None:
+
+    chatbot_def: ChatbotDef = {
+        "create_chatbot_agent": MockAgentV1,
+        "create_chatbot_game": GameHoaOpenAIV1,
+        "create_chatbot_lobby": LobbyHoaOpenAIV1
+    }
+
+    EngineHoa.register_chatbot("mock_v1", chatbot_def)
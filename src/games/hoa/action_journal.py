@@ -0,0 +1,107 @@
+import random
+
+from config import config_all
+from game import Obj
+
+class JournalRandom:
+    """
+    The random numbers the game rules use (dice rolls etc.). Draws are recorded so the journal can store
+    them with each action, and when replaying an action the recorded draws are handed back in the same
+    order so the action has the same outcome it had the first time.
+    """
+
+    def __init__(self) -> None:
+        self.draws: list[float | int] = []
+        self.replay_draws: list[float | int] | None = None
+        self.replay_pos = 0
+        self.replay_ok = True
+
+    def draw(self, value: float | int) -> float | int:
+        if self.replay_draws is not None:
+            if self.replay_pos < len(self.replay_draws):
+                value = self.replay_draws[self.replay_pos]
+                self.replay_pos += 1
+            else:
+                self.replay_ok = False # More draws than the first time, the replay has diverged
+        else:
+            self.draws.append(value)
+        return value
+
+    def random(self) -> float:
+        return float(self.draw(random.random()))
+
+    def randint(self, a: int, b: int) -> int:
+        value = int(self.draw(random.randint(a, b)))
+        if value < a or value > b:
+            self.replay_ok = False
+            value = random.randint(a, b)
+        return value
+
+    def take_draws(self) -> list[float | int]:
+        draws = self.draws
+        self.draws = []
+        return draws
+
+    def start_replay(self, draws: list[float | int]) -> None:
+        self.replay_draws = draws
+        self.replay_pos = 0
+        self.replay_ok = True
+
+    def end_replay(self) -> bool:
+        ok = self.replay_ok and self.replay_draws is not None and self.replay_pos == len(self.replay_draws)
+        self.replay_draws = None
+        return ok
+
+class ActionJournal:
+    """
+    Event sourced saves. Every action run on the game, including failed ones (flagged with "error"), and
+    the engine hooks the driver calls between actions are recorded with their random draws. Between full
+    saves each save only writes the events since the previous one as a numbered journal entry for the full
+    save. Loading restores the full save then replays the entries through the engine (no model calls), which
+    gives back the exact game state.
+
+    Settings are in "game_saves" in config.yaml ("incremental: journal"). See also SaveTracker, which
+    decides when the full saves are written.
+    """
+
+    def __init__(self) -> None:
+        cfg: Obj = config_all.get("game_saves", {})
+        self.enabled: bool = cfg.get("incremental", "journal") == "journal"
+        self.rng = JournalRandom()
+        self.events: list[Obj] = []
+        self.num_entries = 0 # Entries written for the current full save
+        self.replaying = False
+        # Stats
+        self.events_recorded = 0
+        self.events_replayed = 0
+
+    @staticmethod
+    def get_entry_key(user_path: str, save_name: str, snapshot: str, index: int) -> str:
+        return f'{user_path}/save_game_journals/{save_name}-{snapshot}-{index:06d}'
+
+    def begin_event(self) -> None:
+        # Draws made outside of an event don't change the game state (and aren't replayed)
+        if not self.replaying:
+            self.rng.take_draws()
+
+    def record(self, event: Obj) -> None:
+        if self.replaying:
+            return
+        event["draws"] = self.rng.take_draws()
+        self.events.append(event)
+        self.events_recorded += 1
+
+    def make_entry(self, snapshot: str) -> Obj:
+        self.num_entries += 1
+        entry = { "base": snapshot, "index": self.num_entries, "events": self.events }
+        self.events = []
+        return entry
+
+    def get_entry_keys(self, user_path: str, save_name: str, snapshot: str) -> list[str]:
+        return [ ActionJournal.get_entry_key(user_path, save_name, snapshot, index)
+                    for index in range(1, self.num_entries + 1) ]
+
+    def saved_full(self) -> None:
+        # The full save has everything recorded so far
+        self.events = []
+        self.num_entries = 0
@@ -0,0 +1,83 @@
+from agent import StopStream
+from games.hoa.game_hoa import GameHoa
+from utils import extract_arguments
+
+class ActionStream:
+    """
+    Runs the actioner's 'call do_action(...)' lines on the game. Used either on a whole response with
+    run_text(), or as the chunk handler for the actioner query, in which case each line is run as soon as it
+    has finished streaming so the engine works while the model is still generating. Either way every action
+    line in the response is run, up to end_marker if one is given (the <NARRATION> of a single call turn).
+
+    When stop_after_actions is set a stream is closed at the end of the action block, the first line after an
+    action that isn't an action, blank or <HIDDEN> (e.g. a made up <RESPONSE>). The rest of the response is
+    dropped, actions included.
+    """
+
+    def __init__(self, game: GameHoa, stop_after_actions: bool = False, end_marker: str | None = None) -> None:
+        self.game = game
+        self.stop_after_actions = stop_after_actions
+        self.end_marker = end_marker
+        self.text = ""
+        self.partial_line = ""
+        self.actions_done = False
+        self.ended = False # No more actions are run from this response
+        self.stopped = False
+        self.prefix: str | None = None
+        self.results = ""
+        self.num_calls = 0
+        self.num_errors = 0
+
+    async def run_line(self, line: str) -> None:
+        line = line.strip()
+        line = line.replace("do\\_action", "do_action") # Some AI's have trouble with the _
+        if self.end_marker is not None and line == self.end_marker:
+            self.ended = True
+        elif "do_action(\"" in line:
+            if self.prefix is None:
+                self.prefix = self.game.get_response_prefix()
+            args = extract_arguments(line, 5)
+            game_resp, error = await self.game.do_action(args[0], args[1], args[2], args[3], args[4])
+            self.results += game_resp + "\n"
+            self.num_calls += 1
+            if error:
+                self.num_errors += 1
+        elif self.num_calls > 0 and line and line != "<HIDDEN>":
+            self.actions_done = True
+
+    async def run_text(self, text: str) -> None:
+        # Whole response at once
+        for line in text.split("\n"):
+            if self.ended:
+                break
+            await self.run_line(line)
+
+    async def __call__(self, content: str, chunk_time: float) -> None:
+        # Streaming chunk handler
+        self.text += content
+        self.partial_line += content
+        while "\n" in self.partial_line and not self.ended:
+            line, self.partial_line = self.partial_line.split("\n", 1)
+            await self.run_line(line)
+            if self.actions_done and self.stop_after_actions:
+                self.ended = True
+                self.stopped = True
+        if self.stopped:
+            raise StopStream()
+
+    async def finish_stream(self, response: str) -> str:
+        # Runs the last line (no newline at the end of a stream) if it's in the final response, it isn't if the
+        # stream failed part way or was cut off by the generation budget. Returns the response the actions came
+        # from, which is what was streamed if generate() failed.
+        last_line = self.partial_line.strip()
+        if not self.ended and last_line and response.rstrip(" \t\n").endswith(last_line):
+            await self.run_line(last_line)
+        self.partial_line = ""
+        return response or self.text
+
+    def get_results(self) -> str:
+        if self.prefix is None:
+            self.prefix = self.game.get_response_prefix()
+        if not self.game.skip_turn or self.num_calls > 1:
+            return self.prefix + self.results + self.game.after_process_actions()
+        return self.results
@@ -0,0 +1,71 @@
+import asyncio
+import copy
+
+from agents.llm_client import LLMClient
+from config import config_all
+from typing import Any, Awaitable, Callable
+
+class DialogPrefetcher:
+    """
+    Generates the Say/Ask dialog choice menus in the background so clicking the buttons answers straight away.
+    Menus are cached by conversation version plus GameHoa.get_dialog_choices_key() (location, script state, NPCs
+    present and the prompt), so a cached menu is never used once the conversation has moved on. Prefetches only
+    start while the model endpoint has free request slots so they don't hold up player queries. generate() must not
+    add anything to the conversation history, the driver does that when a menu is actually shown.
+
+    Defaults come from the top level "dialog_prefetch" in config.yaml and can be overridden with a
+    "dialog_prefetch" section in the model endpoint.
+    """
+
+    def __init__(self, model_endpoint: str) -> None:
+        cfg: dict[str, Any] = copy.deepcopy(config_all.get("dialog_prefetch", {}))
+        cfg.update(config_all["model_endpoints"][model_endpoint].get("dialog_prefetch", {}))
+        self.enabled: bool = cfg.get("enabled", False)
+        self.menus: list[str] = cfg.get("menus", [ "say_choices", "ask_choices" ])
+        self.max_entries: int = cfg.get("max_entries", 16)
+        self.client = LLMClient.get_client(model_endpoint)
+        self.version = 0
+        self.entries: dict[tuple, asyncio.Task[Any]] = {}
+        # Stats
+        self.prefetched = 0
+        self.hits = 0
+        self.misses = 0
+
+    def has_free_slots(self) -> bool:
+        # Leave at least one slot free for player queries
+        stats = self.client.stats
+        return stats.queue_depth == 0 and stats.in_flight < self.client.max_concurrency - 1
+
+    def set_version(self, version: int) -> None:
+        # Conversation moved on, drop (and stop) everything generated for the old one
+        if version == self.version:
+            return
+        self.version = version
+        for task in self.entries.values():
+            if not task.done():
+                task.cancel()
+        self.entries = {}
+
+    def prefetch(self, key: tuple, prompt: str, generate: Callable[[str], Awaitable[Any]]) -> None:
+        if not self.enabled or key in self.entries or len(self.entries) >= self.max_entries or not self.has_free_slots():
+            return
+        task = asyncio.create_task(generate(prompt))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception()) # Failures just mean a miss later
+        self.entries[key] = task
+        self.prefetched += 1
+
+    async def get(self, key: tuple, prompt: str, generate: Callable[[str], Awaitable[Any]]) -> Any:
+        # Uses a cached (or still running) prefetch if there is one, otherwise generates the menu now
+        task = self.entries.get(key)
+        if task is not None:
+            try:
+                text = await asyncio.shield(task)
+                self.hits += 1
+                return text
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise # We were cancelled, not the prefetch
+            except Exception:
+                self.entries.pop(key, None)
+        self.misses += 1
+        return await generate(prompt)
@@ -2,16 +2,43 @@ import copy
 import os
 import yaml
 
+from types import MappingProxyType
 from agent import Agent
+from agents.prompt_template import PromptTemplate
+from agents.tokenizers import Tokenizers
 from config import config_all
 from db_access import Db
 from engine import Engine
 from game import Game, ChatGameDriver
 from lobby import Lobby, ChatLobbyDriver
-from typing import Any, Callable, Type, TypedDict
+from typing import Any, Callable, Mapping, Type, TypedDict
 from user import User
 from utils import is_valid_filename
 
+# Prefix messages (rules/instructions for each mode) and the prompt each one uses
+PREFIX_PROMPTS: dict[str, tuple[str, str]] = {
+    "exploration": ("game", "exploration_prompt"),
+    "encounter": ("game", "encounter_prompt"),
+    "response": ("game", "response_prompt"),
+    "lobby": ("lobby", "lobby_prompt")
+}
+
+class PromptSet:
+    """
+    One loaded version of the chatbot prompts, shared by every session. The prefix messages built from it are
+    read only and cached per model, so sessions don't each hold a copy of the big prompts.
+    """
+
+    def __init__(self, version: int, game_prompts: dict[str, str], lobby_prompts: dict[str, str], mtimes: list[float]) -> None:
+        self.version = version
+        self.game_prompts = game_prompts
+        self.lobby_prompts = lobby_prompts
+        self.mtimes = mtimes
+        # Parsed once here, rendering just fills in the slots
+        self.game_templates = PromptTemplate.compile_all(game_prompts)
+        self.lobby_templates = PromptTemplate.compile_all(lobby_prompts)
+        self.prefixes: dict[tuple[str, str], tuple[Mapping[str, Any], ...]] = {}
+
 class ChatbotDef(TypedDict):
     create_chatbot_agent: Callable[[str, str], Agent]
     create_chatbot_game: Callable[[Engine, User, Agent, str, str, str, str], ChatGameDriver]
@@ -30,6 +57,7 @@ class EngineHoa(Engine):
         self.base_path = "data/games/hoa"
         self.agent_id = "default"
         self.model_id = "default"
+        self._prompt_set: PromptSet|None = None
         self.load_chatbot_prompts()
         self.rules: dict[str, Any] = {}
         with open(f"{self.base_path}/rules/rules.yaml", "r") as f:
@@ -59,11 +87,41 @@ class EngineHoa(Engine):
 
     @property
     def game_prompts(self) -> dict[str, str]:
-        return self._game_prompts
+        return self.prompt_set.game_prompts
 
     @property
     def lobby_prompts(self) -> dict[str, str]:
-        return self._lobby_prompts
+        return self.prompt_set.lobby_prompts
+
+    @property
+    def game_templates(self) -> dict[str, PromptTemplate]:
+        return self.prompt_set.game_templates
+
+    @property
+    def lobby_templates(self) -> dict[str, PromptTemplate]:
+        return self.prompt_set.lobby_templates
+
+    @property
+    def prompt_set(self) -> PromptSet:
+        assert self._prompt_set is not None
+        return self._prompt_set
+
+    @property
+    def prompts_version(self) -> int:
+        return self.prompt_set.version
+
+    def get_prefix(self, prefix_name: str, agent: Agent) -> list[Mapping[str, Any]]:
+        # Shared prefix messages for this prompt version (token counts depend on the model, so cached per model)
+        prompt_set = self.prompt_set
+        key = (prefix_name, agent.secondary_model_id)
+        prefix = prompt_set.prefixes.get(key)
+        if prefix is None:
+            prompts_type, prompt_name = PREFIX_PROMPTS[prefix_name]
+            prompts = (prompt_set.game_prompts if prompts_type == "game" else prompt_set.lobby_prompts)
+            msg = agent.make_message("user", prompts[prompt_name], "prefix", keep=True)
+            prefix = ( MappingProxyType(msg), )
+            prompt_set.prefixes[key] = prefix
+        return list(prefix)
 
     def set_defaults(self, party_name: str, module_name: str) -> None:
         self._default_party_name = party_name
@@ -74,11 +132,22 @@ class EngineHoa(Engine):
     def load_chatbot_prompts(self) -> None:
         # Will load prompts customized for the given chatbot agent type or chatbot type
         lobby_prompts_path = f"{self.base_path}/prompts/lobby_prompts.yaml"
-        with open(lobby_prompts_path, "r") as f:
-            self._lobby_prompts: dict[str, str] = yaml.load(f, Loader=yaml.FullLoader)
         game_prompts_path = f"{self.base_path}/prompts/game_prompts.yaml"
+        mtimes = [ os.path.getmtime(lobby_prompts_path), os.path.getmtime(game_prompts_path) ]
+        if self._prompt_set is not None and self._prompt_set.mtimes == mtimes:
+            return
+        with open(lobby_prompts_path, "r") as f:
+            lobby_prompts: dict[str, str] = yaml.load(f, Loader=yaml.FullLoader)
         with open(game_prompts_path, "r") as f:
-            self._game_prompts: dict[str, str] = yaml.load(f, Loader=yaml.FullLoader)
+            game_prompts: dict[str, str] = yaml.load(f, Loader=yaml.FullLoader)
+        # Pre-tokenize the big static prefix prompts so sessions don't tokenize them on start
+        Tokenizers.warm([ game_prompts["exploration_prompt"],
+                          game_prompts["encounter_prompt"],
+                          game_prompts["response_prompt"],
+                          lobby_prompts["lobby_prompt"] ])
+        # Swap in the new version in one step (sessions pick up the new prefixes on their next query)
+        version = (self._prompt_set.version + 1 if self._prompt_set is not None else 1)
+        self._prompt_set = PromptSet(version, game_prompts, lobby_prompts, mtimes)
 
     async def can_play_game(self, 
                       user: User, 
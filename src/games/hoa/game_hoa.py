@@ -1,18 +1,25 @@
 from db_access import Db
 from game import Game, Obj
 from .engine_hoa import EngineHoa
+from .object_registry import ObjectRegistry
+from .save_tracker import SaveTracker
+from .action_journal import ActionJournal
+from .location_views import LocationViews
+from agents.prompt_template import PromptTemplate
 from user import User
 import asyncio
+from collections import ChainMap
 import copy
 from datetime import datetime, timedelta
 import json
-from typing import Any, Awaitable, Callable,cast
+from typing import Any, Awaitable, Callable, Mapping, cast
+from types import MappingProxyType
 import random
 import yaml
 import re
 import pydash
 from utils import find_case_insensitive, find_with_terms, any_to_int, parse_date_time, \
-    time_difference_mins, escape_path_key, check_for_image, extract_arguments
+    time_difference_mins, check_for_image, extract_arguments, freeze
 
 def cur_value(obj: Obj, path: str, value: str) -> Any:
     return pydash.get(obj, path + ".cur_" + value) or pydash.get(obj, path + "." + value)
@@ -73,7 +80,12 @@ class GameHoa(Game):
         self.cur_location_script: Obj | None = None
         self.cur_encounter: Obj | None = None
         self.cur_location_enter_time = datetime.now()
-        self.object_map: Obj = {}
+        self.object_map = ObjectRegistry()
+        self.location_views = LocationViews()
+        self.shared_monster_types: dict[str, Obj] = {} # Read only, spawned monsters share their values
+        self.save_tracker = SaveTracker()
+        self.journal = ActionJournal()
+        self.rng = self.journal.rng # Random numbers that affect the game state (recorded in the journal)
         self.save_game_name = save_game_name
         self.game_state: Obj = {}
         self._action_image_path: str | None = None
@@ -84,6 +96,7 @@ class GameHoa(Game):
         self.cur_response_max_para = 0
         self.next_response_max_para = 0
         self.skip_turn = False
+        self.near_simple_action = False # Last parse_simple_action() matched some characters' actions but not all
         self._action_list: list[dict[str, Any]] = []
         self._exit_to_lobby = False        
         # Random encounter vars
@@ -244,6 +257,7 @@ class GameHoa(Game):
     # from a player 
     def parse_simple_action(self, query: str) -> list[tuple[str, list[str]]]|None:
 
+        self.near_simple_action = False
         if query == "":
             return None
 
@@ -283,6 +297,8 @@ class GameHoa(Game):
             char_query = char_queries[char_name]
             simple_action = self.parse_simple_action_line(char_query)
             if not simple_action:
+                # Some characters had simple actions (the query is probably a simple one)
+                self.near_simple_action = len(simple_actions) > 0
                 return None
             assert(simple_action != None)
             simple_actions.append(simple_action)
@@ -312,6 +328,7 @@ class GameHoa(Game):
     async def init_game(self) -> None:
         self.init_session_state()
         self.init_object_map()
+        self.location_views.clear()
         if self.cur_location_name != "":
             self.cur_location = self.module["locations"][self.cur_location_name]
             if self.cur_script_state:
@@ -331,6 +348,7 @@ class GameHoa(Game):
         assert not err and loaded_module is not None
         self.module = loaded_module
         self.rules = self.engine.rules
+        self.shared_monster_types = {}
         self.help_index = {}
         self.init_help_index()
 
@@ -359,27 +377,115 @@ class GameHoa(Game):
         for loc_name, loc in self.module["locations"].items():
             self.location_states[loc_name] = copy.deepcopy(loc.get("state", {}))     
         await self.init_game()
+        self.save_tracker.mark_all()
         await self.save_game(wait_done=True)
 
     async def load_game(self, save_name: str = "latest") -> None:
         save_key = f'{self.user.user_path}/save_games/{save_name}'
         game_state = await self.db.get(save_key)
         if game_state:
+            # Changes since the full save are in the delta (if it's based on this full save)
+            delta = await self.db.get(f'{self.user.user_path}/save_game_deltas/{save_name}')
+            if delta and delta.get("base") == game_state["state"].get("save_snapshot", ""):
+                SaveTracker.apply_delta(game_state, delta)
             self.game_state = game_state
+            self.save_tracker.mark_all()
             self.module_name = self.game_state["info"]["module_name"]
             self.party_name = self.game_state["info"]["party_name"]
             await self.load_module()
             await self.init_game()
+            # ..or in the journal
+            await self.replay_journal(save_name)
         else:
             await self.new_game()
 
+    async def replay_journal(self, save_name: str) -> None:
+        # Runs the journaled events since the full save back through the engine
+        journal = self.journal
+        snapshot = self.game_state["state"].get("save_snapshot", "")
+        journal.replaying = True
+        try:
+            while True:
+                entry_key = ActionJournal.get_entry_key(self.user.user_path, save_name, snapshot, journal.num_entries + 1)
+                entry = await self.db.get(entry_key)
+                if not entry or entry.get("base") != snapshot:
+                    break
+                journal.num_entries += 1
+                for event in entry["events"]:
+                    ok = await self.replay_journal_event(event)
+                    journal.events_replayed += 1
+                    if not ok and self.engine.logging:
+                        print(f"  JOURNAL: replay of {event} in {entry_key} didn't match the original")
+        finally:
+            journal.replaying = False
+        self.clear_action_list()
+        self.action_image_path = None
+
+    async def replay_journal_event(self, event: Obj) -> bool:
+        self.rng.start_replay(event.get("draws", []))
+        error = False
+        match event.get("hook"):
+            case "after_process_actions":
+                self.after_process_actions()
+            case "get_addl_response":
+                self.get_addl_response()
+            case _:
+                _, error = await self.do_action(event["action"], event["arg1"], event["arg2"], event["arg3"], event["arg4"])
+        return self.rng.end_replay() and error == event.get("error", False)
+
     async def save_game(self, save_name: str = "latest", wait_done: bool = False) -> None:
+        if self.journal.replaying:
+            return
         save_key = f'{self.user.user_path}/save_games/{save_name}'
-        if wait_done:
-            await self.db.put(save_key, self.game_state)
+        tracker = self.save_tracker
+        # Where the party is is always saved (its script state etc. are changed in place)
+        if self.cur_location_name:
+            tracker.mark("location_states", self.cur_location_name)
+        snapshot = self.game_state["state"].get("save_snapshot", "")
+        if save_name != "latest" or tracker.needs_full_save():
+            stale_keys: list[str] = []
+            if save_name == "latest":
+                stale_keys = self.journal.get_entry_keys(self.user.user_path, save_name, snapshot)
+                self.game_state["state"]["save_snapshot"] = SaveTracker.new_snapshot_id()
+            if wait_done:
+                await self.write_full_save(save_key, self.game_state, stale_keys)
+            else:
+                # If we're going to do this async, make a copy of the state first
+                asyncio.create_task(self.write_full_save(save_key, copy.deepcopy(self.game_state), stale_keys))
+            if save_name == "latest":
+                tracker.saved_full()
+                self.journal.saved_full()
+        elif self.journal.enabled:
+            # Only the events since the last save
+            entry = self.journal.make_entry(snapshot)
+            entry_key = ActionJournal.get_entry_key(self.user.user_path, save_name, snapshot, entry["index"])
+            if wait_done:
+                await self.db.put(entry_key, entry)
+            else:
+                asyncio.create_task(self.db.put(entry_key, entry))
+            tracker.saved_delta()
         else:
-            # If we're going to do this async, make a copy of the state first
-            asyncio.create_task(self.db.put(save_key, copy.deepcopy(self.game_state)))
+            # Only the small sections and the objects changed since the last full save
+            delta_key = f'{self.user.user_path}/save_game_deltas/{save_name}'
+            delta = tracker.make_delta(self.game_state, snapshot, copy_state=not wait_done)
+            if wait_done:
+                await self.db.put(delta_key, delta)
+            else:
+                asyncio.create_task(self.db.put(delta_key, delta))
+            tracker.saved_delta()
+
+    async def write_full_save(self, save_key: str, game_state: Obj, stale_keys: list[str]) -> None:
+        await self.db.put(save_key, game_state)
+        # The journal entries for the previous full save aren't needed now
+        for key in stale_keys:
+            await self.db.delete(key)
+
+    def mark_object_dirty(self, obj: Obj | None) -> None:
+        # Marks the character, npc, monster or location state holding obj as changed (for the next save)
+        while obj is not None and obj.get("type") == "item":
+            obj = self.get_object_parent(obj["unique_name"])
+        if obj is not None and obj.get("type") in [ "character", "npc", "monster", "location_state" ]:
+            self.save_tracker.mark(obj["type"] + "s", obj["unique_name"])
 
     def init_session_state(self) -> None:
         # Temporary session states (disappear when session is over)
@@ -568,6 +674,10 @@ class GameHoa(Game):
                 return pydash.get(target, path)
 
     def set_state_value(self, target: Obj, path: str, value: Any) -> None:
+        self.mark_object_dirty(target)
+        self.own_monster_value(target, path.split(".")[0])
+        if target.get("type") == "location_state":
+            self.location_views.changed(target["unique_name"])
         match path:
             case "stats.basic.cur_health":
                 self.set_cur_health(target, value)
@@ -610,12 +720,15 @@ class GameHoa(Game):
         parent_type = parent["type"]
         parent_unique_name = parent["unique_name"]
         assert parent_type in [ "monster", "character", "npc", "location_state", "item" ]
+        self.mark_object_dirty(parent)
         prev_parent_unique_name = item.get("parent")
         if prev_parent_unique_name == parent_unique_name:
             # already here
             return ("ok", False)
         if prev_parent_unique_name is not None:
-            prev_parent = self.get_object(prev_parent_unique_name)
+            # The item's own parent field first (items copied in from rules or older saves may not be registered)
+            prev_parent = self.get_object(prev_parent_unique_name) or \
+                self.get_object_parent(item.get("unique_name", ""))
             if prev_parent is None:
                 return (f"Parent object doesn't exist", True)
             # Note, if this is a qty item like arrows, a "new" item might be returned with the given qty.
@@ -639,6 +752,7 @@ class GameHoa(Game):
     def remove_item(self, parent: Obj, item: Obj | str, qty: int | None = None) -> tuple[Obj|None, str, bool]:
         # TODO: Fix general add/remove
         assert parent["type"] in [ "monster", "character", "npc", "location_state", "item" ]
+        self.mark_object_dirty(parent)
         if isinstance(item, str):
             item_name: str = item
             _, item = find_case_insensitive(parent["items"], item)
@@ -686,7 +800,7 @@ class GameHoa(Game):
                 item_descs.append(item_name)       
         return item_descs 
 
-    def get_usable_items(self, char: Obj) -> list[Obj]:
+    def get_usable_items(self, char: Obj) -> list[Mapping[str, Any]]:
         usable_items = []
         for item in char["items"].values():
             merged_item = self.get_merged_item(item)
@@ -708,6 +822,7 @@ class GameHoa(Game):
             if "items" not in new_loc_state:
                 new_loc_state["items"] = {}
             self.game_state["location_states"][new_loc_name] = new_loc_state
+            self.save_tracker.mark("location_states", new_loc_name)
         self.prev_location_name = self.cur_location_name
         self.prev_area_name = self.cur_area_name
         self.cur_location_name = new_loc_name
@@ -742,7 +857,15 @@ class GameHoa(Game):
             target[npc_name] = target.get(npc_name, {})
             target[npc_name].update(npc_topics)
 
+    def get_location_view(self, view_name: str, make_view: Callable[[], Any]) -> Any:
+        # Merged views of the current location are cached until the location, script state or location state
+        # changes, and are shared (don't modify them)
+        return self.location_views.get(self.cur_location_name, self.cur_script_state, view_name, make_view)
+
     def get_merged_topics(self) -> dict[str, dict[str, str]]:
+        return self.get_location_view("topics", self.make_merged_topics)
+
+    def make_merged_topics(self) -> dict[str, dict[str, str]]:
         all_topics: dict[str, dict[str,str]] = {}
         npcs = self.cur_location.get("npcs", [])
         npc_topics: dict[str, dict[str,str]] = {}
@@ -815,15 +938,25 @@ class GameHoa(Game):
                 chars.append(char)
         if len(chars) == 0:
             return None
-        rand_idx = random.randint(0, len(chars) - 1)
+        rand_idx = self.rng.randint(0, len(chars) - 1)
         return chars[rand_idx]
 
     def get_monster_type(self, monster_type_name: str) -> Obj:
-        monst_type = self.module_monster_types.get(monster_type_name) or \
-            self.monster_types.get(monster_type_name)
+        monst_type = self.find_monster_type(monster_type_name)
         assert monst_type is not None
         return monst_type
 
+    def find_monster_type(self, monster_type_name: str) -> Obj|None:
+        # Monsters share their type's values, so the type is read only (see own_monster_value())
+        monst_type = self.shared_monster_types.get(monster_type_name)
+        if monst_type is None:
+            monst_type = self.module_monster_types.get(monster_type_name) or \
+                self.monster_types.get(monster_type_name)
+            if monst_type is None:
+                return None
+            monst_type = self.shared_monster_types[monster_type_name] = freeze(monst_type)
+        return monst_type
+
     @staticmethod
     def make_image_tag(image: str) -> str:
         if image == "":
@@ -852,28 +985,27 @@ class GameHoa(Game):
         image_path = check_for_image(self.parties_path + "/images", name, type_name)
         return image_path
 
-    @staticmethod
-    def die_roll(dice: str, advantage_disadvantage = None) -> int:
+    def die_roll(self, dice: str, advantage_disadvantage = None) -> int:
         if advantage_disadvantage:
             if advantage_disadvantage == "advantage":
-                return max(GameHoa.die_roll(dice), GameHoa.die_roll(dice))
+                return max(self.die_roll(dice), self.die_roll(dice))
             elif advantage_disadvantage == "disadvantage":
-                return min(GameHoa.die_roll(dice), GameHoa.die_roll(dice))
+                return min(self.die_roll(dice), self.die_roll(dice))
             else:
                 raise RuntimeError("Invalid advantage/disadvantage id")
         if dice is None or dice == "":
             return 0
         match dice:
             case "d4":
-                return random.randint(1, 4)
+                return self.rng.randint(1, 4)
             case "d6":
-                return random.randint(1, 6)
+                return self.rng.randint(1, 6)
             case "d8":
-                return random.randint(1, 8)
+                return self.rng.randint(1, 8)
             case "d12":
-                return random.randint(1, 12)
+                return self.rng.randint(1, 12)
             case "d20":
-                return random.randint(1, 20)
+                return self.rng.randint(1, 20)
         return 0
 
     def is_character_name(self, maybe_char_name: str) -> bool:
@@ -954,13 +1086,12 @@ class GameHoa(Game):
             return ( "abilities", pydash.get(being, "stats.abilities." + skill_ability, ""), advantage_disadvantage or "" )
         return ( "", "", "" )
     
-    @staticmethod
-    def skill_ability_check(being: Obj, skill_ability: str, against: int) -> tuple[str, bool]:
+    def skill_ability_check(self, being: Obj, skill_ability: str, against: int) -> tuple[str, bool]:
         _, mod_die, adv_dis = GameHoa.get_skill_ability_modifier(being, skill_ability)
         if mod_die is None:
             return (f"no skill or ability {skill_ability}", False)
-        d20_roll = GameHoa.die_roll("d20", adv_dis)
-        mod_roll = GameHoa.die_roll(mod_die)
+        d20_roll = self.die_roll("d20", adv_dis)
+        mod_roll = self.die_roll(mod_die)
         success = d20_roll + mod_roll >= against
         resp = f"Rolled {skill_ability} check d20 {d20_roll} {adv_dis} + {mod_die} {mod_roll} = {d20_roll + mod_roll} vs {against} - "
         if success:
@@ -969,18 +1100,17 @@ class GameHoa(Game):
             resp += "FAILED!"
         return (resp, success)
 
-    @staticmethod
-    def skill_ability_check_against(being: Obj, skill_ability1: str, target: Obj, skill_ability2: str) -> tuple[str, bool]:
+    def skill_ability_check_against(self, being: Obj, skill_ability1: str, target: Obj, skill_ability2: str) -> tuple[str, bool]:
         _, mod_die1, adv_dis1 = GameHoa.get_skill_ability_modifier(being, skill_ability2)
         if mod_die1 is None:
             return (f"no skill or ability {skill_ability1}", False)
-        d20_roll1 = GameHoa.die_roll("d20", adv_dis1)
-        mod_roll1 = GameHoa.die_roll(mod_die1)
+        d20_roll1 = self.die_roll("d20", adv_dis1)
+        mod_roll1 = self.die_roll(mod_die1)
         _, mod_die2, adv_dis2 = GameHoa.get_skill_ability_modifier(target, skill_ability2)
         if mod_die2 is None:
             return (f"no skill or ability {skill_ability2}", False)
-        d20_roll2 = GameHoa.die_roll("d20", adv_dis2)
-        mod_roll2 = GameHoa.die_roll(mod_die2)
+        d20_roll2 = self.die_roll("d20", adv_dis2)
+        mod_roll2 = self.die_roll(mod_die2)
         success = d20_roll1 + mod_roll1 >= d20_roll2 + mod_roll2
         being_name = GameHoa.get_encounter_or_normal_name(being)
         target_name = GameHoa.get_encounter_or_normal_name(target)
@@ -1021,6 +1151,7 @@ class GameHoa(Game):
     def set_is_dead(self, being: Obj, dead: bool) -> None:
         if GameHoa.is_dead(being):
             return
+        self.mark_object_dirty(being)
         being["dead"] = dead
         # Add the npc, char, monster's corpse to the items in the room. Make sure their inventory is still
         # accessible
@@ -1033,10 +1164,10 @@ class GameHoa(Game):
     def has_escaped(being: Obj) -> bool:
         return being["encounter"].get("escaped", False)
 
-    @staticmethod
-    def set_has_escaped(being: Obj, escaped: bool) -> None:
+    def set_has_escaped(self, being: Obj, escaped: bool) -> None:
         if GameHoa.has_escaped(being) == escaped:
             return
+        self.mark_object_dirty(being)
         being["encounter"]["escaped"] = escaped
 
     @staticmethod
@@ -1065,10 +1196,9 @@ class GameHoa(Game):
 
     @staticmethod
     def get_cur_health(being: Obj) -> int:
+        # Read only, monsters' stats can be shared with their monster type
         basic_stats = being["stats"]["basic"]
-        if "cur_health" not in basic_stats:
-            basic_stats["cur_health"] = basic_stats["health"]
-        return basic_stats["cur_health"]
+        return basic_stats.get("cur_health", basic_stats["health"])
 
     @staticmethod
     def can_do_actions(being: Obj) -> tuple[str, bool]:
@@ -1094,11 +1224,11 @@ class GameHoa(Game):
     @staticmethod
     def get_cur_defense(being: Obj) -> str:
         basic_stats = being["stats"]["basic"]
-        if "cur_defense" not in basic_stats:
-            basic_stats["cur_defense"] = basic_stats["defense"]
-        return basic_stats["cur_defense"]
+        return basic_stats.get("cur_defense", basic_stats["defense"])
 
     def set_cur_health(self, being: Obj, value: int) -> int:
+        self.mark_object_dirty(being)
+        self.own_monster_value(being, "stats")
         basic_stats = being["stats"]["basic"]
         if "cur_health" not in basic_stats:
             basic_stats["cur_health"] = basic_stats["health"]
@@ -1119,9 +1249,11 @@ class GameHoa(Game):
         return chars_alive
     
     def merge_monster(self, monster_name: str, monster_def: Obj) -> Obj:
+        # The monster shares its type's values until it changes one (see own_monster_value())
         monster_type = monster_def["monster_type"]
-        monster_merged = copy.deepcopy(self.get_monster_type(monster_type))
+        monster_merged = dict(self.get_monster_type(monster_type))
         monster_merged.update(monster_def)
+        monster_merged["items"] = copy.deepcopy(monster_merged.get("items", {}))
         monster_name_no_number = monster_name.strip("0123456789 ")
         monster_merged["name"] = monster_name_no_number
         if monster_name_no_number == monster_type or monster_name_no_number in self.object_map:
@@ -1144,17 +1276,38 @@ class GameHoa(Game):
         weapon_name = attacker["equipped"].get(attack_type + "_weapon")
         return weapon_name is not None
 
-    def get_merged_item(self, org_item: Obj) -> Obj:
+    def get_merged_item(self, org_item: Obj) -> Mapping[str, Any]:
+        # Read only view of the item over its rules equipment entry (nothing is copied)
         item_name = strip_unique_id(org_item["name"])
         if "rules_item" in org_item:
             rules_item_name = org_item["rules_item"]
         else:
             rules_item_name = item_name
-        item = copy.deepcopy(self.rules["equipment"].get(rules_item_name, {}))
-        item.update(org_item)
-        return item      
+        return MappingProxyType(ChainMap(org_item, self.rules["equipment"].get(rules_item_name, {})))
 
-    def get_merged_equipped_weapon(self, attacker: Obj, attack_type: str) -> Obj|None:
+    def own_monster_value(self, being: Obj, key: str) -> None:
+        # Monsters share the values of their monster type, copy one before it's changed
+        if being.get("type") != "monster" or "monster_type" not in being:
+            return
+        shared_value = self.get_monster_type(being["monster_type"]).get(key)
+        if shared_value is not None and being.get(key) is shared_value:
+            being[key] = copy.deepcopy(shared_value)
+
+    def share_monster_values(self, monster: Obj) -> None:
+        # Loaded monsters share the values that are still the same as their monster type's
+        monster_type = self.find_monster_type(monster.get("monster_type", ""))
+        if monster_type is None:
+            return
+        for key, value in monster_type.items():
+            if key not in monster or monster[key] is value:
+                continue
+            if monster[key] == value:
+                monster[key] = value
+            elif isinstance(monster[key], dict):
+                # Saves can alias values monsters shared with a monster type that has since changed
+                monster[key] = copy.deepcopy(monster[key])
+
+    def get_merged_equipped_weapon(self, attacker: Obj, attack_type: str) -> Mapping[str, Any]|None:
         # attack_type is "melee" or "ranged"
         if GameHoa.is_monster(attacker):
             if attack_type == "melee":
@@ -1171,6 +1324,9 @@ class GameHoa(Game):
         return weapon
     
     def get_merged_exits(self) -> Obj:
+        return self.get_location_view("exits", self.make_merged_exits)
+
+    def make_merged_exits(self) -> Obj:
         exits = copy.deepcopy(self.cur_location.get("exits", {}))
         if self.cur_location_script and "exits" in self.cur_location_script:
             exits.update(self.cur_location_script["exits"])
@@ -1179,6 +1335,9 @@ class GameHoa(Game):
         return exits
 
     def get_merged_npcs(self) -> list[str]:
+        return self.get_location_view("npcs", self.make_merged_npcs)
+
+    def make_merged_npcs(self) -> list[str]:
         npcs = copy.deepcopy(self.cur_location.get("npcs", []))
         if self.cur_location_script and "npcs" in self.cur_location_script:
             npcs += self.cur_location_script["npcs"]
@@ -1187,6 +1346,9 @@ class GameHoa(Game):
         return npcs
 
     def get_merged_usables(self) -> dict[str, Any]:
+        return self.get_location_view("usables", self.make_merged_usables)
+
+    def make_merged_usables(self) -> dict[str, Any]:
         usables = copy.deepcopy(self.cur_location.get("usables", {}))
         if self.cur_location_script and "usables" in self.cur_location_script:
             usables.update(self.cur_location_script["usables"])
@@ -1195,6 +1357,9 @@ class GameHoa(Game):
         return usables
     
     def get_merged_poi(self) -> dict[str, Any]:
+        return self.get_location_view("poi", self.make_merged_poi)
+
+    def make_merged_poi(self) -> dict[str, Any]:
         poi = copy.deepcopy(self.cur_location.get("poi", {}))
         if self.cur_location_script and "poi" in self.cur_location_script:
             poi.update(self.cur_location_script["poi"])
@@ -1210,7 +1375,18 @@ class GameHoa(Game):
         if self.cur_area and "dialog_hints" in self.cur_area:
             return self.cur_area["dialog_hints"]
         return ""
-    
+
+    def get_dialog_choices_prompt(self, menu: str, char_name: str) -> str:
+        # menu is "say_choices" or "ask_choices"
+        return PromptTemplate.get(self.prompts[menu + "_prompt"]).render(char_name=char_name)
+
+    def get_dialog_choices_key(self, prompt: str) -> tuple:
+        # What a dialog choices menu depends on other than the conversation so far (the prompt has the menu and character)
+        return (self.cur_location_name, self.cur_script_state, tuple(self.get_merged_npcs()), prompt)
+
+    def has_dialog_npcs(self) -> bool:
+        return len(self.cur_location.get("npcs", [])) > 0
+
     def get_story_summary(self) -> str:
         if self.cur_location_script and "story_summary" in self.cur_location_script:
             return self.cur_location_script["story_summary"]
@@ -1300,19 +1476,9 @@ class GameHoa(Game):
             unique_name = obj["unique_name"]
         return unique_name
     
-    def make_object_path(self, obj: Obj) -> str:
-        key = escape_path_key(obj["unique_name"])
-        obj_type = obj["type"]
-        if obj_type == "item":
-            parent_unique_name = obj["parent"]
-            parent_path = self.object_map.get(parent_unique_name)
-            assert parent_path is not None
-            return f"{parent_path}.items.{key}"
-        else:
-            return f"{obj_type}s.{key}"
-
     # Char, Monster, NPC Items
     def add_object_items(self, parent: Obj, items: Obj) -> None:
+        self.mark_object_dirty(parent)
         parent_unique_name = parent["unique_name"]
         parent["items"] = parent_items = parent.get("items", {})
         items_copy = copy.deepcopy(items)
@@ -1326,7 +1492,7 @@ class GameHoa(Game):
             parent_items[item_unique_name] = item
 
     def init_object_map(self) -> None:
-        self.object_map = {}
+        self.object_map.clear()
         self.game_state["state"]["last_object_uid"] = 1000
         for obj_type in [ "character", "monster", "npc", "game_state", "location_state" ]:
             obj_dict_name = f"{obj_type}s"
@@ -1335,6 +1501,8 @@ class GameHoa(Game):
                 obj["name"] = obj_name
                 obj["unique_name"] = obj_name
                 obj["type"] = obj_type
+                if obj_type == "monster":
+                    self.share_monster_values(obj)
                 self.add_to_object_map(obj)
                 obj_items = obj.get("items", {})
                 obj["items"] = {}
@@ -1343,7 +1511,7 @@ class GameHoa(Game):
     def remove_from_object_map(self, obj: Obj) -> None:
         unique_name = obj["unique_name"]
         assert obj["type"] not in [ "location_state", "npc" ] # These can't be removed!
-        del self.object_map[unique_name]
+        self.object_map.remove(unique_name)
         if "items" in obj:
             items = obj["items"]
             for item in items.values():
@@ -1358,16 +1526,19 @@ class GameHoa(Game):
                 unique_name = self.get_or_add_unique_name(obj_name, obj)
             else:
                 unique_name = obj["unique_name"] = obj["name"]
-        path = self.make_object_path(obj)                
-        self.object_map[unique_name] = path
+        parent: Obj | None = None
+        if obj_type == "item":
+            parent = self.object_map.get(obj["parent"])
+            assert parent is not None
+        self.object_map.add(unique_name, obj, parent)
 
     def get_object(self, unique_name: str) -> Obj | None:
         if unique_name is None:
             return None
-        path = self.object_map.get(unique_name)
-        if path is None:
-            return None
-        return pydash.get(self.game_state, path)
+        return self.object_map.get(unique_name)
+
+    def get_object_parent(self, unique_name: str) -> Obj | None:
+        return self.object_map.get_parent(unique_name)
 
     # EFFECTS ----------------------------------------------------------
 
@@ -1425,7 +1596,7 @@ class GameHoa(Game):
             raise RuntimeError(f"invalid effect mode")
         value = mod[key or mode]
         if (mode == "add" or mode == "sub") and isinstance(value, str):
-            value = GameHoa.die_roll(value)
+            value = self.die_roll(value)
         if mode != "set" and prev_value is None:
             var_path_items = path.split(".")[-1]
             var_name = var_path_items[-1]
@@ -1455,14 +1626,16 @@ class GameHoa(Game):
             new_value = int(prev_value * value)
             self.set_state_value(target, path, new_value)
         elif mode == "append":
-            prev_value.append(copy.deepcopy(value))
-            new_value = prev_value
+            new_value = prev_value + [ copy.deepcopy(value) ]
+            self.set_state_value(target, path, new_value)
         elif mode == "or":
             if isinstance(value, bool):
                 new_value = prev_value or value
             elif value not in prev_value:
-                prev_value.append(copy.deepcopy(value))
+                new_value = prev_value + [ copy.deepcopy(value) ]
+            else:
                 new_value = prev_value
+            self.set_state_value(target, path, new_value)
         return new_value
 
     def apply_effect_mods(self, target: Obj, path: str, mod_list: list[Obj]) -> Any:
@@ -1476,7 +1649,7 @@ class GameHoa(Game):
         match effect_id:
             case "heal":
                 die = effect_def["heal"]["die"]
-                value = GameHoa.die_roll(die)
+                value = self.die_roll(die)
                 new_health = self.set_cur_health(target, self.get_cur_health(target) + value)
                 max_health = target["stats"]["basic"]["health"]
                 if new_health == max_health:
@@ -1485,7 +1658,7 @@ class GameHoa(Game):
                     return (f" - heal {die} {value} - new health is: {new_health} (of max: {max_health})\n", False)
             case "damage":
                 die = effect_def["damage"]["die"]
-                value = GameHoa.die_roll(die)
+                value = self.die_roll(die)
                 new_health = self.set_cur_health(target, self.get_cur_health(target) - value)
                 max_health = target["stats"]["basic"]["health"]
                 if new_health == 0:
@@ -1571,6 +1744,7 @@ class GameHoa(Game):
             target = self.get_object(unique_target_name)
             if target is None:
                 continue
+            self.mark_object_dirty(target)
             # We remove the modifier for the given property path, and recaculate the value of 
             # the target path after it's removed
             for mod_path in effect_target.get("mod_paths", []):
@@ -1583,7 +1757,6 @@ class GameHoa(Game):
                 if del_idx is not None:
                     del mod_list[del_idx]
                     self.apply_effect_mods(target, mod_path, mod_list)             
-        self.effects.remove(effect)
 
     def update_effect(self, effect: Obj) -> None:
         # TODO: Implement ME!
@@ -1591,7 +1764,7 @@ class GameHoa(Game):
 
     def update_effect_list(self, effect_list: list) -> None:
         remove_list = []
-        for effect_idx, effect in enumerate(self.effects):
+        for effect_idx, effect in enumerate(effect_list):
             remove = False
             duration = effect.get("duration")
             if duration is not None:
@@ -1627,7 +1800,7 @@ class GameHoa(Game):
     def update_all_effects(self) -> None:
         self.update_effect_list(self.game_state["effects"])
         if self.cur_encounter is not None:
-            self.update_effect_list(self.cur_encounter["effects"])
+            self.update_effect_list(self.cur_encounter.get("effects", []))
 
     def check_requirements(self, being: Obj, source: Obj, targets: list[Obj]) -> tuple[str, bool]:
         require = source.get("require", [])
@@ -1639,7 +1812,7 @@ class GameHoa(Game):
                     for index, target in reversed(list(enumerate(targets))):
                         skill_ability1 = check.get("skill1") or check.get("ability1")
                         skill_ability2 = check.get("skill2") or check.get("ability2")
-                        check_resp, success = GameHoa.skill_ability_check_against(being, skill_ability1, target, skill_ability2)
+                        check_resp, success = self.skill_ability_check_against(being, skill_ability1, target, skill_ability2)
                         resp = resp + check_resp + "\n"
                         if not success:
                             del targets[index]
@@ -1648,7 +1821,7 @@ class GameHoa(Game):
                 else:
                     skill_ability = check.get("skill") or check.get("ability")
                     roll_against = check["roll"]
-                    check_resp, success = GameHoa.skill_ability_check(being, skill_ability, roll_against)
+                    check_resp, success = self.skill_ability_check(being, skill_ability, roll_against)
                     resp = resp + check_resp + "\n"
                     if not success:
                         return (resp, True)
@@ -1690,6 +1863,7 @@ class GameHoa(Game):
         # Make sure we've marked all NPCs as "known" by the players once they've seen them
         for npc_name in all_npcs:
             self.game_state["npcs"][npc_name]["has_player_met"] = True
+            self.save_tracker.mark("npcs", npc_name)
         instr = self.cur_location.get("instructions", "").strip(" \n\t")
         if self.cur_location_script is not None and "instructions" in self.cur_location_script:
             if instr != "":
@@ -1776,9 +1950,9 @@ class GameHoa(Game):
         if weapon_type != "Melee Weapon" and weapon_type != "Ranged Weapon":
             return (f"You can't equip {weapon_name}", True)
         if weapon_type == "Melee Weapon":
-            char["eqipped"]["melee_weapon"] = weapon_name
+            self.set_state_value(char, "eqipped.melee_weapon", weapon_name)
         else:
-            char["eqipped"]["ranged_weapon"] = weapon_name
+            self.set_state_value(char, "eqipped.ranged_weapon", weapon_name)
         return ("ok", False)
 
     def give(self, from_name: str, to_name: str, item_name: Any, extra: Any) -> tuple[str, bool]:
@@ -1837,7 +2011,7 @@ class GameHoa(Game):
                 case _:
                     raise RuntimeError("Invalid help index type")
         else:
-            no_help_resp = self.prompts["no_help_response"].replace("{subject}", subject)
+            no_help_resp = PromptTemplate.get(self.prompts["no_help_response"]).render(subject=subject)
             resp, err = (no_help_resp, False)
         if err:
             return (resp, err)
@@ -2082,7 +2256,7 @@ class GameHoa(Game):
             return ("", False)
 
     def skill_check(self, character: str, skill: str) -> tuple[str, bool]:
-        if random.random() > 0.5:
+        if self.rng.random() > 0.5:
             return ("succeded", False)
         else:
             return ("failed", False)
@@ -2133,6 +2307,7 @@ class GameHoa(Game):
                 self.cur_location_state["exits"] = copy.deepcopy(self.cur_location.get("exits", {}))
             found_exits_list = "found exits " + json.dumps(list(found_exits.keys())).strip("[]") + "\n"
             self.cur_location_state["exits"].update(found_exits)
+            self.location_views.changed(self.cur_location_name)
         del self.cur_location_state["hidden"][found_idx]
         if "image" in found_state:
             self._action_image_path = check_for_image(self.module_path, found_state["image"])
@@ -2517,7 +2692,7 @@ class GameHoa(Game):
                             ("@items", "Item", "", "item"),
                             ("@info", "Info", "", "imfo"),
                             ("@menu", "Menu", "", "menu") ]
-                has_npcs = len(self.cur_location.get("npcs", [])) > 0
+                has_npcs = self.has_dialog_npcs()
                 for action, action_name, phrase, next_state in actions:
                     button = {}
                     if (action == "say" or action == "ask") and not has_npcs:
@@ -2555,8 +2730,8 @@ class GameHoa(Game):
                     state["buttons"].append(button)
                 return ("", True)
             case "say_choices":
-                char_name = state["subject"]
-                prompt = self.prompts["say_choices_prompt"].replace("{char_name}", char_name)
+                char_name = state["subject"] or char_name
+                prompt = self.get_dialog_choices_prompt("say_choices", char_name)
                 text = await generate(prompt)
                 choices = text.strip("\n").split("\n")[:6]
                 fmt_choices = []
@@ -2576,8 +2751,8 @@ class GameHoa(Game):
                 state["choices"] = "\n".join(fmt_choices) + "\n"            
                 return ("", True)
             case "ask_choices":
-                char_name = state["subject"]
-                prompt = self.prompts["ask_choices_prompt"].replace("{char_name}", char_name)
+                char_name = state["subject"] or char_name
+                prompt = self.get_dialog_choices_prompt("ask_choices", char_name)
                 text = await generate(prompt)
                 choices = text.strip("\n").split("\n")[:6]
                 fmt_choices = []
@@ -2756,6 +2931,7 @@ class GameHoa(Game):
         # Initiative? For now players first..
         self.cur_encounter["turn"] = "players" 
         self.cur_encounter["round"] = 1
+        self.save_tracker.mark_all() # Touched every being
         return ("ok", False)
     
     def describe_encounter(self) -> str:
@@ -2820,6 +2996,7 @@ class GameHoa(Game):
             char.pop("encounter", None)
         for npc in self.game_state["npcs"].values():
             npc.pop("encounter", None)
+        self.save_tracker.mark_all() # Touched every being
         self.game_state["encounter"] = None
         self.cur_encounter = None
         self.cur_game_state_name = "exploration"
@@ -2903,6 +3080,7 @@ class GameHoa(Game):
     def range_band_move(self, being_name: str, being: Obj, range_band_delta: int) -> tuple[int, bool, str]:
         closest_monster, closest_character = self.get_closest_ranges()
         assert self.cur_encounter is not None
+        self.mark_object_dirty(being)
         min_range = self.cur_encounter["min_range"]
         max_range = self.cur_encounter["max_range"]
         resp = ""
@@ -2913,7 +3091,7 @@ class GameHoa(Game):
                 new_range = closest_monster
             escaped = False
             if new_range > max_range:
-                GameHoa.set_has_escaped(being, True)
+                self.set_has_escaped(being, True)
                 resp = f"'{being_name}' has escaped!"
                 escaped = True
             else:
@@ -2932,7 +3110,7 @@ class GameHoa(Game):
                 new_range = closest_character
             escaped = False
             if new_range < min_range:
-                GameHoa.set_has_escaped(being, True)
+                self.set_has_escaped(being, True)
                 resp = f"'{being_name}' has escaped!"
                 escaped = True
             else:
@@ -3050,6 +3228,7 @@ class GameHoa(Game):
     def mark_encounter_moved(self, attacker: Obj) -> None:
         if self.cur_game_state_name == "encounter": 
             assert self.cur_encounter is not None
+            self.mark_object_dirty(attacker)
             attacker["encounter"]["moved_round"] = self.cur_encounter["round"]
 
     def check_encounter_next_turn(self, resp: str) -> tuple[str, bool]:
@@ -3122,8 +3301,8 @@ class GameHoa(Game):
             if weapon is None:
                 return (f"'{move}' FAILED - '{attacker_name}' does not have a {attack_type}", True)
             _, attack_mod_die, attack_adv_dis = GameHoa.get_skill_ability_modifier(attacker, ability_name)
-            roll = GameHoa.die_roll("d20", attack_adv_dis)
-            attack_mod_roll = GameHoa.die_roll(attack_mod_die)
+            roll = self.die_roll("d20", attack_adv_dis)
+            attack_mod_roll = self.die_roll(attack_mod_die)
             defense = cur_value(target, "stats.basic", "defense")
             total_attack = roll + attack_mod_roll
             ability_mod_str = ""
@@ -3132,7 +3311,7 @@ class GameHoa(Game):
             resp += f'{attacker_name} "{move}" - rolled {roll}{ability_mod_str} vs defense {defense}..'
             if total_attack >= defense:
                 damage_die = weapon["damage"]
-                damage = GameHoa.die_roll(damage_die)
+                damage = self.die_roll(damage_die)
                 cur_health = max(0, GameHoa.get_cur_health(target) - damage)
                 resp += f" HIT! - dealing damage -{damage} leaving health {cur_health}"
                 if cur_health == 0:
@@ -3363,7 +3542,10 @@ class GameHoa(Game):
     def after_process_actions(self) -> str:
         match self.cur_game_state_name:
             case "encounter":
+                self.journal.begin_event()
                 resp = self.after_process_actions_encounter()
+                if resp:
+                    self.journal.record({ "hook": "after_process_actions" })
             case _:
                 resp = ""
         return resp    
@@ -3372,7 +3554,10 @@ class GameHoa(Game):
     def get_addl_response(self) -> str:
         match self.cur_game_state_name:
             case "encounter":
+                self.journal.begin_event()
                 resp = self.get_addl_response_encounter()
+                if resp:
+                    self.journal.record({ "hook": "get_addl_response" })
             case _:
                 resp = ""
         return resp
@@ -3411,7 +3596,10 @@ class GameHoa(Game):
 
         if self.engine.logging:
             print(f"  ACTION: {action} {subject} {object} {extra}")
-        
+
+        self.journal.begin_event()
+        journal_event = { "action": action, "arg1": subject, "arg2": object, "arg3": extra, "arg4": extra2 }
+
         if self.game_over and action != "restart":
             return ("Players lost and game is over - players must ask AI to \"restart\" the game or return to lobby.", False)
 
@@ -3478,11 +3666,14 @@ class GameHoa(Game):
         if error:
             if self.engine.logging:
                 print(f"  ERROR: {resp}")
+            # Failed actions are journaled too, they can roll dice and change the game state before failing
+            if action != "lobby":
+                journal_event["error"] = True
+                self.journal.record(journal_event)
             return (resp, True)
         
         self._action_list.append({ "action": action, "arg1": subject, "arg2": object, "arg3": extra, "arg4": extra2})
 
-        # Note, we don't wait for it to finish saving
         if not self.skip_turn:
         
             # Advance time
@@ -3493,6 +3684,12 @@ class GameHoa(Game):
             if trans_resp != "":
                 resp += "\n\n" + trans_resp
 
+        # Journal the action as it was called (going to the lobby isn't part of the game)
+        if action != "lobby":
+            self.journal.record(journal_event)
+
+        # Note, we don't wait for it to finish saving
+        if not self.skip_turn:
             await self.save_game()
 
         self.skip_turn = False
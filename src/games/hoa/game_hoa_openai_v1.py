@@ -4,8 +4,13 @@ import re
 
 from agent import Agent
 from agents.agent_openai_v1 import OpenAIAgentV1
+from agents.history_compactor import HistoryCompactor
+from agents.message_history import MessageHistory
+from config import config_all
 from game import Game, ChatGameDriver
 from games.hoa.game_hoa import GameHoa, Obj
+from games.hoa.action_stream import ActionStream
+from games.hoa.dialog_prefetcher import DialogPrefetcher
 from db_access import Db
 from games.hoa.engine_hoa import EngineHoa
 from engine import Engine, EngineManager
@@ -28,6 +33,10 @@ def make_arg_str(cmd: str, args: list[str]) -> str:
             arg_str += str(arg)
     return arg_str
 
+# Message sources used by each kind of query
+ACTIONER_SOURCES = [ "player", "actioner", "engine", "referee" ]
+RESPONSE_SOURCES = [ "player", "referee" ]
+
 class GameHoaOpenAIV1(ChatGameDriver):
 
     def __init__(self, 
@@ -48,12 +57,33 @@ class GameHoaOpenAIV1(ChatGameDriver):
                                       module_name=module_name, 
                                       party_name = party_name, 
                                       save_game_name = save_game_name)
-        self.prompts: dict[str, Any] = {}
-        self.exploration_prefix: list[Any] = []
-        self.encounter_prefix: list[Any] = []
-        self.response_prefix: list[Any] = []
         self._button_tag: str | None = None
-        self.messages = [ self._agent.make_message("assistant", "I'm Ready!", "referee", True) ]
+        # Running per-source histories, trimmed to the largest context window as messages are added. These are
+        # the only record of the conversation (messages from other sources aren't used in a query and are dropped)
+        max_context_tokens = self._agent.max_context_tokens
+        self.histories: dict[frozenset[str], MessageHistory] = {
+            frozenset(ACTIONER_SOURCES): MessageHistory(max_tokens=max_context_tokens),
+            frozenset(RESPONSE_SOURCES): MessageHistory(max_tokens=max_context_tokens)
+        }
+        # Bumped by each player/referee message, cached dialog choice menus are only good for one version
+        self.conversation_version = 0
+        self.dialog_prefetcher = DialogPrefetcher(self._agent.model_endpoint)
+        self.dialog_prompts_used: set[str] = set() # Say/Ask menus opened this session (only these are prefetched)
+        self.add_message(self._agent.make_message("assistant", "I'm Ready!", "referee", True))
+        self.compactor = HistoryCompactor(self._agent, self._engine.game_prompts["summarize_history_prompt"])
+        # Single call turns - the actioner also writes a provisional narration, used unless the results contradict it
+        single_call_cfg: dict[str, Any] = dict(config_all.get("single_call_turns", {}))
+        single_call_cfg.update(config_all["model_endpoints"][self._agent.model_endpoint].get("single_call_turns", {}))
+        self.single_call_enabled: bool = single_call_cfg.get("enabled", False)
+        self.single_call_actions: list[str] = single_call_cfg.get("actions", [])
+        self.single_call_turns = 0
+        self.single_call_fallbacks = 0
+        self.last_action_errors = 0
+        # Action streaming - player turn actions are run as the actioner's response streams in
+        action_streaming_cfg: dict[str, Any] = dict(config_all.get("action_streaming", {}))
+        action_streaming_cfg.update(config_all["model_endpoints"][self._agent.model_endpoint].get("action_streaming", {}))
+        self.action_streaming_enabled: bool = action_streaming_cfg.get("enabled", False)
+        self.stop_after_actions: bool = action_streaming_cfg.get("stop_after_actions", True)
 
     @property
     def agent(self) -> Agent:
@@ -124,16 +154,28 @@ class GameHoaOpenAIV1(ChatGameDriver):
     def player_map(self) -> dict[str, list[str]]:
         return self.game.player_map
 
+    @property
+    def prompts(self) -> dict[str, str]:
+        return self._engine.game_prompts
+
+    # Prefix messages we prepend to our message stream which has the rules/instructions for various modes
+    # (shared by all sessions)
+    @property
+    def exploration_prefix(self) -> list[Any]:
+        return self._engine.get_prefix("exploration", self._agent)
+
+    @property
+    def encounter_prefix(self) -> list[Any]:
+        return self._engine.get_prefix("encounter", self._agent)
+
+    @property
+    def response_prefix(self) -> list[Any]:
+        return self._engine.get_prefix("response", self._agent)
+
     async def start_game(self) -> str:
         if self._game.is_started:
             return "This game has already been started."
         await self._game.start_game()
-        if len(self.prompts) == 0:
-            self.prompts = self._engine.game_prompts
-            # Prefix messages we prepend to our message stream which has the rules/instructions for various modes
-            self.exploration_prefix = [self._agent.make_message("user", self.prompts["exploration_prompt"], "prefix", keep=True)]
-            self.encounter_prefix = [self._agent.make_message("user", self.prompts["encounter_prompt"], "prefix", keep=True)]
-            self.response_prefix = [self._agent.make_message("user", self.prompts["response_prompt"], "prefix", keep=True)]
         resume_prompt = self._agent.make_prompt(self.prompts["resume_game_prompt"], self._game.module["info"])
         return await self.system_action(resume_prompt, \
                            'call do_action("resume")', \
@@ -153,14 +195,17 @@ class GameHoaOpenAIV1(ChatGameDriver):
             return ""
         return await self.call_actions(query, result)
 
-    def filter_messages(self, sources: list[str], max_msgs: int = -1) -> list[dict[str, Any]]:
-        filtered_msgs: list[dict[str, Any]] = []
-        for msg in self.messages:
+    def add_message(self, msg: dict[str, Any]) -> None:
+        for sources, history in self.histories.items():
             if msg["source"] in sources:
-                filtered_msgs.append(msg)
-        if max_msgs != -1:
-            filtered_msgs = filtered_msgs[-max_msgs:]
-        return filtered_msgs
+                history.append(msg)
+        if msg["source"] in RESPONSE_SOURCES:
+            self.conversation_version += 1
+            self.dialog_prefetcher.set_version(self.conversation_version)
+
+    def get_history(self, sources: list[str]) -> MessageHistory:
+        # Passed to plan_messages() as is, so a query doesn't copy the whole history
+        return self.histories[frozenset(sources)]
 
     def is_redundant_phrase(self, resp: str) -> bool:
         # These are so annoying we look for them and just cut them from the conversation.
@@ -197,45 +242,46 @@ class GameHoaOpenAIV1(ChatGameDriver):
         return "\n\n".join(resp.split("\n\n")[0:max_paras])
 
     async def generate(self, instr_query: str, query: str, mode: str, source: str, 
-                       primary: bool = True, keep: bool = False, chunk_handler: Any = None) -> str:
-        query_msg = self._agent.make_message("user", query, source, keep=keep)
+                       primary: bool = True, keep: bool = False, chunk_handler: Any = None,
+                       limits_mode: str = "actioner") -> str:
+        # limits_mode is the generation_limits mode for action queries
+        query_msg = await self._agent.make_message_async("user", query, source, keep=keep)
         if not instr_query:
             instr_query = query
         if instr_query != query:
-            instr_msg = self._agent.make_message("user", instr_query, source, keep=keep)
+            instr_msg = await self._agent.make_message_async("user", instr_query, source, keep=keep)
         else:
             instr_msg = query_msg
         resp_msg: dict[str, Any] = {}
+        if mode == "exploration_action" or mode == "encounter_action":
+            prefix = (self.exploration_prefix if mode == "exploration_action" else self.encounter_prefix)
+            # We get the whole msg stack for the "actioner" query (actioner and engine responses).
+            history = self.get_history(ACTIONER_SOURCES)
+        else:
+            # For the user friendly "referee" response we only need player/referee msgs.
+            prefix = self.response_prefix
+            history = self.get_history(RESPONSE_SOURCES)
+        primary = self._agent.route_model(primary,
+                                          mode=mode,
+                                          game_state=self._game.cur_game_state_name,
+                                          tokens=instr_msg["tokens"],
+                                          prompt_tokens=self._agent.min_prompt_tokens(prefix, history, [ instr_msg ]),
+                                          near_simple=self._game.near_simple_action)
         match mode:
             case "exploration_action" | "encounter_action":
-                prefix = (self.exploration_prefix if mode == "exploration_action" else self.encounter_prefix)
-                # We get the whole msg stack for the "actioner" query (actioner and engine responses).
-                msgs = prefix + \
-                    self.filter_messages(["player", "actioner", "engine", "referee"]) + \
-                    [ instr_msg ]
-                resp = await self._agent.generate(msgs, primary, chunk_handler=chunk_handler)
+                msgs = self._agent.plan_messages(prefix, history, [ instr_msg ], primary)
+                resp = await self._agent.generate(msgs, primary, chunk_handler=chunk_handler, site="actioner", mode=limits_mode)
                 resp_msg = self._agent.make_message("assistant", resp, "actioner", keep=False)
             case "engine_response" | "referee_response":
-                # For the user friendly "referee" response we only need player/referee msgs.
-                msgs = self.response_prefix + \
-                    self.filter_messages(["player", "referee"]) + \
-                    [ instr_msg ]
-                # Don't use GPT-4 for big responses
-                if instr_msg["tokens"] > 200:
-                    primary = True
-                resp = await self._agent.generate(msgs, primary, chunk_handler=chunk_handler)
+                msgs = self._agent.plan_messages(prefix, history, [ instr_msg ], primary)
+                resp = await self._agent.generate(msgs, primary, chunk_handler=chunk_handler, site="referee", 
+                                                  mode=mode, max_paras=self._game.cur_response_max_para)
                 resp = self.cut_max_paras(resp)
                 resp_msg = self._agent.make_message("assistant", resp, "referee", keep=False)
-            case "dialog_choices":
-                prefix = self.response_prefix
-                # For dialog choices we only need player/referee messages.
-                msgs = prefix + \
-                    self.filter_messages(["player", "referee"]) + \
-                    [ instr_msg ]
-                resp = await self._agent.generate(msgs, primary, chunk_handler=chunk_handler)
-                resp_msg = self._agent.make_message("assistant", resp, "dialogee", keep=False)
-        self.messages.append(query_msg)
-        self.messages.append(resp_msg)
+        self.add_message(query_msg)
+        self.add_message(resp_msg)
+        # Fold older player/referee turns into a summary in the background if the history is getting big
+        self.compactor.check(self.histories[frozenset(RESPONSE_SOURCES)], list(self.histories.values()))
         return resp_msg["content"]
  
     async def system_action(self, 
@@ -261,7 +307,7 @@ class GameHoaOpenAIV1(ChatGameDriver):
             arg_str = make_arg_str(action, args)
             response = f"{response}\ncall do_action({arg_str})\n"
         cmd_msg = self._agent.make_message("assistant", response, "actioner", keep=False)
-        self.messages.append(cmd_msg)
+        self.add_message(cmd_msg)
         if EngineManager.logging:
             print(cmd_msg["content"])
         resp = await self.process_response(query, response, level=1)
@@ -281,20 +327,37 @@ class GameHoaOpenAIV1(ChatGameDriver):
             resp = await self.parse_simple_action(query)
         # Send to the AI
         if not resp:
+            single_call = self.single_call_enabled and not is_system and expected_action is None and \
+                            self._game.cur_game_state_name == "exploration"
             if is_system:
                 action_instr = query
             else:
                 if self._game.cur_location_script and "hint" in self._game.cur_location_script:
                     query = self.append_query_hint(query)
-                action_instr = "<PLAYER>\n" + query + "\n\n" + self.prompts["action_instr_prompt"] + "\n"
+                instr_prompt = self.prompts["action_narration_instr_prompt" if single_call else "action_instr_prompt"]
+                action_instr = "<PLAYER>\n" + query + "\n\n" + instr_prompt + "\n"
             action_mode = self._game.cur_game_state_name + "_action"
+            # Responses that must end with an expected action (resume, welcome etc.) aren't held to the actioner budget
+            limits_mode = ("system_action" if expected_action is not None else "actioner")
             source = "engine" if is_system else "player"
-            resp = await self.generate(action_instr, query, action_mode, source, primary=True, keep=False)
+            actions: ActionStream | None = None
+            if self.action_streaming_enabled and not is_system:
+                # Narration follows the actions in single call turns, so we can't stop the stream there
+                actions = ActionStream(self._game, stop_after_actions=(self.stop_after_actions and not single_call),
+                                       end_marker=("<NARRATION>" if single_call else None))
+            resp = await self.generate(action_instr, query, action_mode, source, primary=True, keep=False, 
+                                       chunk_handler=actions, limits_mode=limits_mode)
+            if actions is not None:
+                resp = await actions.finish_stream(resp)
             if expected_action is not None and expected_action not in resp:
                 assert retry_msg is not None
-                while expected_action not in resp:
-                    resp = await self.generate("", retry_msg, action_mode, "system", primary=True, keep=False)
-            processed_resp = await self.process_response(query, resp, level=1, chunk_handler=chunk_handler)
+                resp = await self._agent.action_retry_policy.run(expected_action, resp,
+                    lambda: self.generate("", retry_msg, action_mode, "system", primary=True, keep=False,
+                                          limits_mode=limits_mode))
+            if single_call:
+                processed_resp = await self.single_call_response(query, resp, chunk_handler=chunk_handler, actions=actions)
+            else:
+                processed_resp = await self.process_response(query, resp, level=1, chunk_handler=chunk_handler, actions=actions)
             resp = self.post_action_update(query, processed_resp, is_system=is_system)
         # Always set the next max para after we generate the respone. This allows the first response for a location
         # to be longer than the limit.
@@ -311,12 +374,48 @@ class GameHoaOpenAIV1(ChatGameDriver):
             self._game.action_image_path = None
         # Check for Any buttons to show
         self._button_tag = self._game.check_for_buttons()
+        self.prefetch_dialog_choices()
         return resp
 
-    async def process_response(self, query: str, response: str, level: int, chunk_handler: Any = None) -> str:
+    async def single_call_response(self, query: str, response: str, chunk_handler: Any = None, 
+                                   actions: ActionStream | None = None) -> str:
+        # Response has the actions, then <NARRATION> and a narration written before the engine ran them. Use it
+        # if the results can't contradict it, otherwise fall back to a referee call as usual.
+        actions_text, _, narration = response.partition("<NARRATION>")
+        narration = self.cut_max_paras(narration.strip(" \t\n"))
+        action_names = [ (extract_arguments(line, 1) or [ "" ])[0]
+                            for line in actions_text.replace("do\\_action", "do_action").split("\n") if "do_action(\"" in line ]
+        location_name = self._game.cur_location_name
+        query, results, num_calls = await self.process_game_actions(query, actions_text, actions)
+        contradicted = not narration or \
+            "call do_action(" in narration or \
+            any([ action not in self.single_call_actions for action in action_names ]) or \
+            self.last_action_errors > 0 or \
+            self._game.cur_game_state_name != "exploration" or \
+            self._game.cur_location_name != location_name or \
+            "<INSTRUCTIONS>" in results or \
+            (results != "" and not self._game.skip_turn and self._game.get_addl_response() != "")
+        if contradicted:
+            self.single_call_fallbacks += 1
+            return await self.finish_response(query, results, num_calls, level=1, chunk_handler=chunk_handler)
+        self.single_call_turns += 1
+        # Splice the engine results in (the actioner sees them, raw <RESULTS> output goes to the players too)
+        if results.strip():
+            self.add_message(self._agent.make_message("user", results.strip("\n"), "engine", keep=False))
+        self.add_message(self._agent.make_message("assistant", narration, "referee", keep=False))
+        self.response_id += 1
+        if num_calls == 1 and results.startswith("<RESULTS>\n"):
+            return narration + "\n\n" + results[10:].strip("\n")
+        return narration
+
+    async def process_response(self, query: str, response: str, level: int, chunk_handler: Any = None,
+                               actions: ActionStream | None = None) -> str:
         if level == 4:
             return response.strip(" \n\t")
-        query, results, num_calls = await self.process_game_actions(query, response)
+        query, results, num_calls = await self.process_game_actions(query, response, actions)
+        return await self.finish_response(query, results, num_calls, level, chunk_handler=chunk_handler)
+
+    async def finish_response(self, query: str, results: str, num_calls: int, level: int, chunk_handler: Any = None) -> str:
         # Do we need to pass this to the AI for further processing? If not just return it.
         if num_calls == 1 and results.startswith("<RESULTS>\n"):
             results = results[10:]
@@ -335,22 +434,14 @@ class GameHoaOpenAIV1(ChatGameDriver):
         # Pass it to the AI.
         return await self.referee_response(query, results, level, chunk_handler=chunk_handler)
 
-    async def process_game_actions(self, query: str, response: str) -> tuple[str, str, int]:
-        lines = response.split("\n")
-        prefix = self._game.get_response_prefix()
-        results = ""
-        num_calls = 0
-        for line in lines:
-            line = line.strip()
-            line = line.replace("do\\_action", "do_action") # Some AI's have trouble with the _
-            if "do_action(\"" in line:
-                args = extract_arguments(line, 5)
-                game_resp, _ = await self._game.do_action(args[0], args[1], args[2], args[3], args[4])
-                results += game_resp + "\n"
-                num_calls += 1
-        if not self._game.skip_turn or num_calls > 1:
-            results = prefix + results + self._game.after_process_actions()
-        return (query, results, num_calls)
+    async def process_game_actions(self, query: str, response: str, 
+                                   actions: ActionStream | None = None) -> tuple[str, str, int]:
+        # Actions already run while the response streamed in are passed in as "actions"
+        if actions is None:
+            actions = ActionStream(self._game)
+            await actions.run_text(response)
+        self.last_action_errors = actions.num_errors
+        return (query, actions.get_results(), actions.num_calls)
 
     async def referee_response(self, query: str, results: str, level: int, chunk_handler: Any = None) -> str: 
         if results.startswith("<RESULTS>\n"):
@@ -401,10 +492,47 @@ class GameHoaOpenAIV1(ChatGameDriver):
     async def get_buttons(self, button_tag: str, state: dict[str, Any]) -> tuple[str|None, bool]:
         
         async def generate(prompt: str) -> str:
-            return await self.generate("", prompt, "dialog_choices", "dialoger")
+            self.dialog_prompts_used.add(prompt)
+            key = (self.conversation_version,) + self._game.get_dialog_choices_key(prompt)
+            query_msg, resp_msg = await self.dialog_prefetcher.get(key, prompt, self.generate_dialog_choices)
+            # Only menus that are actually shown go in the history (copies, a cached menu can be shown again)
+            self.add_message(dict(query_msg))
+            self.add_message(dict(resp_msg))
+            self.compactor.check(self.histories[frozenset(RESPONSE_SOURCES)], list(self.histories.values()))
+            return resp_msg["content"]
 
         return await self._game.get_buttons(button_tag, state, generate)
 
+    async def generate_dialog_choices(self, prompt: str) -> tuple[dict[str, Any], dict[str, Any]]:
+        # Returns the query and response messages without adding them to the history (prefetched menus may never
+        # be shown)
+        query_msg = await self._agent.make_message_async("user", prompt, "dialoger", keep=False)
+        # For dialog choices we only need player/referee messages.
+        history = self.get_history(RESPONSE_SOURCES)
+        primary = self._agent.route_model(True,
+                                          mode="dialog_choices",
+                                          game_state=self._game.cur_game_state_name,
+                                          tokens=query_msg["tokens"],
+                                          prompt_tokens=self._agent.min_prompt_tokens(self.response_prefix, history, [ query_msg ]),
+                                          near_simple=self._game.near_simple_action)
+        msgs = self._agent.plan_messages(self.response_prefix, history, [ query_msg ], primary)
+        resp = await self._agent.generate(msgs, primary, site="dialog_choices", mode="dialog_choices")
+        return (query_msg, self._agent.make_message("assistant", resp, "dialogee", keep=False))
+
+    def prefetch_dialog_choices(self) -> None:
+        # Start generating the Say/Ask menus the players have opened before (for the character they opened them for)
+        # while the players read the response
+        if self._button_tag != "exploration_buttons" or not self._game.has_dialog_npcs():
+            return
+        char_names = { names[0] for names in self._game.player_map.values() if names }
+        for char_name in sorted(char_names):
+            for menu in self.dialog_prefetcher.menus:
+                prompt = self._game.get_dialog_choices_prompt(menu, char_name)
+                if prompt not in self.dialog_prompts_used:
+                    continue
+                key = (self.conversation_version,) + self._game.get_dialog_choices_key(prompt)
+                self.dialog_prefetcher.prefetch(key, prompt, self.generate_dialog_choices)
+
     # SPLIT DIALOG ----------------------------------------------------------
 
     def split_dialog(self, resp) -> list[str|bytes]:
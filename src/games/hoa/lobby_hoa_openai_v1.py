@@ -2,6 +2,8 @@ import yaml
 
 from agent import Agent
 from agents.agent_openai_v1 import OpenAIAgentV1
+from agents.history_compactor import HistoryCompactor
+from agents.message_history import MessageHistory
 from engine import Engine
 from games.hoa.engine_hoa import EngineHoa
 from games.hoa.lobby_hoa import LobbyHoa
@@ -18,9 +20,18 @@ class LobbyHoaOpenAIV1(ChatLobbyDriver):
         self._agent: OpenAIAgentV1 = cast(OpenAIAgentV1, agent)
         self._lobby: LobbyHoa = LobbyHoa(engine, user)
         self.response_id = 0
-        self.lobby_prompts = self._engine.lobby_prompts
-        self.lobby_prefix = [self._agent.make_message("user", self.lobby_prompts["lobby_prompt"], "prefix", keep=True)]
-        self.messages = [ self._agent.make_message("assistant", "I'm Ready!", "referee", True) ]
+        self.messages = MessageHistory([ self._agent.make_message("assistant", "I'm Ready!", "referee", True) ],
+                                       max_tokens=self._agent.max_context_tokens)
+        self.compactor = HistoryCompactor(self._agent, self.lobby_prompts["summarize_history_prompt"])
+
+    @property
+    def lobby_prompts(self) -> dict[str, str]:
+        return self._engine.lobby_prompts
+
+    @property
+    def lobby_prefix(self) -> list[Any]:
+        # Shared by all sessions
+        return self._engine.get_prefix("lobby", self._agent)
 
     @property
     def action_image_path(self) -> str|None:
@@ -66,28 +77,31 @@ class LobbyHoaOpenAIV1(ChatLobbyDriver):
         return self._lobby.start_game_save_game_name
 
     async def generate(self, query: str, source: str, 
-                       primary: bool = True, keep: bool = False, chunk_handler: Any = None) -> str:
+                       primary: bool = True, keep: bool = False, chunk_handler: Any = None,
+                       limits_mode: str = "lobby") -> str:
+        # limits_mode is the generation_limits mode for the query
         instr_prompt = "<INSTRUCTIONS>" in query
         instr_prefix_prompt= "<PLAYER>" in query
         if instr_prompt or instr_prefix_prompt:
             # Strip Any per-response instructions and Any player tags for msg history. This reduces token usage
             # overall as AI only needs per-response instructions once.
-            instr_msg = self._agent.make_message("user", query, source, keep=keep)
+            instr_msg = await self._agent.make_message_async("user", query, source, keep=keep)
             if instr_prefix_prompt:
                 query_only = query.split("<PLAYER>")[1]
             else:
                 query_only = query.split("<INSTRUCTIONS>")[0]
             query_only = query_only.strip(" \t\n")
-            query_msg = self._agent.make_message("user", query_only, source, keep=keep)
+            query_msg = await self._agent.make_message_async("user", query_only, source, keep=keep)
         else:
-            instr_msg = query_msg = self._agent.make_message("user", query, source, keep=keep)
-        msgs = self.lobby_prefix + \
-            self.messages + \
-            [ instr_msg ]
-        resp = await self._agent.generate(msgs, primary, chunk_handler=chunk_handler)
+            instr_msg = query_msg = await self._agent.make_message_async("user", query, source, keep=keep)
+        primary = self._agent.route_model(primary, mode="lobby", tokens=instr_msg["tokens"],
+                                          prompt_tokens=self._agent.min_prompt_tokens(self.lobby_prefix, self.messages, [ instr_msg ]))
+        msgs = self._agent.plan_messages(self.lobby_prefix, self.messages, [ instr_msg ], primary)
+        resp = await self._agent.generate(msgs, primary, chunk_handler=chunk_handler, site="lobby", mode=limits_mode)
         resp_msg = self._agent.make_message("assistant", resp, "lobby", keep=False)
         self.messages.append(query_msg)
         self.messages.append(resp_msg)
+        self.compactor.check(self.messages, [ self.messages ])
         return resp_msg["content"]
 
     async def system_action(self, query: str, expected_action: str|None = None, retry_msg: str|None = None, chunk_handler: Any = None) -> str:
@@ -104,14 +118,16 @@ class LobbyHoaOpenAIV1(ChatLobbyDriver):
                              chunk_handler: Any = None) -> str:
         self._lobby.action_image_path = None
         is_system = (source == "system")
+        # Responses that must end with an expected action aren't held to the lobby budget
+        limits_mode = ("lobby_system_action" if expected_action is not None else "lobby")
         if is_system:
-            resp = await self.generate(query, source)
+            resp = await self.generate(query, source, limits_mode=limits_mode)
         else:
             resp = await self.generate(self.lobby_prompts["action_instr_prompt"] + "\n\n" + query, source)
         if expected_action is not None and expected_action not in resp:
             assert retry_msg is not None
-            while expected_action not in resp:
-                resp = await self.generate(retry_msg, "system", primary=True, keep=False)
+            resp = await self._agent.action_retry_policy.run(expected_action, resp,
+                lambda: self.generate(retry_msg, "system", primary=True, keep=False, limits_mode=limits_mode))
         processed_resp = await self.process_response(query, resp, 1, chunk_handler=chunk_handler)
         if self._lobby.action_image_path is not None:
             processed_resp = processed_resp + "\n" + "@image: " + self._lobby.action_image_path
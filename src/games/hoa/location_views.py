@@ -0,0 +1,41 @@
+from typing import Any, Callable
+
+class LocationViews:
+    """
+    Merged views of the current location (exits, npcs, usables, poi and topics), built from the module's
+    location, the current script state and the location state, and kept until one of those changes. Views are
+    keyed by (location name, script state, location state version) - the version is bumped through changed()
+    whenever the exits, npcs, usables or poi in a location state are added to or replaced, and the cache is
+    cleared by clear() whenever the game state is loaded.
+
+    Views are shared between callers, so they're read only (copy a view before changing it).
+    """
+
+    def __init__(self) -> None:
+        self.key: tuple | None = None
+        self.views: dict[str, Any] = {}
+        self.versions: dict[str, int] = {}
+        # Stats
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self) -> None:
+        self.key = None
+        self.views = {}
+        self.versions = {}
+
+    def changed(self, loc_name: str) -> None:
+        self.versions[loc_name] = self.versions.get(loc_name, 0) + 1
+
+    def get(self, loc_name: str, script_state: str, view_name: str, make_view: Callable[[], Any]) -> Any:
+        key = (loc_name, script_state, self.versions.get(loc_name, 0))
+        if key != self.key:
+            self.key = key
+            self.views = {}
+        view = self.views.get(view_name)
+        if view is None:
+            view = self.views[view_name] = make_view()
+            self.misses += 1
+        else:
+            self.hits += 1
+        return view
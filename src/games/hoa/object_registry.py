@@ -0,0 +1,41 @@
+from game import Obj
+
+class ObjectRegistry:
+    """
+    Game objects (characters, monsters, npcs, location states and the items they hold) by unique name.
+    Holds direct references to the objects in the game state plus each item's parent, so lookups and
+    moves don't depend on where the object sits in the game state. Kept up to date by GameHoa's
+    add_to_object_map()/remove_from_object_map(), and rebuilt by init_object_map() whenever the game state
+    is loaded.
+    """
+
+    def __init__(self) -> None:
+        self.objects: dict[str, Obj] = {}
+        self.parents: dict[str, Obj] = {}
+
+    def __contains__(self, unique_name: str) -> bool:
+        return unique_name in self.objects
+
+    def __len__(self) -> int:
+        return len(self.objects)
+
+    def clear(self) -> None:
+        self.objects = {}
+        self.parents = {}
+
+    def add(self, unique_name: str, obj: Obj, parent: Obj | None = None) -> None:
+        self.objects[unique_name] = obj
+        if parent is not None:
+            self.parents[unique_name] = parent
+        else:
+            self.parents.pop(unique_name, None)
+
+    def remove(self, unique_name: str) -> None:
+        self.objects.pop(unique_name, None)
+        self.parents.pop(unique_name, None)
+
+    def get(self, unique_name: str) -> Obj | None:
+        return self.objects.get(unique_name)
+
+    def get_parent(self, unique_name: str) -> Obj | None:
+        return self.parents.get(unique_name)
@@ -0,0 +1,72 @@
+import copy
+import uuid
+
+from config import config_all
+from game import Obj
+
+# Big game state sections, saved per object (everything else in the game state is small and always saved)
+SAVE_SECTIONS = [ "characters", "npcs", "monsters", "location_states" ]
+
+class SaveTracker:
+    """
+    Tracks which characters, npcs, monsters and location states have changed since the last full save so
+    most saves only write a delta: the small sections plus copies of the changed objects. Deltas are
+    cumulative (each one holds everything changed since the full save it's based on), so loading is the
+    full save plus the latest delta. A full save is written every full_save_interval saves, and whenever
+    the changes can't be tracked per object (new game, load, encounter end etc.).
+
+    Settings are in "game_saves" in config.yaml.
+    """
+
+    def __init__(self) -> None:
+        cfg: Obj = config_all.get("game_saves", {})
+        self.full_save_interval: int = cfg.get("full_save_interval", 0)
+        self.dirty: dict[str, set[str]] = { section: set() for section in SAVE_SECTIONS }
+        self.saves_since_full = 0
+        self.force_full = True
+        # Stats
+        self.full_saves = 0
+        self.delta_saves = 0
+
+    def mark(self, section: str, key: str) -> None:
+        self.dirty[section].add(key)
+
+    def mark_all(self) -> None:
+        self.force_full = True
+
+    def needs_full_save(self) -> bool:
+        return self.force_full or self.full_save_interval <= 0 or self.saves_since_full >= self.full_save_interval
+
+    def make_delta(self, game_state: Obj, base: str, copy_state: bool) -> Obj:
+        core = { key: value for key, value in game_state.items() if key not in SAVE_SECTIONS }
+        changed = { section: { key: game_state[section].get(key) for key in keys }
+                        for section, keys in self.dirty.items() if keys }
+        delta = { "base": base, "core": core, "changed": changed }
+        return (copy.deepcopy(delta) if copy_state else delta)
+
+    @staticmethod
+    def new_snapshot_id() -> str:
+        # Unique per full save, so deltas and journal entries from an earlier game never match
+        return uuid.uuid4().hex[:16]
+
+    def saved_full(self) -> None:
+        for keys in self.dirty.values():
+            keys.clear()
+        self.saves_since_full = 0
+        self.force_full = False
+        self.full_saves += 1
+
+    def saved_delta(self) -> None:
+        self.saves_since_full += 1
+        self.delta_saves += 1
+
+    @staticmethod
+    def apply_delta(game_state: Obj, delta: Obj) -> None:
+        game_state.update(delta["core"])
+        for section, changed in delta["changed"].items():
+            objs = game_state[section] = game_state.get(section, {})
+            for key, value in changed.items():
+                if value is None:
+                    objs.pop(key, None)
+                else:
+                    objs[key] = value
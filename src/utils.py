@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+import copy
 import yaml
 from typing import Any, cast
 import re
@@ -138,3 +139,39 @@ def extract_arguments(text: str, num_args: int) -> list[str]:
     while len(args) < num_args:
         args.append(None)
     return args[:num_args]
+
+def read_only(*args: Any, **kwargs: Any) -> Any:
+    raise TypeError("value is shared and read only, copy it before changing it")
+
+class ReadOnlyDict(dict):
+    # A dict shared by several objects (i.e. a monster type's stats). Writes fail, copies can be changed.
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = read_only
+
+    def __copy__(self) -> dict:
+        return dict(self)
+
+    def __deepcopy__(self, memo: dict) -> dict:
+        return { key: copy.deepcopy(value, memo) for key, value in self.items() }
+
+class ReadOnlyList(list):
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = append = extend = insert = pop = remove = \
+        reverse = sort = clear = read_only
+
+    def __copy__(self) -> list:
+        return list(self)
+
+    def __deepcopy__(self, memo: dict) -> list:
+        return [ copy.deepcopy(value, memo) for value in self ]
+
+def freeze(value: Any) -> Any:
+    # Read only copy of nested dicts and lists
+    if isinstance(value, dict):
+        return ReadOnlyDict({ key: freeze(v) for key, v in cast(dict[str, Any], value).items() })
+    if isinstance(value, list):
+        return ReadOnlyList([ freeze(v) for v in cast(list[Any], value) ])
+    return value
+
+# Saved as plain dicts and lists
+for dumper_class in [ yaml.Dumper, yaml.SafeDumper ]:
+    yaml.add_representer(ReadOnlyDict, lambda dumper, data: dumper.represent_dict(data), Dumper=dumper_class)
+    yaml.add_representer(ReadOnlyList, lambda dumper, data: dumper.represent_list(data), Dumper=dumper_class)
@@ -2,15 +2,18 @@ from apiflask import APIFlask, Schema, abort
 from apiflask.fields import String, Boolean
 
 import asyncio
+import functools
 import os
 import shortuuid
 import uuid
 
 from agent import Agent
+from agents.llm_client import LLMClient
+from agents.model_metrics import ModelMetrics
 from config import ERROR_LOGGING, config
 from engine import Engine, EngineManager
 from firestoredb import FirestoreDb
-from flask import request
+from flask import request, Response
 from game import Game
 from lobby import Lobby
 from urllib.parse import quote
@@ -76,6 +79,16 @@ async def get_game_session(user_id: str) -> GameSession:
         game_sessions[user_id] = game_session
     return game_session
 
+def closes_llm_sessions(view: Callable) -> Callable:
+    # Each request runs on its own event loop, close the LLM sessions opened on it before it finishes
+    @functools.wraps(view)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        try:
+            return await view(*args, **kwargs)
+        finally:
+            await LLMClient.close_loop_sessions()
+    return wrapper
+
 app = APIFlask(APP_NAME)
 app.servers = [ { "name": APP_NAME, "url": APP_SERVER } ]
 
@@ -105,6 +118,7 @@ class ActionArgs(Schema):
 @app.input(ActionArgs(partial=True))  # -> json_data
 @app.output(Results)
 @app.doc(operation_id="do_action")
+@closes_llm_sessions
 async def do_action(action: str, json_data: dict[str, Any]):
         """
         Does a game engine action and returns the results.
@@ -140,3 +154,11 @@ async def privacy():
                 "success": True, 
                 "response": engine.lobby_prompts.get("privacy_policy", "")
                }
+
+@app.get('/metrics')
+@app.doc(hide=True)
+async def metrics():
+        """
+        Returns LLM call metrics in the Prometheus text format.
+        """
+        return Response(ModelMetrics.to_prometheus(LLMClient.get_all_stats()), mimetype="text/plain; version=0.0.4")
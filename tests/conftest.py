@@ -0,0 +1,72 @@
+import os
+import sys
+
+import pytest
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_PATH, "src"))
+os.chdir(ROOT_PATH) # config.yaml and data/ are relative to the repo root
+
+import config
+config.init_config()
+
+from db_access import Db
+from typing import Any
+
+class MemoryDb(Db):
+
+    def __init__(self) -> None:
+        self.docs: dict[str, dict[str, Any]] = {}
+
+    async def exists(self, key: str) -> bool:
+        return key in self.docs
+
+    async def get(self, key: str) -> dict[str, Any]|None:
+        return self.docs.get(key)
+
+    async def put(self, key: str, data: dict[str, Any]) -> None:
+        self.docs[key] = data
+
+    async def delete(self, key) -> bool:
+        return self.docs.pop(key, None) is not None
+
+    async def get_list(self, key) -> list[str]:
+        return sorted({ k[len(key) + 1:].split("/")[0] for k in self.docs if k.startswith(key + "/") })
+
+@pytest.fixture
+def db() -> MemoryDb:
+    return MemoryDb()
+
+@pytest.fixture
+def engine(db):
+    from games.hoa.engine_hoa import EngineHoa
+    engine = EngineHoa(db)
+    engine.set_defaults("Band of Heroes", "Encounter Test")
+    return engine
+
+@pytest.fixture
+def user(db):
+    from user import User
+    return User(db, { "name": "tester", "id": "1" })
+
+@pytest.fixture
+def make_game(engine, user):
+    from games.hoa.game_hoa import GameHoa
+    # Run the game inside the test's event loop (async saves are tasks on it)
+    async def make_game(start_game_action: str = "new_game", module_name: str = "Encounter Test") -> GameHoa:
+        game = GameHoa(engine, user, start_game_action, module_name, "Band of Heroes", "latest")
+        await game.start_game()
+        return game
+    return make_game
+
+@pytest.fixture
+def make_driver(engine, user):
+    from agents.agent_mock_v1 import MockAgentV1
+    from games.hoa.game_hoa_openai_v1 import GameHoaOpenAIV1
+    # Chat driver on the mock agent, its game is started without the resume query
+    async def make_driver(module_name: str = "Caves of Madness") -> GameHoaOpenAIV1:
+        agent = MockAgentV1("test", "mock-v1")
+        driver = GameHoaOpenAIV1(engine, user, agent, "new_game", module_name, "Band of Heroes", "latest")
+        await driver.game.start_game()
+        return driver
+    return make_driver
@@ -0,0 +1,42 @@
+import asyncio
+import pytest
+
+from agents.action_retry_policy import ActionRetryPolicy
+from agents.model_metrics import ModelMetrics
+
+RESUME = 'call do_action("resume")'
+
+@pytest.fixture
+def policy(monkeypatch) -> ActionRetryPolicy:
+    monkeypatch.setattr(ModelMetrics, "action_retries", {})
+    monkeypatch.setattr(ModelMetrics, "action_fallbacks", {})
+    policy = ActionRetryPolicy("mock-v1")
+    policy.backoff_base = 0.0
+    return policy
+
+def run_policy(policy: ActionRetryPolicy, resp: str, retries: list[str]) -> tuple[str, int]:
+    calls = 0
+    async def retry() -> str:
+        nonlocal calls
+        calls += 1
+        return retries[calls - 1]
+    return (asyncio.run(policy.run(RESUME, resp, retry)), calls)
+
+def test_response_with_the_action_is_kept(policy) -> None:
+    assert run_policy(policy, f"Welcome back!\n<HIDDEN>\n{RESUME}", []) == (f"Welcome back!\n<HIDDEN>\n{RESUME}", 0)
+    assert ModelMetrics.action_retries == {}
+
+def test_retries_until_the_action_is_called(policy) -> None:
+    resp, calls = run_policy(policy, "Welcome back!", [ "Still welcome.", f"<HIDDEN>\n{RESUME}" ])
+    assert (resp, calls) == (f"<HIDDEN>\n{RESUME}", 2)
+    assert ModelMetrics.action_retries == { RESUME: 2 }
+    assert ModelMetrics.action_fallbacks == {}
+
+def test_falls_back_to_calling_the_action_locally(policy) -> None:
+    retries = [ 'Try this.\ncall do_action("look")', "Still nothing." ]
+    resp, calls = run_policy(policy, "Welcome back!\n<HIDDEN>\ncall do_action(\"look\")", retries)
+    # Bounded retries, then the last response's text is kept with the expected action in place of its own
+    assert calls == policy.max_attempts
+    assert resp == f"Still nothing.\n\n<HIDDEN>\n{RESUME}"
+    assert ActionRetryPolicy.make_fallback(retries[0], RESUME) == f"Try this.\n\n<HIDDEN>\n{RESUME}"
+    assert ModelMetrics.action_fallbacks == { RESUME: 1 }
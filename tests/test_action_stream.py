@@ -0,0 +1,74 @@
+import asyncio
+
+from agent import StopStream
+from games.hoa.action_stream import ActionStream
+from typing import Any
+
+RESPONSE = """call do_action("charge", "Lenora", "Giant Ant 1")
+<HIDDEN>
+call do_action("attack", "Augustus", "Giant Ant 2")
+
+Lenora rushes forward as Augustus swings at the nearest ant.
+call do_action("flee", "Lenora")
+"""
+
+class FakeGame:
+
+    def __init__(self) -> None:
+        self.actions: list[list[Any]] = []
+        self.skip_turn = False
+
+    def get_response_prefix(self) -> str:
+        return ""
+
+    async def do_action(self, *args: Any) -> tuple[str, bool]:
+        self.actions.append(list(args))
+        return (f"{args[0]} ok", False)
+
+    def after_process_actions(self) -> str:
+        return ""
+
+async def run_streamed(response: str, stop_after_actions: bool = False,
+                       end_marker: str | None = None) -> tuple[FakeGame, bool]:
+    game = FakeGame()
+    actions = ActionStream(game, stop_after_actions=stop_after_actions, end_marker=end_marker) # type: ignore
+    stopped = False
+    try:
+        for start in range(0, len(response), 7):
+            await actions(response[start:start + 7], 0.0)
+    except StopStream:
+        stopped = True
+    await actions.finish_stream(response)
+    return (game, stopped)
+
+async def run_whole(response: str, end_marker: str | None = None) -> FakeGame:
+    game = FakeGame()
+    await ActionStream(game, end_marker=end_marker).run_text(response) # type: ignore
+    return game
+
+def action_names(game: FakeGame) -> list[str]:
+    return [ args[0] for args in game.actions ]
+
+def test_every_action_line_is_run() -> None:
+    # Text between two actions doesn't stop the later ones, streamed or not
+    whole = asyncio.run(run_whole(RESPONSE))
+    assert action_names(whole) == [ "charge", "attack", "flee" ]
+    streamed, stopped = asyncio.run(run_streamed(RESPONSE))
+    assert streamed.actions == whole.actions
+    assert not stopped
+    # Last line without a newline
+    streamed, _ = asyncio.run(run_streamed(RESPONSE.rstrip("\n")))
+    assert streamed.actions == whole.actions
+
+def test_stream_is_stopped_after_the_action_block() -> None:
+    streamed, stopped = asyncio.run(run_streamed(RESPONSE, stop_after_actions=True))
+    assert action_names(streamed) == [ "charge", "attack" ]
+    assert stopped
+
+def test_no_actions_are_run_after_the_end_marker() -> None:
+    response = 'call do_action("pass", "Lenora")\n<NARRATION>\nLenora waits.\ncall do_action("flee", "Lenora")\n'
+    whole = asyncio.run(run_whole(response, end_marker="<NARRATION>"))
+    assert action_names(whole) == [ "pass" ]
+    streamed, stopped = asyncio.run(run_streamed(response, end_marker="<NARRATION>"))
+    assert streamed.actions == whole.actions
+    assert not stopped
@@ -0,0 +1,79 @@
+import asyncio
+import openai
+
+from agents.agent_mock_v1 import MockAgentV1
+from typing import Any, AsyncIterator
+
+class FakeStream:
+    """Streamed completion which waits before its first chunk, then can fail part way through."""
+
+    def __init__(self, chunks: list[str], first_delay: float = 0.0, fail_after: int = -1) -> None:
+        self.chunks = chunks
+        self.first_delay = first_delay
+        self.fail_after = fail_after
+
+    async def __aiter__(self) -> AsyncIterator[dict[str, Any]]:
+        await asyncio.sleep(self.first_delay)
+        for index, content in enumerate(self.chunks):
+            if index == self.fail_after:
+                raise openai.error.APIError("stream failed")
+            yield { "choices": [ { "delta": { "content": content } } ] }
+
+class FakeChatCompletion:
+
+    def __init__(self, results: list[Any]) -> None:
+        self.results = results
+        self.calls = 0
+
+    @property
+    def ChatCompletion(self) -> "FakeChatCompletion":
+        return self
+
+    async def acreate(self, **kwargs: Any) -> Any:
+        result = self.results[self.calls]
+        self.calls += 1
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+def make_agent(results: list[Any]) -> tuple[MockAgentV1, FakeChatCompletion]:
+    agent = MockAgentV1("test", "mock-v1")
+    fake = FakeChatCompletion(results)
+    agent.openai = fake # type: ignore
+    agent.latency_policy.backoff_base = 0.0
+    agent.latency_policy.hedge_to = "primary"
+    agent.latency_policy.hedge_default_delay = 0.05
+    return (agent, fake)
+
+def run_streamed(agent: MockAgentV1, hedged: bool) -> tuple[str, list[str]]:
+    received: list[str] = []
+    async def chunk_handler(content: str, chunk_time: float) -> None:
+        received.append(content)
+    messages = [ { "role": "user", "content": "go" } ]
+    if hedged:
+        call = agent.hedged_call_model(agent.primary_model_config, messages, 10, chunk_handler, "test")
+    else:
+        call = agent.call_model(agent.primary_model_config, messages, chunk_handler, "test")
+    return (asyncio.run(call), received)
+
+def test_streamed_call_retried_before_first_chunk() -> None:
+    agent, fake = make_agent([ openai.error.APIError("busy"), FakeStream([ "a", "b" ]) ])
+    response, received = run_streamed(agent, hedged=False)
+    assert response == "ab"
+    assert received == [ "a", "b" ]
+    assert fake.calls == 2
+
+def test_streamed_call_failing_after_first_chunk_keeps_streamed_part() -> None:
+    agent, fake = make_agent([ FakeStream([ "a", "b", "c" ], fail_after=2), FakeStream([ "x" ]) ])
+    response, received = run_streamed(agent, hedged=False)
+    assert response == "ab"
+    assert received == [ "a", "b" ]
+    assert fake.calls == 1
+
+def test_streamed_call_hedged_until_first_chunk() -> None:
+    agent, fake = make_agent([ FakeStream([ "slow" ], first_delay=5.0), FakeStream([ "fast", "er" ]) ])
+    response, received = run_streamed(agent, hedged=True)
+    assert response == "faster"
+    assert received == [ "fast", "er" ]
+    assert fake.calls == 2
+    assert agent.latency_policy.hedge_wins == 1
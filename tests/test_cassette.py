@@ -0,0 +1,37 @@
+import json
+
+from agents.cassette import Cassette
+
+def make_msgs(query: str) -> list[dict[str, str]]:
+    return [ { "role": "system", "content": "You are the referee." }, { "role": "user", "content": query } ]
+
+def test_record_then_replay(tmp_path) -> None:
+    path = str(tmp_path / "calls.jsonl")
+    recorder = Cassette(path, "record")
+    recorder.record("game", "gpt-4", 0.3, make_msgs("look"), "You see a cave.")
+    recorder.record("game", "gpt-4", 0.3, make_msgs("look"), "Still a cave.")
+    recorder.record("game", "gpt-4", 0.3, make_msgs("go north"), "You head north.")
+    with open(path, "r") as f:
+        records = [ json.loads(line) for line in f ]
+    # The shared system message is only written once
+    assert [ record["type"] for record in records ].count("content") == 3
+
+    player = Cassette(path, "replay")
+    # Identical calls are served in recorded order, then the last one again
+    assert player.replay("game", "gpt-4", 0.3, make_msgs("look")) == "You see a cave."
+    assert player.replay("game", "gpt-4", 0.3, make_msgs("look")) == "Still a cave."
+    assert player.replay("game", "gpt-4", 0.3, make_msgs("look")) == "Still a cave."
+    # Whitespace around a message doesn't change the match
+    assert player.replay("game", "gpt-4", 0.3, make_msgs("go north\n")) == "You head north."
+    assert (player.hits, player.misses) == (4, 0)
+
+def test_replay_falls_back_to_recorded_order(tmp_path) -> None:
+    path = str(tmp_path / "calls.jsonl")
+    recorder = Cassette(path, "record")
+    recorder.record("lobby", "gpt-4", 0.3, make_msgs("hello"), "Welcome!")
+    recorder.record("game", "gpt-4", 0.3, make_msgs("attack"), "You swing.")
+    player = Cassette(path, "replay")
+    # The engine's output changed since recording, so nothing matches
+    assert player.replay("game", "gpt-4", 0.3, make_msgs("attack the ant")) == "You swing."
+    assert player.replay("game", "gpt-4", 0.3, make_msgs("attack again")) == ""
+    assert player.misses == 2
@@ -0,0 +1,81 @@
+import asyncio
+
+from games.hoa.dialog_prefetcher import DialogPrefetcher
+
+class FakeGenerate:
+
+    def __init__(self) -> None:
+        self.prompts: list[str] = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        await self.release.wait()
+        return f"menu for {prompt} #{len(self.prompts)}"
+
+def make_prefetcher() -> DialogPrefetcher:
+    prefetcher = DialogPrefetcher("mock-v1")
+    prefetcher.enabled = True
+    return prefetcher
+
+def test_prefetched_menu_is_used() -> None:
+    async def run():
+        prefetcher = make_prefetcher()
+        generate = FakeGenerate()
+        prefetcher.prefetch((0, "say"), "say", generate)
+        prefetcher.prefetch((0, "say"), "say", generate) # Already running
+        await asyncio.sleep(0)
+        generate.release.set()
+        assert await prefetcher.get((0, "say"), "say", generate) == "menu for say #1"
+        assert generate.prompts == [ "say" ]
+        assert (prefetcher.prefetched, prefetcher.hits, prefetcher.misses) == (1, 1, 0)
+    asyncio.run(run())
+
+def test_new_version_drops_cached_menus() -> None:
+    async def run():
+        prefetcher = make_prefetcher()
+        generate = FakeGenerate()
+        generate.release.set()
+        prefetcher.prefetch((0, "say"), "say", generate)
+        await asyncio.sleep(0)
+        prefetcher.set_version(1)
+        assert prefetcher.entries == {}
+        # The old menu isn't used for the new conversation version
+        assert await prefetcher.get((1, "say"), "say", generate) == "menu for say #2"
+        assert (prefetcher.hits, prefetcher.misses) == (0, 1)
+    asyncio.run(run())
+
+def test_running_prefetch_is_cancelled_by_a_new_version() -> None:
+    async def run():
+        prefetcher = make_prefetcher()
+        generate = FakeGenerate()
+        prefetcher.prefetch((0, "ask"), "ask", generate)
+        task = prefetcher.entries[(0, "ask")]
+        await asyncio.sleep(0)
+        prefetcher.set_version(1)
+        await asyncio.sleep(0)
+        assert task.cancelled()
+        generate.release.set()
+        assert await prefetcher.get((1, "ask"), "ask", generate) == "menu for ask #2"
+    asyncio.run(run())
+
+def test_cancelled_prefetch_is_a_miss() -> None:
+    async def run():
+        prefetcher = make_prefetcher()
+        generate = FakeGenerate()
+        prefetcher.prefetch((0, "ask"), "ask", generate)
+        await asyncio.sleep(0)
+        prefetcher.entries[(0, "ask")].cancel()
+        generate.release.set()
+        # Cancelling the prefetch doesn't cancel the get(), it generates the menu itself
+        assert await prefetcher.get((0, "ask"), "ask", generate) == "menu for ask #2"
+        assert (prefetcher.hits, prefetcher.misses) == (0, 1)
+    asyncio.run(run())
+
+def test_disabled_prefetcher_starts_nothing() -> None:
+    async def run():
+        prefetcher = DialogPrefetcher("mock-v1")
+        assert not prefetcher.enabled
+        prefetcher.prefetch((0, "say"), "say", FakeGenerate())
+        assert prefetcher.entries == {}
+    asyncio.run(run())
@@ -0,0 +1,89 @@
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip("discord")
+os.environ.setdefault("DISCORD_TOKEN", "test")
+os.environ.setdefault("MODEL_ENDPOINT", "mock-v1")
+
+import games.hoa as hoa
+from engine import EngineManager
+if "hoa" not in EngineManager.engines:
+    hoa.register_engine_hoa()
+
+import discord_chatbot
+from discord_chatbot import ResponseStreamer
+
+class FakeMessage:
+
+    def __init__(self, content: str) -> None:
+        self.content = content
+        self.edits: list[str] = []
+        self.deleted = False
+
+    async def edit(self, content: str) -> None:
+        self.content = content
+        self.edits.append(content)
+
+    async def delete(self) -> None:
+        self.deleted = True
+
+class FakeChannel:
+
+    def __init__(self) -> None:
+        self.sent: list[FakeMessage] = []
+
+    async def send(self, content: str) -> FakeMessage:
+        message = FakeMessage(content)
+        self.sent.append(message)
+        return message
+
+def test_visible_text_holds_back_hidden_lines() -> None:
+    text = "The ants attack.\ncall do_action(\"attack\")\nYou dodge.\ncall do_"
+    assert ResponseStreamer.visible_text(text) == "The ants attack.\nYou dodge."
+    assert ResponseStreamer.visible_text("You win.\n<HIDDEN>\nsecret") == "You win."
+    # A partial line that could still become a hidden marker is held back at the "<"
+    assert ResponseStreamer.visible_text("You win. <HID") == "You win."
+    assert ResponseStreamer.visible_text("You win.", final=True) == "You win."
+
+def test_edits_are_throttled(monkeypatch) -> None:
+    monkeypatch.setattr(discord_chatbot, "STREAM_FIRST_TOKENS", 2)
+    monkeypatch.setattr(discord_chatbot, "STREAM_EDIT_INTERVAL", 1.0)
+
+    async def run() -> tuple[FakeChannel, ResponseStreamer]:
+        channel = FakeChannel()
+        streamer = ResponseStreamer(channel) # type: ignore
+        chunks = [ ("The ", 10.0), ("ants ", 10.1), ("attack.", 10.2), ("\nYou ", 10.5),
+                   ("dodge.", 11.3), ("\n", 11.4) ]
+        for content, chunk_time in chunks:
+            await streamer(content, chunk_time)
+            await asyncio.sleep(0)
+        await streamer.finish("The ants attack.\nYou dodge.")
+        return channel, streamer
+
+    channel, streamer = asyncio.run(run())
+    # Posted at the second token and edited once a second later. The final text was already shown so
+    # finish() doesn't edit again.
+    assert len(channel.sent) == 1
+    assert channel.sent[0].edits == [ "The ants attack.\nYou dodge." ]
+    assert streamer.shown == "The ants attack.\nYou dodge."
+
+def test_short_response_is_sent_once_finished(monkeypatch) -> None:
+    sent: list[str] = []
+
+    async def send_to_channel(channel, result, game) -> None:
+        sent.append(result)
+
+    monkeypatch.setattr(discord_chatbot, "send_to_channel", send_to_channel)
+
+    async def run() -> FakeChannel:
+        channel = FakeChannel()
+        streamer = ResponseStreamer(channel) # type: ignore
+        await streamer("Ok.", 10.0)
+        await streamer.finish("Ok.")
+        return channel
+
+    channel = asyncio.run(run())
+    assert channel.sent == []
+    assert sent == [ "Ok." ]
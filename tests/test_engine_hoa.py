@@ -0,0 +1,29 @@
+import pytest
+
+from agents.agent_mock_v1 import MockAgentV1
+
+def test_prefix_messages_are_shared_and_read_only(engine) -> None:
+    agent = MockAgentV1("test", "mock-v1")
+    prefix = engine.get_prefix("exploration", agent)
+    assert prefix[0]["content"] == engine.game_prompts["exploration_prompt"]
+    assert prefix[0]["keep"]
+    # Every session gets the same message, not a copy
+    assert engine.get_prefix("exploration", agent)[0] is prefix[0]
+    assert engine.get_prefix("lobby", agent)[0]["content"] == engine.lobby_prompts["lobby_prompt"]
+    with pytest.raises(TypeError):
+        prefix[0]["content"] = "changed" # type: ignore
+
+def test_changed_prompts_are_loaded_as_a_new_version(engine) -> None:
+    agent = MockAgentV1("test", "mock-v1")
+    prefix = engine.get_prefix("response", agent)
+    version = engine.prompts_version
+    # Unchanged files are not reloaded
+    engine.load_chatbot_prompts()
+    assert engine.prompts_version == version
+    assert engine.get_prefix("response", agent)[0] is prefix[0]
+    engine.prompt_set.mtimes = [ 0.0, 0.0 ]
+    engine.load_chatbot_prompts()
+    assert engine.prompts_version == version + 1
+    new_prefix = engine.get_prefix("response", agent)
+    assert new_prefix[0] is not prefix[0]
+    assert new_prefix[0]["content"] == prefix[0]["content"]
@@ -0,0 +1,87 @@
+import asyncio
+import copy
+import json
+import pytest
+import yaml
+
+def test_add_item_moves_item_with_unregistered_parent(make_game):
+    async def run():
+        game = await make_game()
+        augustus = game.characters["Augustus"]
+        lenora = game.characters["Lenora"]
+        # In Augustus' items with its parent set, but never added to the object registry
+        item = { "name": "Old Rope", "type": "item", "unique_name": "Old Rope#9001", "parent": "Augustus" }
+        augustus["items"]["Old Rope#9001"] = item
+        assert "Old Rope#9001" not in game.object_map
+        resp, error = game.add_item(lenora, item)
+        assert (resp, error) == ("ok", False)
+        assert "Old Rope#9001" not in augustus["items"]
+        assert lenora["items"]["Old Rope#9001"]["parent"] == "Lenora"
+        assert game.get_object_parent("Old Rope#9001") is lenora
+    asyncio.run(run())
+
+def test_delta_save_keeps_area_effect_changes(make_game, monkeypatch):
+    from config import config_all
+    monkeypatch.setitem(config_all["game_saves"], "incremental", "delta")
+    async def run():
+        game = await make_game()
+        ants = [ game.get_object(unique_name) for unique_name in game.cur_encounter["monsters"].values() ]
+        # Every ant is hit, and none of them is named in an action
+        game.apply_effects("cast", "Thunderclap", { "turns": 2, "effects": [ { "path": "states.cur_stunned", "or": True } ] }, ants)
+        game.apply_effects("cast", "Fireball", { "effects": [ { "damage": { "die": "d4" } } ] }, ants)
+        game.update_all_effects()
+        await game.save_game(wait_done=True)
+        assert game.save_tracker.delta_saves == 1
+        loaded = await make_game("resume_game")
+        for ant in ants:
+            loaded_ant = loaded.get_object(ant["unique_name"])
+            assert loaded_ant["states"]["cur_stunned"] is True
+            assert loaded_ant["states"] == ant["states"]
+            assert loaded.get_cur_health(loaded_ant) == game.get_cur_health(ant)
+        assert loaded.game_state["effects"] == game.game_state["effects"]
+        assert loaded.game_state["mods"] == game.game_state["mods"]
+    asyncio.run(run())
+
+def test_journal_replays_failed_actions(make_game, db, monkeypatch):
+    async def run():
+        game = await make_game()
+        # Casting always fails its check, after the caster has used up their move and rolled the dice
+        monkeypatch.setitem(game.rules["spells"]["Missile"], "require", [ { "check": { "ability": "Magic", "roll": 1000 } } ])
+        _, error = await game.do_action("cast", "Augustus", "Missile", "Giant Ant 1")
+        assert error
+        _, error = await game.do_action("charge", "Lenora", "Giant Ant 1")
+        assert not error
+        await asyncio.sleep(0) # Let the save the charge started finish
+        entries = [ entry for key, entry in db.docs.items() if "/save_game_journals/" in key ]
+        assert [ event.get("error", False) for entry in entries for event in entry["events"] ] == [ True, False ]
+        loaded = await make_game("resume_game")
+        assert loaded.journal.events_replayed == 2
+        assert loaded.characters["Augustus"]["encounter"] == game.characters["Augustus"]["encounter"]
+        assert loaded.characters["Augustus"]["encounter"]["moved_round"] == 1
+        assert loaded.characters == game.characters
+        assert loaded.monsters == game.monsters
+        assert loaded.cur_encounter == game.cur_encounter
+    asyncio.run(run())
+
+def test_damaged_monster_doesnt_change_later_spawns(make_game):
+    async def run():
+        game = await make_game()
+        ant, other_ant = [ game.get_object(game.cur_encounter["monsters"][name]) for name in [ "Giant Ant 1", "Giant Ant 2" ] ]
+        game.set_cur_health(ant, 3)
+        game.set_state_value(ant, "melee_attack.damage", "d12")
+        spawned = game.merge_monster("Giant Ant 4", { "monster_type": "Giant Ant" })
+        assert game.get_cur_health(ant) == 3
+        assert game.get_cur_health(spawned) == 10
+        assert "cur_health" not in spawned["stats"]["basic"]
+        assert spawned["melee_attack"] != ant["melee_attack"]
+        # The undamaged ants and the new one still share their type's values, which can't be changed in place
+        assert spawned["stats"] is other_ant["stats"]
+        with pytest.raises(TypeError):
+            spawned["stats"]["basic"]["cur_health"] = 1
+        with pytest.raises(TypeError):
+            spawned["melee_attack"].update({ "damage": "d12" })
+        assert game.merge_monster("Giant Ant 5", { "monster_type": "Giant Ant" })["stats"] == copy.deepcopy(spawned["stats"])
+        # Copies and saves are plain values
+        copy.deepcopy(spawned)["stats"]["basic"]["cur_health"] = 1
+        assert yaml.safe_load(yaml.dump(spawned)) == json.loads(json.dumps(spawned))
+    asyncio.run(run())
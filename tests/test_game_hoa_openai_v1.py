@@ -0,0 +1,90 @@
+import asyncio
+
+from games.hoa.game_hoa_openai_v1 import RESPONSE_SOURCES
+from typing import Any
+
+def record_actions(driver) -> list[list[Any]]:
+    game = driver.game
+    actions: list[list[Any]] = []
+    do_action = game.do_action
+    async def recording_do_action(*args: Any) -> tuple[str, bool]:
+        actions.append([ arg for arg in args if arg is not None ])
+        return await do_action(*args)
+    game.do_action = recording_do_action
+    return actions
+
+def use_fallback(driver) -> list[str]:
+    # Records the results passed to the usual referee call instead of querying the model
+    fallbacks: list[str] = []
+    async def finish_response(query: str, results: str, num_calls: int, level: int, chunk_handler: Any = None) -> str:
+        fallbacks.append(results)
+        return "referee response"
+    driver.finish_response = finish_response
+    return fallbacks
+
+def test_single_call_uses_narration_after_the_actions(make_driver) -> None:
+    async def run():
+        driver = await make_driver()
+        driver.single_call_enabled = True
+        actions = record_actions(driver)
+        fallbacks = use_fallback(driver)
+        response = 'call do_action("pass", "Augustus")\n<NARRATION>\nAugustus leans on his staff and waits.\n'
+        resp = await driver.single_call_response("I wait", response)
+        assert resp == "Augustus leans on his staff and waits."
+        assert actions == [ [ "pass", "Augustus" ] ]
+        assert fallbacks == []
+        assert driver.single_call_turns == 1
+        history = driver.histories[frozenset(RESPONSE_SOURCES)].to_list()
+        assert history[-1]["content"] == resp and history[-1]["source"] == "referee"
+    asyncio.run(run())
+
+def test_actions_in_the_narration_are_not_run(make_driver) -> None:
+    async def run():
+        driver = await make_driver()
+        driver.single_call_enabled = True
+        actions = record_actions(driver)
+        fallbacks = use_fallback(driver)
+        response = 'call do_action("pass", "Augustus")\n<NARRATION>\nThey wait.\ncall do_action("pass", "Lenora")\n'
+        resp = await driver.single_call_response("We wait", response)
+        # Only the actions before <NARRATION> run, and a narration that calls actions can't be used
+        assert actions == [ [ "pass", "Augustus" ] ]
+        assert resp == "referee response"
+        assert len(fallbacks) == 1
+        assert driver.single_call_fallbacks == 1 and driver.single_call_turns == 0
+    asyncio.run(run())
+
+def test_single_call_falls_back_for_other_actions_or_no_narration(make_driver) -> None:
+    async def run():
+        driver = await make_driver()
+        driver.single_call_enabled = True
+        actions = record_actions(driver)
+        use_fallback(driver)
+        # "exits" isn't one of the single call actions, the narration could contradict its results
+        response = 'call do_action("exits")\n<NARRATION>\nThere are exits all around.\n'
+        assert await driver.single_call_response("Where can we go?", response) == "referee response"
+        assert await driver.single_call_response("I wait", 'call do_action("pass", "Augustus")\n') == "referee response"
+        assert actions == [ [ "exits" ], [ "pass", "Augustus" ] ]
+        assert driver.single_call_fallbacks == 2
+    asyncio.run(run())
+
+def test_system_actions_are_not_held_to_the_actioner_budget(make_driver) -> None:
+    async def run():
+        driver = await make_driver()
+        driver.agent.action_retry_policy.backoff_base = 0.0
+        expected_action = 'call do_action("pass", "Augustus")'
+        responses = [ "Welcome back, heroes!", f"Welcome back, heroes!\n<HIDDEN>\n{expected_action}" ]
+        modes: list[str] = []
+        async def generate(messages: list[dict], primary: bool = True, mode: str = "", **kwargs: Any) -> str:
+            modes.append(mode)
+            return responses[len(modes) - 1]
+        async def referee_response(query: str, results: str, level: int, chunk_handler: Any = None) -> str:
+            return "referee response"
+        driver.agent.generate = generate
+        driver.referee_response = referee_response
+        await driver.system_action("Welcome the players back", expected_action, "You must call pass.")
+        # The query and its retry both use the budget free mode
+        assert modes == [ "system_action", "system_action" ]
+        limits = driver.agent.generation_limits
+        assert "max_tokens" not in limits.get_args("system_action")
+        assert limits.get_args("system_action")["stop"] == limits.get_args("actioner")["stop"]
+    asyncio.run(run())
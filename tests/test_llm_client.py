@@ -0,0 +1,25 @@
+import asyncio
+
+from agents.llm_client import LLMClient
+
+def test_slot_works_on_each_event_loop() -> None:
+    # The web service runs each request on its own event loop
+    client = LLMClient.get_client("openai-chatgpt-4-turbo-v1")
+    requests = client.stats.requests
+
+    async def request() -> tuple[object, object]:
+        async with client.slot():
+            pass
+        session, semaphore = client.get_session(), client.get_semaphore()
+        # As the web service does at the end of each request
+        await LLMClient.close_loop_sessions()
+        return (session, semaphore)
+
+    session1, semaphore1 = asyncio.run(request())
+    session2, semaphore2 = asyncio.run(request())
+    assert session1 is not session2
+    assert semaphore1 is not semaphore2
+    assert client._sessions == {}
+    assert client._semaphores == {}
+    assert client.stats.requests == requests + 2
+    assert client.stats.in_flight == 0
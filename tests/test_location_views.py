@@ -0,0 +1,38 @@
+import asyncio
+
+from games.hoa.location_views import LocationViews
+
+def test_views_are_kept_until_the_location_changes() -> None:
+    views = LocationViews()
+    builds: list[str] = []
+    def make_view(name: str):
+        def make() -> dict:
+            builds.append(name)
+            return { "built": len(builds) }
+        return make
+    exits = views.get("Road", "start", "exits", make_view("exits"))
+    assert views.get("Road", "start", "exits", make_view("exits")) is exits
+    views.get("Road", "start", "npcs", make_view("npcs"))
+    # Another location's state changing doesn't drop the views
+    views.changed("Cave")
+    assert views.get("Road", "start", "exits", make_view("exits")) is exits
+    assert (views.hits, views.misses) == (2, 2)
+    views.changed("Road")
+    assert views.get("Road", "start", "exits", make_view("exits")) is not exits
+    # A new script state or location builds new views too
+    views.get("Road", "fight", "exits", make_view("exits"))
+    views.get("Cave", "fight", "exits", make_view("exits"))
+    views.clear()
+    views.get("Cave", "fight", "exits", make_view("exits"))
+    assert builds == [ "exits", "npcs", "exits", "exits", "exits", "exits" ]
+
+def test_location_state_changes_update_the_merged_views(make_game) -> None:
+    async def run():
+        game = await make_game(module_name="Caves of Madness")
+        exits = game.get_merged_exits()
+        assert exits == { "N": { "to": "Clearing" }, "enter": { "to": "First Chamber" } }
+        assert game.get_merged_exits() is exits
+        game.set_state_value(game.cur_location_state, "exits", { "down": { "to": "Great Chamber" } })
+        assert game.get_merged_exits()["down"] == { "to": "Great Chamber" }
+        assert "down" not in exits
+    asyncio.run(run())
@@ -0,0 +1,54 @@
+import pytest
+
+from agents.model_metrics import Histogram, ModelMetrics
+
+@pytest.fixture(autouse=True)
+def clear_metrics(monkeypatch) -> None:
+    monkeypatch.setattr(ModelMetrics, "metrics", {})
+    monkeypatch.setattr(ModelMetrics, "action_retries", {})
+    monkeypatch.setattr(ModelMetrics, "action_fallbacks", {})
+
+def test_histogram_percentile_is_bucket_upper_bound() -> None:
+    hist = Histogram([ 1.0, 2.0, 4.0 ])
+    for value in [ 0.5, 0.5, 1.5, 3.0, 10.0 ]:
+        hist.observe(value)
+    assert hist.counts == [ 2, 1, 1, 1 ]
+    assert hist.count == 5 and hist.sum == 15.5
+    assert hist.percentile(0.4) == 1.0
+    assert hist.percentile(0.6) == 2.0
+    assert hist.percentile(1.0) == float("inf")
+    assert Histogram().percentile(0.9) == 0.0
+
+def test_calls_are_recorded_per_model_and_site() -> None:
+    ModelMetrics.record_call("gpt-a", "actioner", 0.3, ttft=0.1)
+    ModelMetrics.record_call("gpt-a", "actioner", 1.5)
+    ModelMetrics.record_error("gpt-a", "actioner")
+    ModelMetrics.record_call("gpt-a", "", 2.0)
+    ModelMetrics.record_tokens({ "model": "gpt-a", "prompt_cost": 0.01, "gen_cost": 0.03 }, "actioner", 1000, 100)
+    actioner = ModelMetrics.get_metrics("gpt-a", "actioner")
+    assert actioner.calls == 2
+    assert actioner.error_rate == pytest.approx(1 / 3)
+    assert actioner.ttft.count == 1
+    assert actioner.cost == pytest.approx(0.013)
+    assert ModelMetrics.get_metrics("gpt-a", "other").calls == 1
+
+def test_prometheus_output() -> None:
+    ModelMetrics.record_call("gpt-a", "referee", 0.3)
+    ModelMetrics.record_call("gpt-a", "referee", 5.0)
+    ModelMetrics.record_action_fallback('say "hi"')
+    text = ModelMetrics.to_prometheus({ "mock-v1": { "in_flight": 1, "queue_depth": 0, "max_queue_depth": 3 } })
+    lines = text.splitlines()
+    # Buckets are cumulative
+    assert 'llm_request_latency_seconds_bucket{model="gpt-a",site="referee",le="0.5"} 1' in lines
+    assert 'llm_request_latency_seconds_bucket{model="gpt-a",site="referee",le="8.0"} 2' in lines
+    assert 'llm_request_latency_seconds_bucket{model="gpt-a",site="referee",le="+Inf"} 2' in lines
+    assert 'llm_request_latency_seconds_count{model="gpt-a",site="referee"} 2' in lines
+    assert 'llm_requests_total{model="gpt-a",site="referee"} 2' in lines
+    assert 'llm_expected_action_fallbacks_total{action="say \\"hi\\""} 1' in lines
+    assert 'llm_client_max_queue_depth{endpoint="mock-v1"} 3' in lines
+    assert text.endswith("\n")
+
+def test_dump_without_calls() -> None:
+    assert ModelMetrics.dump() == "No model calls yet."
+    ModelMetrics.record_call("gpt-a", "lobby", 1.0)
+    assert ModelMetrics.dump().startswith("gpt-a lobby: calls 1 err 0.0%")
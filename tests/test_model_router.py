@@ -0,0 +1,65 @@
+import pytest
+
+from agents.latency_policy import LatencyTracker
+from agents.model_metrics import ModelMetrics
+from agents.model_router import ModelRouter
+from collections import deque
+
+PRIMARY = { "model": "strong", "max_tokens": 32768, "prompt_cost": 0.03, "gen_cost": 0.06 }
+SECONDARY = { "model": "cheap", "max_tokens": 4096, "prompt_cost": 0.001, "gen_cost": 0.002 }
+
+@pytest.fixture
+def router(monkeypatch) -> ModelRouter:
+    monkeypatch.setattr(ModelMetrics, "metrics", {})
+    monkeypatch.setattr(LatencyTracker, "trackers", {})
+    router = ModelRouter("openai-chatgpt-4-turbo-mix-v1")
+    router.enabled = True
+    router.log_decisions = False
+    router.rules = [ { "mode": "encounter_action", "tier": "primary" },
+                     { "mode": "exploration_action", "near_simple": True, "tier": "cheapest" },
+                     { "mode": [ "engine_response", "referee_response" ], "min_tokens": 201, "tier": "primary" },
+                     { "mode": "referee_response", "tier": "secondary" } ]
+    return router
+
+def route(router: ModelRouter, requested_primary: bool, **features) -> bool:
+    return router.route(PRIMARY, SECONDARY, requested_primary, features)
+
+def test_default_rules_keep_big_responses_on_primary() -> None:
+    router = ModelRouter("openai-chatgpt-4-turbo-mix-v1")
+    router.log_decisions = False
+    assert route(router, False, mode="referee_response", tokens=201, prompt_tokens=2000)
+    assert not route(router, False, mode="referee_response", tokens=200, prompt_tokens=2000)
+    assert not route(router, False, mode="dialog_choices", tokens=500, prompt_tokens=2000)
+    assert route(router, True, mode="exploration_action", tokens=100, prompt_tokens=2000)
+
+def test_first_matching_rule_wins(router) -> None:
+    assert route(router, False, mode="encounter_action", tokens=10)
+    assert route(router, False, mode="engine_response", tokens=300)
+    assert not route(router, True, mode="referee_response", tokens=100)
+    # No rule matches, use what was asked for
+    assert route(router, True, mode="lobby", tokens=100)
+    assert not route(router, False, mode="lobby", tokens=100)
+    assert router.routed == { "primary": 3, "secondary": 2 }
+
+def test_disabled_or_single_model_keeps_requested(router) -> None:
+    assert not router.route(PRIMARY, PRIMARY, False, { "mode": "encounter_action" })
+    router.enabled = False
+    assert not route(router, False, mode="encounter_action")
+
+def test_cheapest_needs_room_for_the_whole_prompt(router) -> None:
+    # The instruction is small but the prefix and pinned history don't fit the cheap model's window
+    assert route(router, False, mode="exploration_action", near_simple=True, tokens=100, prompt_tokens=3700)
+    assert not route(router, True, mode="exploration_action", near_simple=True, tokens=100, prompt_tokens=3000)
+    # Not near a simple action, no rule matches
+    assert route(router, True, mode="exploration_action", near_simple=False, tokens=100, prompt_tokens=3000)
+
+def test_cheapest_skips_models_missing_targets(router) -> None:
+    tracker = LatencyTracker.get_tracker("cheap")
+    tracker.samples = deque([ 30.0 ] * router.min_samples)
+    assert route(router, False, mode="exploration_action", near_simple=True, tokens=100, prompt_tokens=1000)
+    tracker.samples = deque([ 1.0 ] * router.min_samples)
+    assert not route(router, True, mode="exploration_action", near_simple=True, tokens=100, prompt_tokens=1000)
+    # Too many failed calls
+    for _ in range(router.min_samples):
+        ModelMetrics.record_error("cheap", "actioner")
+    assert route(router, False, mode="exploration_action", near_simple=True, tokens=100, prompt_tokens=1000)
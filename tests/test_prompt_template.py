@@ -0,0 +1,48 @@
+from agents.prompt_template import PromptTemplate
+
+def old_make_prompt(prompt_template: str, args: dict | None = None) -> str:
+    # make_prompt() before templates were parsed
+    exp_prompt = prompt_template
+    if args is not None:
+        for key, value in args.items():
+            exp_prompt = exp_prompt.replace("{" + key + "}", value)
+    return exp_prompt
+
+class WordEncoding:
+
+    name = "words"
+
+    def encode(self, content: str) -> list[str]:
+        return content.split()
+
+def test_render_matches_old_make_prompt_for_game_prompts(engine) -> None:
+    prompts = { **engine.game_prompts, **engine.lobby_prompts }
+    rendered = 0
+    for name, text in prompts.items():
+        if not isinstance(text, str):
+            continue
+        template = PromptTemplate.get(text)
+        args = { slot: f"<{slot} value>" for slot in template.slots }
+        assert template.render(args) == old_make_prompt(text, args), name
+        # Some of the slots left out
+        partial = dict(list(args.items())[:1])
+        assert template.render(partial) == old_make_prompt(text, partial), name
+        rendered += 1
+    assert rendered > 0
+
+def test_render_fills_repeated_slots_and_keeps_unknown_ones() -> None:
+    template = PromptTemplate("{name} meets {other}. {name} waves.")
+    assert template.slots == [ "name", "other", "name" ]
+    assert template.render(name="Lenora") == "Lenora meets {other}. Lenora waves."
+    assert template.render({ "name": "Lenora" }, other="Augustus") == "Lenora meets Augustus. Lenora waves."
+    assert PromptTemplate("No slots { here }").render(name="x") == "No slots { here }"
+    # Values are not searched for slots (the old replace() could expand a slot written in an earlier value)
+    assert template.render(name="{other}", other="Augustus") == "{other} meets Augustus. {other} waves."
+
+def test_templates_are_shared_and_count_tokens_from_the_parts() -> None:
+    text = "Describe {location} to the players in {paras} paragraphs."
+    template = PromptTemplate.get(text)
+    assert PromptTemplate.get(text) is template
+    args = { "location": "the dusty old road", "paras": "two" }
+    rendered = template.render(args)
+    assert template.count_tokens(WordEncoding(), args) == len(rendered.split()) # type: ignore
@@ -0,0 +1,65 @@
+from agents.message_history import MessageHistory
+from agents.token_budget import TokenBudget
+
+def make_msg(content: str, tokens: int, keep: bool = False) -> dict:
+    return { "role": "user", "content": content, "source": "player", "tokens": tokens, "keep": keep }
+
+def test_plan_sends_pinned_and_newest_turns_in_order() -> None:
+    budget = TokenBudget("openai-chatgpt-4-turbo-v1")
+    budget.response_reserve = 0
+    budget.target_fraction = 1.0
+    history = MessageHistory([ make_msg("ready", 5, keep=True),
+                               make_msg("turn 1", 10),
+                               make_msg("summary", 5, keep=True),
+                               make_msg("turn 2", 10),
+                               make_msg("turn 3", 10),
+                               make_msg("turn 4", 10) ])
+    prefix = [ make_msg("prefix", 5) ]
+    instr = [ make_msg("instr", 5) ]
+    # prefix + instr + pinned = 20, leaving room for the two newest turns
+    msgs = budget.plan(45, prefix, history, instr)
+    assert [ msg["content"] for msg in msgs ] == [ "prefix", "ready", "summary", "turn 3", "turn 4", "instr" ]
+    assert budget.planned_tokens == 40
+    assert budget.dropped_tokens == 20
+    # Everything fits
+    msgs = budget.plan(1000, prefix, history, instr)
+    assert [ msg["content"] for msg in msgs ] == [ "prefix", "ready", "turn 1", "summary", "turn 2", "turn 3", "turn 4", "instr" ]
+
+def make_budget(recent_turns: int) -> TokenBudget:
+    budget = TokenBudget("openai-chatgpt-4-turbo-v1")
+    budget.response_reserve = 0
+    budget.target_fraction = 1.0
+    budget.recent_turns = recent_turns
+    budget.parts = { "prefix": 0.2, "state": 0.1, "recent": 0.3, "older": 0.4 }
+    return budget
+
+def make_turns(num_turns: int) -> list[dict]:
+    return [ make_msg(f"turn {index + 1}", 10) for index in range(num_turns) ]
+
+def sent_turns(msgs: list[dict]) -> list[str]:
+    return [ msg["content"] for msg in msgs if msg["content"].startswith("turn") ]
+
+def test_recent_turns_are_capped_by_their_allocation() -> None:
+    budget = make_budget(recent_turns=4)
+    history = MessageHistory(make_turns(6))
+    # Allocations of 100: prefix 20, state 10, recent 30, older 40. The window has room but the recent turns
+    # stop at 30.
+    msgs = budget.plan(100, [ make_msg("prefix", 20) ], history, [ make_msg("instr", 10) ])
+    assert sent_turns(msgs) == [ "turn 4", "turn 5", "turn 6" ]
+
+def test_unused_allocation_is_passed_on() -> None:
+    budget = make_budget(recent_turns=4)
+    history = MessageHistory([ make_msg("summary", 35, keep=True) ] + make_turns(6))
+    # The prefix leaves 15 of its 20 for the recent turns (4 turns fit in 45). The older turns get their 40, less
+    # the pinned summary, plus the 5 the recent turns left.
+    msgs = budget.plan(100, [ make_msg("prefix", 5) ], history, [ make_msg("instr", 10) ])
+    assert msgs[1]["content"] == "summary"
+    assert sent_turns(msgs) == [ "turn 2", "turn 3", "turn 4", "turn 5", "turn 6" ]
+    assert budget.planned_tokens == 100
+
+def test_large_prefix_is_sent_within_the_window() -> None:
+    budget = make_budget(recent_turns=4)
+    history = MessageHistory(make_turns(6))
+    # The prefix is well over its allocation but still sent, the recent turns are then limited by the window
+    msgs = budget.plan(100, [ make_msg("prefix", 75) ], history, [ make_msg("instr", 10) ])
+    assert [ msg["content"] for msg in msgs ] == [ "prefix", "turn 6", "instr" ]
@@ -0,0 +1,37 @@
+from agents.token_cache import TokenCache
+from collections import OrderedDict
+
+class CountingEncoding:
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+
+    def encode(self, content: str) -> list[str]:
+        self.calls += 1
+        return content.split()
+
+def test_counts_are_cached_per_encoding(monkeypatch) -> None:
+    monkeypatch.setattr(TokenCache, "counts", OrderedDict())
+    enc = CountingEncoding("enc-a")
+    other_enc = CountingEncoding("enc-b")
+    assert TokenCache.count_tokens(enc, "one two three") == 3 # type: ignore
+    assert TokenCache.count_tokens(enc, "one two three") == 3 # type: ignore
+    assert enc.calls == 1
+    # Same text, different encoding
+    assert TokenCache.count_tokens(other_enc, "one two three") == 3 # type: ignore
+    assert other_enc.calls == 1
+
+def test_least_recently_used_count_is_evicted(monkeypatch) -> None:
+    monkeypatch.setattr(TokenCache, "counts", OrderedDict())
+    monkeypatch.setattr(TokenCache, "max_entries", 2)
+    enc = CountingEncoding("enc-a")
+    TokenCache.count_tokens(enc, "a") # type: ignore
+    TokenCache.count_tokens(enc, "b") # type: ignore
+    TokenCache.count_tokens(enc, "a") # type: ignore # "b" is now the oldest
+    TokenCache.count_tokens(enc, "c") # type: ignore
+    assert enc.calls == 3
+    TokenCache.count_tokens(enc, "a") # type: ignore
+    assert enc.calls == 3
+    TokenCache.count_tokens(enc, "b") # type: ignore
+    assert enc.calls == 4
@@ -0,0 +1,56 @@
+import asyncio
+
+from agents import tokenizers
+from agents.token_cache import TokenCache
+from agents.tokenizers import Tokenizers
+from collections import OrderedDict
+from config import config_all
+
+class SplitEncoding:
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+
+    def encode(self, content: str) -> list[str]:
+        self.calls += 1
+        return content.split()
+
+def test_encodings_are_loaded_once(monkeypatch) -> None:
+    loaded: list[str] = []
+
+    def encoding_for_model(tokenizer_model: str) -> SplitEncoding:
+        loaded.append(tokenizer_model)
+        return SplitEncoding(tokenizer_model)
+
+    monkeypatch.setattr(Tokenizers, "encodings", {})
+    monkeypatch.setattr(tokenizers.tiktoken, "encoding_for_model", encoding_for_model)
+    token_enc = Tokenizers.get("gpt-4")
+    assert Tokenizers.get("gpt-4") is token_enc
+    assert asyncio.run(Tokenizers.aget("gpt-4")) is token_enc
+    assert asyncio.run(Tokenizers.aget("other")).name == "other"
+    assert loaded == [ "gpt-4", "other" ]
+
+def test_endpoint_tokenizer_models(monkeypatch) -> None:
+    monkeypatch.setitem(config_all["model_endpoints"], "test-endpoint",
+                        { "primary": { "model": "gpt-4-turbo" },
+                          "secondary": { "model": "dolphin-mistral-7b", "tokenizer_model": "custom" } })
+    assert Tokenizers.get_endpoint_models("test-endpoint") == { "gpt-4", "custom" }
+    # Without an override the model_info tokenizer is used
+    monkeypatch.setitem(config_all["model_endpoints"], "test-endpoint",
+                        { "primary": { "model": "dolphin-mistral-7b" } })
+    monkeypatch.setitem(config_all["model_info"]["dolphin-mistral-7b"], "tokenizer_model", "info-model")
+    assert Tokenizers.get_endpoint_models("test-endpoint") == { "info-model" }
+
+def test_large_content_is_counted_in_the_pool_and_cached(monkeypatch) -> None:
+    monkeypatch.setattr(TokenCache, "counts", OrderedDict())
+    monkeypatch.setitem(config_all, "tokenizers", { "offload_chars": 10 })
+    token_enc = SplitEncoding("enc")
+    content = "a long piece of content"
+    assert asyncio.run(Tokenizers.count_tokens(token_enc, content)) == 5 # type: ignore
+    assert asyncio.run(Tokenizers.count_tokens(token_enc, content)) == 5 # type: ignore
+    assert asyncio.run(Tokenizers.count_tokens(token_enc, "short")) == 1 # type: ignore
+    assert token_enc.calls == 2
+    # Same cache as the non-offloaded counts
+    assert TokenCache.count_tokens(token_enc, content) == 5 # type: ignore
+    assert token_enc.calls == 2
@@ -0,0 +1,65 @@
+import json
+import os
+
+from agents.transcript_logger import TranscriptLogger
+
+def make_logger(tmp_path, **settings) -> TranscriptLogger:
+    logger = TranscriptLogger()
+    logger.log_dir = str(tmp_path)
+    logger.flush_interval = 0.05
+    for name, value in settings.items():
+        setattr(logger, name, value)
+    return logger
+
+def read_logs(tmp_path) -> dict[str, str]:
+    logs = {}
+    for name in sorted(os.listdir(tmp_path)):
+        with open(os.path.join(tmp_path, name)) as f:
+            logs[name] = f.read()
+    return logs
+
+def test_records_are_written_by_the_writer_thread(tmp_path) -> None:
+    logger = make_logger(tmp_path, format="jsonl")
+    logger.log("tag-a", "query 1", "response 1", tokens=10)
+    logger.log("tag-a", "query 2", "response 2")
+    logger.log("tag-b", "query 3", "response 3")
+    logger.log_event("routing", { "mode": "actioner", "model": "mock" })
+    logger.stop()
+    logs = read_logs(tmp_path)
+    assert len(logs) == 3
+    tag_a = next(text for name, text in logs.items() if name.startswith("log_tag-a_"))
+    records = [ json.loads(line) for line in tag_a.splitlines() ]
+    assert [ record["query"] for record in records ] == [ "query 1", "query 2" ]
+    assert records[0]["tokens"] == 10
+    routing_name, routing = next((name, text) for name, text in logs.items() if name.startswith("log_routing_"))
+    # Events are always JSONL and only carry the event fields
+    assert routing_name.endswith(".jsonl")
+    event = json.loads(routing)
+    assert event["mode"] == "actioner" and "query" not in event
+
+def test_text_format_indents_query_and_response() -> None:
+    logger = TranscriptLogger()
+    logger.format = "text"
+    text = logger.format_record({ "time": "", "agent_tag": "tag", "query": "line 1\nline 2", "response": "done" })
+    assert text == "USER:\n\n    line 1\n    line 2\n\nASSISTANT:\n\n    done\n\n\n"
+
+def test_file_is_rotated_when_too_large(tmp_path) -> None:
+    logger = make_logger(tmp_path, format="jsonl", max_bytes=1)
+    logger._write("tag", "first\n", True)
+    logger._write("tag", "second\n", True)
+    assert sorted(read_logs(tmp_path).values()) == [ "first\n", "second\n" ]
+
+def test_records_are_dropped_when_queue_is_full(tmp_path) -> None:
+    logger = make_logger(tmp_path)
+    logger._thread = object() # type: ignore # no writer, nothing is taken off the queue
+    logger._queue.maxsize = 2
+    for i in range(4):
+        logger.log("tag", f"query {i}", "response")
+    assert logger._queue.qsize() == 2
+    assert logger.dropped == 2
+
+def test_disabled_logger_writes_nothing(tmp_path) -> None:
+    logger = make_logger(tmp_path, enabled=False)
+    logger.log("tag", "query", "response")
+    assert logger._thread is None
+    assert read_logs(tmp_path) == {}